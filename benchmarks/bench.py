@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+Latency and memory benchmarks for the query and structure-discovery paths.
+
+Generates a synthetic workbook, then measures in-process:
+  - ingestion of the workbook into DuckDB tables
+  - DatabaseClient.query_json on the ingested tables
+  - DatabaseClient.discover_excel_structure (sidecar and live profiling)
+  - the `query` tool with `fileId`/`sheet`, i.e. the sheet rewrite in handle_tool_call
+and over HTTP against a `stream` server started for the run:
+  - POST /upload (new and already stored content)
+  - GET /files/{id}/sheets
+
+Usage:
+    python benchmarks/bench.py --rows 50000 --columns 10 --sheets 3 -o report.json
+    python benchmarks/bench.py -o new.json --compare report.json
+"""
+import os
+import gc
+import sys
+import logging
+import json
+import time
+import shutil
+import asyncio
+import tempfile
+import tracemalloc
+from typing import Callable
+
+import click
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import (  # noqa: E402
+    auth_headers,
+    environment,
+    generate_workbook,
+    peak_rss_bytes,
+    percentiles,
+    running_server,
+    write_report,
+)
+
+
+def measure(name: str, func: Callable[[], object], iterations: int, warmup: int = 1) -> dict:
+    """Time `func` over `iterations` runs, then trace one more run for its peak Python heap"""
+    for _ in range(warmup):
+        func()
+    gc.collect()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+
+    # Tracing slows Python down, so it is kept out of the timed runs
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    result = {
+        "name": name,
+        **percentiles(samples),
+        "peakPythonBytes": peak,
+        "peakRssBytes": peak_rss_bytes(),
+    }
+    click.echo(f"  {name:<40} p50 {result['p50Ms']:>10.2f} ms   p99 {result['p99Ms']:>10.2f} ms", err=True)
+    return result
+
+
+def bench_in_process(workdir: str, workbook: str, iterations: int, with_cache: bool) -> list[dict]:
+    os.environ["EXCEL_FILES_PATH"] = workdir
+    import mcp.types as types
+    from mcp_server_motherduck.server import build_application
+
+    # Per-call INFO logs would dominate the output
+    logging.getLogger("mcp_server_motherduck").setLevel(logging.WARNING)
+
+    app, _, db_client, _ = build_application(
+        ":memory:", result_cache_size=64 * 1024 * 1024 if with_cache else 0
+    )
+    store = db_client.excel_store
+    file_id = "benchmark"
+    shutil.copy(workbook, store.legacy_path(file_id))
+    results = []
+
+    def ingest():
+        # Drop the derived files so every iteration parses the workbook again
+        for path in (store.database_path(file_id), store.metadata_path(file_id)):
+            if os.path.exists(path):
+                os.remove(path)
+        store.ensure_ingested(file_id)
+
+    results.append(measure("ingest", ingest, max(1, iterations // 10), warmup=0))
+
+    table = db_client.excel_table(file_id, "Sheet1")
+    queries = {
+        "query_json/count": f"SELECT COUNT(*) FROM {table}",
+        "query_json/group_by": (
+            f"SELECT category_1, COUNT(*) n, SUM(TRY_CAST(amount_2 AS DOUBLE)) total "
+            f"FROM {table} GROUP BY 1 ORDER BY 2 DESC"
+        ),
+        "query_json/filter": f"SELECT * FROM {table} WHERE category_1 = 'alpha' LIMIT 100",
+        "query_json/max_rows": f"SELECT * FROM {table}",
+    }
+    for name, sql in queries.items():
+        results.append(measure(name, lambda sql=sql: db_client.query_json(sql), iterations))
+    # Truncated results keep a cursor open; close them so they do not skew later runs
+    db_client.result_cursors.sweep()
+
+    results.append(measure(
+        "discover_structure/sidecar",
+        lambda: db_client.discover_excel_structure(file_id, "*", 5),
+        iterations,
+    ))
+    results.append(measure(
+        "discover_structure/live",
+        lambda: db_client.discover_excel_structure(file_id, "*", 50),
+        max(1, iterations // 5),
+    ))
+
+    handler = app.request_handlers[types.CallToolRequest]
+    request = types.CallToolRequest(
+        method="tools/call",
+        params=types.CallToolRequestParams(
+            name="query",
+            arguments={
+                "query": "SELECT category_1, COUNT(*) n FROM Sheet1 GROUP BY 1",
+                "fileId": file_id,
+                "sheet": "Sheet1",
+            },
+        ),
+    )
+    loop = asyncio.new_event_loop()
+    try:
+        results.append(measure(
+            "tool_call/query_sheet_rewrite",
+            lambda: loop.run_until_complete(handler(request)),
+            iterations,
+        ))
+    finally:
+        loop.close()
+    return results
+
+
+def bench_http(workdir: str, workbooks: list[str], iterations: int) -> list[dict]:
+    results = []
+    with running_server(workdir) as (base_url, process):
+        with httpx.Client(base_url=base_url, headers=auth_headers(), timeout=300) as client:
+
+            def upload(path: str) -> str:
+                with open(path, "rb") as f:
+                    response = client.post("/upload", files={"file": (os.path.basename(path), f)})
+                response.raise_for_status()
+                return response.json()["fileId"]
+
+            # Every workbook is new content once; timed individually
+            samples = []
+            for path in workbooks:
+                start = time.perf_counter()
+                file_id = upload(path)
+                samples.append(time.perf_counter() - start)
+            results.append({"name": "http/upload_new", **percentiles(samples)})
+
+            samples = []
+            for _ in range(iterations):
+                start = time.perf_counter()
+                upload(workbooks[0])
+                samples.append(time.perf_counter() - start)
+            results.append({"name": "http/upload_repeat", **percentiles(samples)})
+
+            samples = []
+            for _ in range(iterations):
+                start = time.perf_counter()
+                client.get(f"/files/{file_id}/sheets").raise_for_status()
+                samples.append(time.perf_counter() - start)
+            results.append({"name": "http/list_sheets", **percentiles(samples)})
+
+            server_rss = peak_rss_bytes(process.pid)
+            for result in results:
+                result["serverPeakRssBytes"] = server_rss
+                click.echo(f"  {result['name']:<40} p50 {result['p50Ms']:>10.2f} ms   p99 {result['p99Ms']:>10.2f} ms", err=True)
+    return results
+
+
+def print_comparison(report: dict, baseline: dict) -> None:
+    old = {r["name"]: r for r in baseline.get("results", [])}
+    click.echo(f"\n{'benchmark':<40} {'p50 base':>10} {'p50 new':>10} {'change':>8}", err=True)
+    for result in report["results"]:
+        before = old.get(result["name"])
+        if not before or not before.get("p50Ms"):
+            click.echo(f"{result['name']:<40} {'-':>10} {result['p50Ms']:>10.2f} {'new':>8}", err=True)
+            continue
+        change = (result["p50Ms"] - before["p50Ms"]) / before["p50Ms"] * 100
+        click.echo(
+            f"{result['name']:<40} {before['p50Ms']:>10.2f} {result['p50Ms']:>10.2f} {change:>+7.1f}%",
+            err=True,
+        )
+
+
+@click.command()
+@click.option("--rows", default=20000, help="(Default: `20000`) Data rows per sheet")
+@click.option("--columns", default=8, help="(Default: `8`) Columns per sheet")
+@click.option("--sheets", default=3, help="(Default: `3`) Sheets per workbook")
+@click.option("--iterations", default=50, help="(Default: `50`) Timed runs per benchmark")
+@click.option("--uploads", default=3, help="(Default: `3`) Distinct workbooks uploaded for `http/upload_new`")
+@click.option("--with-cache", is_flag=True, help="Keep the query result cache enabled")
+@click.option("--skip-http", is_flag=True, help="Only run the in-process benchmarks")
+@click.option("--output", "-o", default=None, help="Write the JSON report here instead of stdout")
+@click.option("--compare", default=None, help="Baseline report to compare p50 latencies against")
+def main(rows, columns, sheets, iterations, uploads, with_cache, skip_http, output, compare):
+    """Benchmark query and structure discovery paths and write a JSON report."""
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    workdir = tempfile.mkdtemp(prefix="mcp-bench-")
+    try:
+        click.echo(f"Generating {sheets} sheet(s) of {rows} x {columns}...", err=True)
+        workbooks = [
+            generate_workbook(
+                os.path.join(workdir, f"synthetic_{seed}.xlsx"), rows, columns, sheets, seed=seed
+            )
+            for seed in range(max(uploads, 1))
+        ]
+
+        click.echo("In-process benchmarks:", err=True)
+        in_process_dir = os.path.join(workdir, "in_process")
+        os.makedirs(in_process_dir)
+        results = bench_in_process(in_process_dir, workbooks[0], iterations, with_cache)
+
+        if not skip_http:
+            click.echo("HTTP benchmarks:", err=True)
+            http_dir = os.path.join(workdir, "http")
+            os.makedirs(http_dir)
+            results += bench_http(http_dir, workbooks, iterations)
+
+        report = {
+            "environment": environment(),
+            "parameters": {
+                "rows": rows,
+                "columns": columns,
+                "sheets": sheets,
+                "iterations": iterations,
+                "workbookBytes": os.path.getsize(workbooks[0]),
+                "resultCache": with_cache,
+            },
+            "results": results,
+        }
+        write_report(report, output)
+        if compare:
+            with open(compare) as f:
+                print_comparison(report, json.load(f))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""Helpers shared by the benchmark and load-test scripts."""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import platform
+import subprocess
+import contextlib
+from datetime import date, timedelta
+from typing import Iterator
+
+import httpx
+
+AUTH_TOKEN = "benchmark-token"
+
+PRODUCTS = ["alpha", "bravo", "charlie", "delta", "echo", "foxtrot", "golf"]
+REGIONS = ["norte", "sul", "leste", "oeste", "centro"]
+
+
+def generate_workbook(path: str, rows: int, columns: int, sheets: int, seed: int = 42) -> str:
+    """
+    Write a synthetic workbook with `sheets` sheets of `rows` x `columns`.
+
+    Columns cycle through the types found in real uploads: integer ids,
+    low-cardinality text, decimals, dates and free text, so type inference
+    and profiling do representative work.
+    """
+    import openpyxl
+
+    rng = random.Random(seed)
+    wb = openpyxl.Workbook(write_only=True)
+    start = date(2024, 1, 1)
+    kinds = ["id", "category", "amount", "date", "text"]
+    for s in range(sheets):
+        ws = wb.create_sheet(f"Sheet{s + 1}")
+        header = [f"{kinds[c % len(kinds)]}_{c}" for c in range(columns)]
+        ws.append(header)
+        for r in range(rows):
+            row = []
+            for c in range(columns):
+                kind = kinds[c % len(kinds)]
+                if kind == "id":
+                    row.append(r)
+                elif kind == "category":
+                    row.append(rng.choice(PRODUCTS if c % 2 else REGIONS))
+                elif kind == "amount":
+                    row.append(round(rng.uniform(0, 10_000), 2))
+                elif kind == "date":
+                    row.append(start + timedelta(days=rng.randrange(730)))
+                else:
+                    row.append(f"item {rng.randrange(rows * 10)}")
+            ws.append(row)
+    wb.save(path)
+    return path
+
+
+def percentiles(samples: list[float]) -> dict:
+    """Latency summary in milliseconds"""
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def pick(q: float) -> float:
+        index = min(int(round(q * (len(ordered) - 1))), len(ordered) - 1)
+        return round(ordered[index] * 1000, 3)
+
+    return {
+        "count": len(ordered),
+        "minMs": round(ordered[0] * 1000, 3),
+        "p50Ms": pick(0.50),
+        "p90Ms": pick(0.90),
+        "p99Ms": pick(0.99),
+        "maxMs": round(ordered[-1] * 1000, 3),
+        "meanMs": round(sum(ordered) / len(ordered) * 1000, 3),
+    }
+
+
+def environment() -> dict:
+    """What a report was measured on, so reports can be compared meaningfully"""
+    import duckdb
+
+    commit = None
+    with contextlib.suppress(Exception):
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "duckdb": duckdb.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def peak_rss_bytes(pid: int | None = None) -> int | None:
+    """High-water mark of a process's resident memory (Linux), or None if unknown"""
+    path = f"/proc/{pid or 'self'}/status"
+    try:
+        with open(path) as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if pid is None:
+        import resource
+
+        # ru_maxrss is KiB on Linux and bytes on macOS
+        scale = 1 if sys.platform == "darwin" else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    return None
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextlib.contextmanager
+def running_server(
+    excel_files_path: str, extra_args: list[str] | None = None, port: int | None = None
+) -> Iterator[tuple[str, subprocess.Popen]]:
+    """Start the server with the `stream` transport and yield its base URL"""
+    port = port or free_port()
+    env = dict(
+        os.environ,
+        EXCEL_FILES_PATH=excel_files_path,
+        AUTH_TOKEN=AUTH_TOKEN,
+        PORT=str(port),
+    )
+    log = open(os.path.join(excel_files_path, "server.log"), "w")
+    process = subprocess.Popen(
+        [
+            sys.executable, "-c", "from mcp_server_motherduck import main; main()",
+            "--transport", "stream", "--db-path", ":memory:", *(extra_args or []),
+        ],
+        env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + 60
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f"Server exited early, see {log.name}")
+            with contextlib.suppress(httpx.HTTPError):
+                if httpx.get(f"{base_url}/health", timeout=1).status_code == 200:
+                    break
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"Server did not start, see {log.name}")
+            time.sleep(0.2)
+        yield base_url, process
+    finally:
+        process.terminate()
+        with contextlib.suppress(subprocess.TimeoutExpired):
+            process.wait(timeout=10)
+        if process.poll() is None:
+            process.kill()
+        log.close()
+
+
+def auth_headers() -> dict:
+    return {"Authorization": f"Bearer {AUTH_TOKEN}"}
+
+
+def write_report(report: dict, path: str | None) -> None:
+    text = json.dumps(report, indent=2, default=str)
+    if path:
+        with open(path, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
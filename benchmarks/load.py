@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+"""
+Load generator for the `stream` transport.
+
+Opens N concurrent MCP sessions against the server, each replaying a weighted
+mix of `query` and `discover_structure` tool calls and workbook uploads until
+the run ends, then reports throughput, latency percentiles and error rates,
+both overall and per time window, so the point where a single instance stops
+keeping up is visible.
+
+By default a server is started for the run; pass `--url` to load an already
+running one instead.
+
+Usage:
+    python benchmarks/load.py --sessions 20 --duration 60
+    python benchmarks/load.py --sessions 50 --mix query=80,discover=15,upload=5 -o load.json
+    python benchmarks/load.py --url http://127.0.0.1:8000 --token $AUTH_TOKEN --sessions 10
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import asyncio
+import logging
+import tempfile
+import contextlib
+from dataclasses import dataclass
+
+import click
+import httpx
+from mcp import ClientSession
+from mcp.client.streamable_http import streamablehttp_client
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import (  # noqa: E402
+    AUTH_TOKEN,
+    environment,
+    generate_workbook,
+    peak_rss_bytes,
+    percentiles,
+    running_server,
+    write_report,
+)
+
+OPERATIONS = ("query", "discover", "upload")
+
+# Queries replayed by the `query` operation, run against a sheet of the seed workbook
+QUERIES = [
+    "SELECT COUNT(*) FROM {sheet}",
+    "SELECT category_1, COUNT(*) n, SUM(TRY_CAST(amount_2 AS DOUBLE)) total FROM {sheet} GROUP BY 1 ORDER BY 2 DESC",
+    "SELECT * FROM {sheet} WHERE category_1 = 'alpha' LIMIT 50",
+    "SELECT date_3, AVG(TRY_CAST(amount_2 AS DOUBLE)) FROM {sheet} GROUP BY 1 ORDER BY 1 LIMIT 100",
+]
+
+
+@dataclass
+class Sample:
+    finished: float  # seconds since the start of the run
+    operation: str
+    latency: float
+    error: str | None = None
+
+
+def parse_mix(value: str) -> dict[str, float]:
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise click.BadParameter(f"Unknown operation '{name}', expected one of {', '.join(OPERATIONS)}")
+        try:
+            mix[name] = float(weight)
+        except ValueError:
+            raise click.BadParameter(f"Invalid weight for '{name}': {weight!r}")
+    if not any(weight > 0 for weight in mix.values()):
+        raise click.BadParameter("At least one operation needs a positive weight")
+    return mix
+
+
+def tool_error(result) -> str | None:
+    """Classify a tool result; the server reports failures as JSON with `success: false`"""
+    if result.isError:
+        return "tool_error"
+    text = result.content[0].text if result.content else ""
+    try:
+        payload = json.loads(text)
+    except ValueError:
+        return None
+    if not isinstance(payload, dict) or payload.get("success", True):
+        return None
+    if payload.get("timedOut"):
+        return "timeout"
+    if "retryAfter" in payload:
+        return "busy"
+    return "tool_error"
+
+
+class LoadRun:
+    def __init__(
+        self,
+        base_url: str,
+        token: str,
+        file_id: str,
+        sheets: list[str],
+        upload_files: list[str],
+        mix: dict[str, float],
+        think_time: float,
+        request_timeout: float,
+    ):
+        self.base_url = base_url
+        self.headers = {"Authorization": f"Bearer {token}"}
+        self.file_id = file_id
+        self.sheets = sheets
+        self.upload_files = upload_files
+        self.operations = [name for name in mix if mix[name] > 0]
+        self.weights = [mix[name] for name in self.operations]
+        self.think_time = think_time
+        self.request_timeout = request_timeout
+        self.samples: list[Sample] = []
+        self.session_errors: list[str] = []
+        self.active_sessions = 0
+        self.started = 0.0
+
+    async def _call_tool(self, session: ClientSession, name: str, arguments: dict) -> str | None:
+        result = await asyncio.wait_for(session.call_tool(name, arguments), self.request_timeout)
+        return tool_error(result)
+
+    async def _upload(self, client: httpx.AsyncClient, rng: random.Random) -> str | None:
+        path = rng.choice(self.upload_files)
+        with open(path, "rb") as f:
+            content = f.read()
+        response = await client.post(
+            "/upload", files={"file": (os.path.basename(path), content)}, timeout=self.request_timeout
+        )
+        if response.status_code != 200:
+            return f"http_{response.status_code}"
+        return None
+
+    async def _operation(self, name: str, session, client, rng: random.Random) -> str | None:
+        sheet = rng.choice(self.sheets)
+        if name == "query":
+            query = rng.choice(QUERIES).format(sheet=sheet)
+            return await self._call_tool(
+                session, "query", {"query": query, "fileId": self.file_id, "sheet": sheet}
+            )
+        if name == "discover":
+            return await self._call_tool(
+                session, "discover_structure", {"fileId": self.file_id, "sheet": sheet, "sampleRows": 5}
+            )
+        return await self._upload(client, rng)
+
+    async def session(self, index: int, start_delay: float, stop_at: float) -> None:
+        rng = random.Random(index)
+        await asyncio.sleep(start_delay)
+        try:
+            async with httpx.AsyncClient(base_url=self.base_url, headers=self.headers) as client:
+                async with streamablehttp_client(
+                    f"{self.base_url}/mcp/", headers=self.headers, timeout=self.request_timeout
+                ) as (read, write, _):
+                    async with ClientSession(read, write) as session:
+                        await session.initialize()
+                        self.active_sessions += 1
+                        try:
+                            while time.monotonic() < stop_at:
+                                name = rng.choices(self.operations, self.weights)[0]
+                                start = time.monotonic()
+                                try:
+                                    error = await self._operation(name, session, client, rng)
+                                except asyncio.TimeoutError:
+                                    error = "client_timeout"
+                                except Exception as e:
+                                    error = type(e).__name__
+                                end = time.monotonic()
+                                self.samples.append(Sample(end - self.started, name, end - start, error))
+                                if self.think_time:
+                                    await asyncio.sleep(rng.uniform(0, 2 * self.think_time))
+                        finally:
+                            self.active_sessions -= 1
+        except Exception as e:
+            self.session_errors.append(f"session {index}: {type(e).__name__}: {e}")
+
+    async def run(self, sessions: int, duration: float, ramp_up: float, window: float) -> None:
+        self.started = time.monotonic()
+        stop_at = self.started + duration
+        tasks = [
+            asyncio.create_task(self.session(i, ramp_up * i / max(sessions, 1), stop_at))
+            for i in range(sessions)
+        ]
+        reporter = asyncio.create_task(self._report_windows(window))
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            reporter.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await reporter
+
+    async def _report_windows(self, window: float) -> None:
+        """Print each window's numbers as it closes, so a run can be watched live"""
+        click.echo(
+            f"{'window':>8} {'sessions':>8} {'req/s':>8} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7}", err=True
+        )
+        index = 0
+        while True:
+            index += 1
+            await asyncio.sleep(self.started + index * window - time.monotonic())
+            summary = summarize_window(self.samples, (index - 1) * window, index * window)
+            click.echo(
+                f"{index * window:>7.0f}s {self.active_sessions:>8} {summary['throughput']:>8.1f} "
+                f"{summary.get('p50Ms', 0):>9.1f} {summary.get('p99Ms', 0):>9.1f} "
+                f"{summary['errorRate'] * 100:>6.1f}%",
+                err=True,
+            )
+
+
+def summarize(samples: list[Sample], elapsed: float) -> dict:
+    errors: dict[str, int] = {}
+    for sample in samples:
+        if sample.error:
+            errors[sample.error] = errors.get(sample.error, 0) + 1
+    failed = sum(errors.values())
+    return {
+        "requests": len(samples),
+        "throughput": round(len(samples) / elapsed, 2) if elapsed > 0 else 0,
+        "errorRate": round(failed / len(samples), 4) if samples else 0,
+        "errors": errors,
+        **percentiles([s.latency for s in samples if not s.error]),
+    }
+
+
+def summarize_window(samples: list[Sample], start: float, end: float) -> dict:
+    in_window = [s for s in samples if start <= s.finished < end]
+    return {"start": round(start, 3), "end": round(end, 3), **summarize(in_window, end - start)}
+
+
+async def prepare(base_url: str, token: str, workbook: str) -> tuple[str, list[str]]:
+    """Upload the workbook queried by the run and list its sheets"""
+    headers = {"Authorization": f"Bearer {token}"}
+    async with httpx.AsyncClient(base_url=base_url, headers=headers, timeout=300) as client:
+        with open(workbook, "rb") as f:
+            response = await client.post("/upload", files={"file": (os.path.basename(workbook), f)})
+        response.raise_for_status()
+        file_id = response.json()["fileId"]
+        response = await client.get(f"/files/{file_id}/sheets")
+        response.raise_for_status()
+        sheets = [sheet["name"] for sheet in response.json()["sheets"]]
+    return file_id, sheets
+
+
+@click.command()
+@click.option("--url", default=None, help="Load an already running server instead of starting one")
+@click.option("--token", default=AUTH_TOKEN, help="Bearer token for `--url` (Default: the benchmark token)")
+@click.option("--sessions", default=10, help="(Default: `10`) Concurrent MCP sessions")
+@click.option("--duration", default=30.0, help="(Default: `30`) Seconds to run for")
+@click.option("--ramp-up", default=0.0, help="(Default: `0`) Seconds over which sessions are started")
+@click.option(
+    "--mix",
+    default="query=70,discover=25,upload=5",
+    help="(Default: `query=70,discover=25,upload=5`) Relative weights of the operations",
+)
+@click.option("--think-time", default=0.0, help="(Default: `0`) Mean pause in seconds between a session's requests")
+@click.option("--window", default=5.0, help="(Default: `5`) Seconds per time window in the report")
+@click.option("--request-timeout", default=120.0, help="(Default: `120`) Client-side timeout per request")
+@click.option("--rows", default=20000, help="(Default: `20000`) Data rows per sheet of the queried workbook")
+@click.option("--columns", default=8, help="(Default: `8`) Columns per sheet")
+@click.option("--sheets", default=2, help="(Default: `2`) Sheets per workbook")
+@click.option(
+    "--upload-files",
+    default=4,
+    help="(Default: `4`) Distinct workbooks uploads pick from; repeats are deduplicated by the server",
+)
+@click.option("--server-arg", multiple=True, help="Extra argument for the started server, e.g. `--server-arg=--max-concurrent-queries=8`")
+@click.option("--output", "-o", default=None, help="Write the JSON report here instead of stdout")
+def main(
+    url, token, sessions, duration, ramp_up, mix, think_time, window, request_timeout,
+    rows, columns, sheets, upload_files, server_arg, output,
+):
+    """Replay concurrent MCP sessions against the stream transport and report how it holds up."""
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    weights = parse_mix(mix)
+    workdir = tempfile.mkdtemp(prefix="mcp-load-")
+    try:
+        click.echo(f"Generating workbooks ({sheets} sheet(s) of {rows} x {columns})...", err=True)
+        workbook = generate_workbook(os.path.join(workdir, "queried.xlsx"), rows, columns, sheets)
+        uploads = [
+            generate_workbook(
+                os.path.join(workdir, f"upload_{seed}.xlsx"), max(rows // 10, 100), columns, 1, seed=seed
+            )
+            for seed in range(max(upload_files, 1))
+        ]
+
+        with contextlib.ExitStack() as stack:
+            process = None
+            if url is None:
+                server_dir = os.path.join(workdir, "server")
+                os.makedirs(server_dir)
+                url, process = stack.enter_context(running_server(server_dir, list(server_arg)))
+                token = AUTH_TOKEN
+            url = url.rstrip("/")
+
+            file_id, sheet_names = asyncio.run(prepare(url, token, workbook))
+            load = LoadRun(url, token, file_id, sheet_names, uploads, weights, think_time, request_timeout)
+            click.echo(f"Running {sessions} session(s) for {duration:g}s against {url}", err=True)
+            asyncio.run(load.run(sessions, duration, ramp_up, window))
+            elapsed = time.monotonic() - load.started
+
+            samples = sorted(load.samples, key=lambda s: s.finished)
+            windows = []
+            start = 0.0
+            while start < elapsed:
+                windows.append(summarize_window(samples, start, min(start + window, elapsed)))
+                start += window
+
+            report = {
+                "environment": environment(),
+                "parameters": {
+                    "url": url,
+                    "sessions": sessions,
+                    "duration": duration,
+                    "rampUp": ramp_up,
+                    "mix": weights,
+                    "thinkTime": think_time,
+                    "rows": rows,
+                    "columns": columns,
+                    "sheets": sheets,
+                    "serverArgs": list(server_arg),
+                },
+                "overall": summarize(samples, elapsed),
+                "operations": {
+                    name: summarize([s for s in samples if s.operation == name], elapsed)
+                    for name in weights
+                },
+                "windows": windows,
+                "sessionErrors": load.session_errors,
+                "serverPeakRssBytes": peak_rss_bytes(process.pid) if process else None,
+            }
+
+        overall = report["overall"]
+        click.echo(
+            f"\n{overall['requests']} requests, {overall['throughput']:.1f} req/s, "
+            f"p50 {overall.get('p50Ms', 0):.1f} ms, p99 {overall.get('p99Ms', 0):.1f} ms, "
+            f"errors {overall['errorRate'] * 100:.1f}%",
+            err=True,
+        )
+        for name, summary in report["operations"].items():
+            click.echo(
+                f"  {name:<10} {summary['requests']:>7} req  p50 {summary.get('p50Ms', 0):>9.1f} ms  "
+                f"p99 {summary.get('p99Ms', 0):>9.1f} ms  errors {summary['errorRate'] * 100:>5.1f}%",
+                err=True,
+            )
+        if load.session_errors:
+            click.echo(f"{len(load.session_errors)} session(s) failed, e.g. {load.session_errors[0]}", err=True)
+        write_report(report, output)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Checks and measures the S3 block cache against a local S3-compatible stand-in.
+
+Starts moto's S3 server for the run, or uses `--endpoint` (e.g. a MinIO
+container), uploads a DuckDB database generated for the run, then in-process:
+  - reads it through S3BlockCacheProxy cold and warm, checking every byte
+  - checks hit/miss accounting, the size bound, that blocks survive a
+    restart, that a rewritten object is read afresh and that objects other
+    than the database and its WAL are refused
+  - attaches it with DatabaseClient and `--s3-cache-directory` and queries
+    it through DuckDB's httpfs, when that extension is installed
+Writes a JSON report and exits non-zero if any check fails.
+
+Usage:
+    pip install "moto[server]"
+    python benchmarks/s3_cache.py --rows 200000 -o s3_cache.json
+    python benchmarks/s3_cache.py --endpoint http://127.0.0.1:9000 --bucket test
+"""
+import os
+import sys
+import time
+import random
+import shutil
+import logging
+import tempfile
+import http.client
+
+import click
+import duckdb
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from common import environment, free_port, percentiles, write_report  # noqa: E402
+from mcp_server_motherduck import s3_cache  # noqa: E402
+from mcp_server_motherduck.s3_cache import BLOCK_SIZE, S3BlockCacheProxy  # noqa: E402
+
+# Bytes per timed read, DuckDB's storage block size
+READ_SIZE = 256 * 1024
+
+QUERY = "SELECT category, count(*) AS n, sum(amount) AS total FROM events GROUP BY 1 ORDER BY 1"
+
+
+class Checks:
+    def __init__(self):
+        self.results: list[dict] = []
+
+    def check(self, name: str, ok: bool, detail=None) -> None:
+        self.results.append({"check": name, "ok": bool(ok), **({"detail": detail} if detail is not None else {})})
+        click.echo(f"  {'ok  ' if ok else 'FAIL'} {name}" + (f" ({detail})" if detail is not None else ""), err=True)
+
+    @property
+    def failed(self) -> int:
+        return sum(not r["ok"] for r in self.results)
+
+
+def start_stand_in() -> tuple[str, object]:
+    try:
+        from moto.server import ThreadedMotoServer
+    except ImportError:
+        raise click.ClickException('moto is not installed: pip install "moto[server]", or pass --endpoint')
+    port = free_port()
+    server = ThreadedMotoServer(ip_address="127.0.0.1", port=port, verbose=False)
+    server.start()
+    return f"http://127.0.0.1:{port}", server
+
+
+def build_database(path: str, rows: int) -> None:
+    conn = duckdb.connect(path)
+    conn.execute(
+        "CREATE TABLE events AS SELECT range AS id, range % 97 AS category, "
+        "(range % 1000) / 10 AS amount, 'event ' || range AS label FROM range(?)",
+        [rows],
+    )
+    conn.execute("CREATE TABLE categories AS SELECT range AS category, 'cat ' || range AS name FROM range(97)")
+    conn.close()
+
+
+def get(endpoint: str, path: str, start: int | None = None, end: int | None = None) -> tuple[int, bytes]:
+    conn = http.client.HTTPConnection(endpoint, timeout=60)
+    try:
+        headers = {"Range": f"bytes={start}-{end}"} if start is not None else {}
+        conn.request("GET", path, headers=headers)
+        response = conn.getresponse()
+        return response.status, response.read()
+    finally:
+        conn.close()
+
+
+def timed_reads(endpoint: str, path: str, data: bytes, offsets: list[int], checks: Checks, name: str) -> list[float]:
+    samples = []
+    correct = True
+    for offset in offsets:
+        end = min(offset + READ_SIZE, len(data)) - 1
+        started = time.perf_counter()
+        status, body = get(endpoint, path, offset, end)
+        samples.append(time.perf_counter() - started)
+        correct = correct and status == 206 and body == data[offset:end + 1]
+    checks.check(f"{name} reads return the object's bytes", correct)
+    return samples
+
+
+def check_proxy(workdir: str, s3, bucket: str, key: str, data: bytes, reads: int, checks: Checks) -> dict:
+    db_url = f"s3://{bucket}/{key}"
+    path = f"/{bucket}/{key}"
+    rng = random.Random(42)
+    offsets = [rng.randrange(0, len(data), READ_SIZE // 4) for _ in range(reads)]
+    blocks = -(-len(data) // BLOCK_SIZE)
+
+    cache_dir = os.path.join(workdir, "cache")
+    proxy = S3BlockCacheProxy(cache_dir, 2 * len(data) + BLOCK_SIZE, db_url)
+    endpoint = proxy.start()
+    cold = timed_reads(endpoint, path, data, offsets, checks, "cold")
+    cold_misses = proxy.cache.misses
+    warm = timed_reads(endpoint, path, data, offsets, checks, "warm")
+    checks.check("warm reads are all hits", proxy.cache.misses == cold_misses, f"{proxy.cache.misses - cold_misses} misses")
+    status, body = get(endpoint, path)
+    checks.check("full read returns the object", status == 200 and body == data)
+    checks.check("every block fetched from S3 once", proxy.cache.misses == blocks, f"{proxy.cache.misses} misses for {blocks} blocks")
+    fetched = proxy.origin.bytes_fetched
+    checks.check("S3 bytes fetched equal the object size", fetched == len(data), fetched)
+
+    requests = proxy.origin.requests
+    refused = [
+        get(endpoint, f"/{bucket}/{key}.other", 0, 10)[0],
+        get(endpoint, f"/{bucket}")[0],
+        get(endpoint, f"/{bucket}-other/{key}", 0, 10)[0],
+    ]
+    checks.check("other objects are refused", refused == [403] * 3 and proxy.origin.requests == requests, refused)
+    proxy.close()
+
+    restarted = S3BlockCacheProxy(cache_dir, 2 * len(data) + BLOCK_SIZE, db_url)
+    endpoint = restarted.start()
+    timed_reads(endpoint, path, data, offsets, checks, "restarted")
+    checks.check(
+        "blocks survive a restart",
+        restarted.cache.misses == 0 and restarted.origin.bytes_fetched == 0,
+        f"{restarted.cache.misses} misses",
+    )
+
+    # The WAL is served too; rewriting it must not return the old blocks
+    wal_path = f"{path}.wal"
+    s3.put_object(Bucket=bucket, Key=f"{key}.wal", Body=b"a" * 1000)
+    first = get(endpoint, wal_path, 0, 999)[1]
+    s3.put_object(Bucket=bucket, Key=f"{key}.wal", Body=b"b" * 1000)
+    ttl, s3_cache.METADATA_TTL = s3_cache.METADATA_TTL, 0.0
+    try:
+        second = get(endpoint, wal_path, 0, 999)[1]
+    finally:
+        s3_cache.METADATA_TTL = ttl
+    checks.check("a rewritten object is read afresh", first == b"a" * 1000 and second == b"b" * 1000)
+    s3.delete_object(Bucket=bucket, Key=f"{key}.wal")
+    restarted.close()
+
+    bounded = S3BlockCacheProxy(os.path.join(workdir, "bounded"), len(data) // 2, db_url)
+    endpoint = bounded.start()
+    status, body = get(endpoint, path)
+    checks.check(
+        "cache stays within its size",
+        body == data and bounded.cache.size_bytes <= len(data) // 2 and bounded.cache.evictions > 0,
+        f"{bounded.cache.size_bytes} bytes, {bounded.cache.evictions} evictions",
+    )
+    bounded.close()
+
+    return {
+        "objectBytes": len(data),
+        "blocks": blocks,
+        "coldReads": percentiles(cold),
+        "warmReads": percentiles(warm),
+    }
+
+
+def check_duckdb(workdir: str, bucket: str, key: str, rows: int, checks: Checks) -> dict:
+    try:
+        duckdb.connect().execute("LOAD httpfs")
+    except Exception as e:
+        click.echo(f"  skip DuckDB attach: {str(e).splitlines()[0]}", err=True)
+        return {"skipped": "httpfs extension is not installed"}
+
+    from mcp_server_motherduck.database import DatabaseClient
+
+    client = DatabaseClient(
+        db_path=f"s3://{bucket}/{key}",
+        result_cache_size=0,
+        s3_cache_directory=os.path.join(workdir, "attach"),
+        s3_cache_prefetch=True,
+    )
+    blocks = client.s3_cache.cache
+    timings = []
+    responses = []
+    for _ in range(2):
+        started = time.perf_counter()
+        responses.append(client.query_json(QUERY))
+        timings.append(time.perf_counter() - started)
+    first, second = responses
+    checks.check("query through the cache succeeds", first["success"], first.get("error"))
+    checks.check(
+        "query returns every row",
+        first["success"] and sum(row["n"] for row in first["data"]) == rows and first["data"] == second["data"],
+    )
+    checks.check("DuckDB reads hit the cache", blocks.hits > 0, f"{blocks.hits} hits, {blocks.misses} misses")
+    client.s3_cache.close()
+    return {
+        "firstQueryMs": round(timings[0] * 1000, 3),
+        "secondQueryMs": round(timings[1] * 1000, 3),
+        "hits": blocks.hits,
+        "misses": blocks.misses,
+    }
+
+
+@click.command()
+@click.option("--endpoint", default=None, help="S3-compatible server to use instead of starting moto, e.g. `http://127.0.0.1:9000`")
+@click.option("--bucket", default="mcp-s3-cache", help="(Default: `mcp-s3-cache`) Bucket the test database is uploaded to; created if missing")
+@click.option("--rows", default=200000, help="(Default: `200000`) Rows of the generated database")
+@click.option("--reads", default=50, help="(Default: `50`) Timed ranged reads per pass")
+@click.option("--output", "-o", default=None, help="Write the JSON report here instead of stdout")
+def main(endpoint, bucket, rows, reads, output):
+    """Check the S3 block cache against a local S3 stand-in and write a JSON report."""
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    # The stand-in accepts any credentials; real ones are only needed for --endpoint
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+    server = None
+    if endpoint is None:
+        endpoint, server = start_stand_in()
+    os.environ["AWS_ENDPOINT_URL"] = endpoint
+    import boto3  # installed with moto
+
+    workdir = tempfile.mkdtemp(prefix="mcp-s3-cache-")
+    checks = Checks()
+    try:
+        s3 = boto3.client("s3", endpoint_url=endpoint)
+        if bucket not in {b["Name"] for b in s3.list_buckets()["Buckets"]}:
+            s3.create_bucket(Bucket=bucket)
+        key = f"bench/{rows}.duckdb"
+        db_path = os.path.join(workdir, "source.duckdb")
+        click.echo(f"Uploading a {rows}-row database to {endpoint}/{bucket}/{key}...", err=True)
+        build_database(db_path, rows)
+        with open(db_path, "rb") as f:
+            data = f.read()
+        s3.put_object(Bucket=bucket, Key=key, Body=data)
+
+        click.echo("Block cache:", err=True)
+        results = {"proxy": check_proxy(workdir, s3, bucket, key, data, reads, checks)}
+        click.echo("DuckDB attach:", err=True)
+        results["duckdb"] = check_duckdb(workdir, bucket, key, rows, checks)
+
+        write_report(
+            {
+                "environment": environment(),
+                "parameters": {"endpoint": endpoint, "rows": rows, "reads": reads},
+                "results": results,
+                "checks": checks.results,
+            },
+            output,
+        )
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+        if server is not None:
+            server.stop()
+    if checks.failed:
+        raise click.ClickException(f"{checks.failed} check(s) failed")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,32 @@
-import anyio
 import logging
 import click
-from .server import build_application
-from .configs import SERVER_VERSION, SERVER_LOCALHOST, UVICORN_LOGGING_CONFIG
+from . import startup
+from .configs import (
+    SERVER_VERSION,
+    SERVER_LOCALHOST,
+    UVICORN_LOGGING_CONFIG,
+    DEFAULT_MAX_ROWS,
+    DEFAULT_CURSOR_TTL,
+    DEFAULT_MAX_OPEN_CURSORS,
+    DEFAULT_RESULT_CACHE_SIZE,
+    DEFAULT_QUERY_TIMEOUT,
+    DEFAULT_S3_CACHE_SIZE,
+)
 
 __version__ = SERVER_VERSION
 
+# Modules each transport imports when it starts, loaded up front by `--profile-startup`
+TRANSPORT_MODULES = {
+    "stdio": ("mcp.server.stdio",),
+    "sse": ("mcp.server.sse", "starlette.applications", "uvicorn"),
+    "stream": (
+        "mcp.server.streamable_http_manager",
+        "starlette.applications",
+        "uvicorn",
+        "mcp_server_motherduck.auth",
+    ),
+}
+
 logger = logging.getLogger("mcp_server_motherduck")
 logging.basicConfig(
     level=logging.INFO, format="[motherduck] %(levelname)s - %(message)s"
@@ -43,7 +64,113 @@ logging.basicConfig(
 @click.option(
     "--read-only",
     is_flag=True,
-    help="Flag for connecting to DuckDB in read-only mode. Only supported for local DuckDB databases. Also makes use of short lived connections so multiple MCP clients or other systems can remain active (though each operation must be done sequentially).",
+    help="Flag for connecting to DuckDB in read-only mode. Only supported for local DuckDB databases. Also makes use of pooled connections that are released when idle so multiple MCP clients or other systems can remain active (though each operation must be done sequentially).",
+)
+@click.option(
+    "--pool-size",
+    default=4,
+    type=click.IntRange(min=1),
+    help="(Default: `4`) Maximum number of idle read-only connections kept open for reuse. Only used with `--read-only` on local DuckDB databases.",
+)
+@click.option(
+    "--pool-idle-timeout",
+    default=5.0,
+    type=click.FloatRange(min=0),
+    help="(Default: `5`) Seconds before an idle read-only connection is closed, releasing the file lock for other writers.",
+)
+@click.option(
+    "--max-rows",
+    default=DEFAULT_MAX_ROWS,
+    type=click.IntRange(min=1),
+    help=f"(Default: `{DEFAULT_MAX_ROWS}`) Maximum number of rows returned by a query. Rows are fetched incrementally and never materialized beyond this cap.",
+)
+@click.option(
+    "--cursor-ttl",
+    default=DEFAULT_CURSOR_TTL,
+    type=click.FloatRange(min=0),
+    help=f"(Default: `{DEFAULT_CURSOR_TTL:g}`) Seconds a truncated result stays open for `fetch_more` after its last page was read",
+)
+@click.option(
+    "--max-open-cursors",
+    default=DEFAULT_MAX_OPEN_CURSORS,
+    type=click.IntRange(min=0),
+    help=f"(Default: `{DEFAULT_MAX_OPEN_CURSORS}`) Maximum number of truncated results kept open; the least recently used one is closed first",
+)
+@click.option(
+    "--result-cache-mb",
+    default=DEFAULT_RESULT_CACHE_SIZE // (1024 * 1024),
+    type=click.IntRange(min=0),
+    help=f"(Default: `{DEFAULT_RESULT_CACHE_SIZE // (1024 * 1024)}`) Memory budget in MB for cached query results. Only deterministic reads on local DuckDB databases and files are cached. `0` disables the cache.",
+)
+@click.option(
+    "--query-timeout",
+    default=DEFAULT_QUERY_TIMEOUT,
+    type=click.FloatRange(min=0),
+    help=f"(Default: `{DEFAULT_QUERY_TIMEOUT:g}`) Seconds a query, fetch_more page or discover_structure sheet profile may run before it is interrupted. Clients can ask for a shorter timeout per call. `0` disables the timeout.",
+)
+@click.option(
+    "--extension-directory",
+    default=None,
+    help="(Default: `~/.duckdb/extensions`) Directory DuckDB extensions are installed to and loaded from. Point it at extensions bundled at build time to avoid downloads on startup.",
+)
+@click.option(
+    "--offline-extensions",
+    is_flag=True,
+    help="Never download DuckDB extensions. Startup fails right away if a required extension is missing from the extension directory.",
+)
+@click.option(
+    "--install-extensions",
+    is_flag=True,
+    help="Install the DuckDB extensions the server uses (`excel`, `httpfs`, `motherduck`) into the extension directory and exit. Run at image build time to bundle them.",
+)
+@click.option(
+    "--memory-limit",
+    default=None,
+    help="(Default: DuckDB's 80% of RAM) Memory limit of the DuckDB database, e.g. `4GB`. Shared by all sessions; larger operations spill to the temp directory.",
+)
+@click.option(
+    "--threads",
+    default=None,
+    type=click.IntRange(min=1),
+    help="(Default: number of CPU cores) Threads DuckDB uses to execute queries",
+)
+@click.option(
+    "--temp-directory",
+    default=None,
+    help="(Default: DuckDB's `<database>.tmp`) Directory DuckDB spills to when an operation exceeds the memory limit",
+)
+@click.option(
+    "--s3-cache-directory",
+    default=None,
+    help="(Default: disabled) Directory of an on-disk block cache for S3 databases. Blocks read from the database file are kept there across restarts, so repeated queries read them from local disk instead of S3.",
+)
+@click.option(
+    "--s3-cache-mb",
+    default=DEFAULT_S3_CACHE_SIZE // (1024 * 1024),
+    type=click.IntRange(min=1),
+    help=f"(Default: `{DEFAULT_S3_CACHE_SIZE // (1024 * 1024)}`) Disk budget in MB of the S3 block cache. The least recently used blocks are evicted first.",
+)
+@click.option(
+    "--s3-cache-prefetch",
+    is_flag=True,
+    help="Load the storage metadata of every table of the S3 database through the block cache at startup, so first queries skip those round trips",
+)
+@click.option(
+    "--max-concurrent-queries",
+    default=4,
+    type=click.IntRange(min=1),
+    help="(Default: `4`) Maximum number of queries executed in parallel, each on its own DuckDB cursor",
+)
+@click.option(
+    "--max-queued-queries",
+    default=32,
+    type=click.IntRange(min=0),
+    help="(Default: `32`) Maximum number of queries waiting for a free worker before new ones are rejected",
+)
+@click.option(
+    "--profile-startup",
+    is_flag=True,
+    help="Report import and initialization timings per startup phase, then exit without serving",
 )
 @click.option(
     "--json-response",
@@ -59,20 +186,90 @@ def main(
     home_dir,
     saas_mode,
     read_only,
+    pool_size,
+    pool_idle_timeout,
+    max_rows,
+    cursor_ttl,
+    max_open_cursors,
+    result_cache_mb,
+    query_timeout,
+    extension_directory,
+    offline_extensions,
+    install_extensions,
+    memory_limit,
+    threads,
+    temp_directory,
+    s3_cache_directory,
+    s3_cache_mb,
+    s3_cache_prefetch,
+    max_concurrent_queries,
+    max_queued_queries,
+    profile_startup,
     json_response,
 ):
     """Main entry point for the package."""
 
     logger.info("🦆 MotherDuck MCP Server v" + SERVER_VERSION)
+
+    if install_extensions:
+        from .extensions import BUNDLED_EXTENSIONS, ExtensionLoader
+
+        ExtensionLoader(extension_directory).prepare(BUNDLED_EXTENSIONS)
+        logger.info(
+            f"✅ Extensions {', '.join(BUNDLED_EXTENSIONS)} ready in {extension_directory or '~/.duckdb/extensions'}"
+        )
+        return
+
     logger.info("Ready to execute SQL queries via DuckDB/MotherDuck")
 
-    app, init_opts = build_application(
-        db_path=db_path,
-        motherduck_token=motherduck_token,
-        home_dir=home_dir,
-        saas_mode=saas_mode,
-        read_only=read_only,
-    )
+    # Heavy modules are only imported once the command line is parsed, so
+    # `--help` and `--install-extensions` stay fast
+    with startup.phase("import modules"):
+        with startup.phase("duckdb"):
+            import duckdb  # noqa: F401
+        with startup.phase("mcp"):
+            import mcp.server  # noqa: F401
+        with startup.phase("server"):
+            from .server import build_application
+            from .extensions import MissingExtensionError
+
+    try:
+        with startup.phase("build application"):
+            app, init_opts, db_client, executor = build_application(
+                db_path=db_path,
+                motherduck_token=motherduck_token,
+                home_dir=home_dir,
+                saas_mode=saas_mode,
+                read_only=read_only,
+                pool_size=pool_size,
+                pool_idle_timeout=pool_idle_timeout,
+                max_rows=max_rows,
+                cursor_ttl=cursor_ttl,
+                max_open_cursors=max_open_cursors,
+                result_cache_size=result_cache_mb * 1024 * 1024,
+                query_timeout=query_timeout,
+                extension_directory=extension_directory,
+                offline_extensions=offline_extensions,
+                memory_limit=memory_limit,
+                threads=threads,
+                temp_directory=temp_directory,
+                s3_cache_directory=s3_cache_directory,
+                s3_cache_size=s3_cache_mb * 1024 * 1024,
+                s3_cache_prefetch=s3_cache_prefetch,
+                max_concurrent_queries=max_concurrent_queries,
+                max_queued_queries=max_queued_queries,
+            )
+    except MissingExtensionError as e:
+        raise click.ClickException(str(e))
+
+    if profile_startup:
+        import importlib
+
+        with startup.phase(f"import {transport} transport"):
+            for module in TRANSPORT_MODULES[transport]:
+                importlib.import_module(module)
+        click.echo(startup.report(), err=True)
+        return
 
     if transport == "sse":
         from mcp.server.sse import SseServerTransport
@@ -113,18 +310,22 @@ def main(
         )
 
     elif transport == "stream":
+        import anyio
         from mcp.server.streamable_http_manager import StreamableHTTPSessionManager
         from collections.abc import AsyncIterator
         from starlette.applications import Starlette
         from starlette.routing import Mount, Route
         from starlette.types import Receive, Scope, Send
-        from starlette.responses import JSONResponse, FileResponse
-        from fastapi import UploadFile, File, HTTPException
+        from starlette.requests import Request
+        from starlette.responses import JSONResponse, FileResponse, PlainTextResponse
+        from starlette.exceptions import HTTPException
         import contextlib
         import os
-        import uuid
         import json
         from .auth import AuthMiddleware, setup_cors, get_auth_token, get_allowed_origins
+        from .excel_store import UploadWriter, UploadTooLargeError, UPLOAD_CHUNK_SIZE
+        from .metrics import REGISTRY, UPLOAD_BYTES, UPLOAD_DURATION
+        import time
 
         logger.info("MCP server initialized in \033[32mhttp-streamable\033[0m mode")
 
@@ -160,62 +361,127 @@ def main(
                 "version": SERVER_VERSION
             })
 
+        # Room for multipart boundaries and part headers on top of the file itself
+        multipart_overhead = 64 * 1024
+
+        def limit_receive(receive: Receive, max_body: int) -> Receive:
+            """Reject a request body as soon as it grows past `max_body` bytes"""
+            received = 0
+
+            async def limited_receive():
+                nonlocal received
+                message = await receive()
+                if message["type"] == "http.request":
+                    received += len(message.get("body", b""))
+                    if received > max_body:
+                        raise HTTPException(
+                            status_code=413,
+                            detail=f"File size exceeds {(max_body - multipart_overhead) // (1024*1024)}MB limit",
+                        )
+                return message
+
+            return limited_receive
+
+        # Prometheus metrics endpoint
+        # The session manager runs the server once per MCP session, for as long as it is open
+        live_sessions = 0
+        run_session = app.run
+
+        async def run_counted_session(*args, **kwargs):
+            nonlocal live_sessions
+            live_sessions += 1
+            try:
+                return await run_session(*args, **kwargs)
+            finally:
+                live_sessions -= 1
+
+        app.run = run_counted_session
+        REGISTRY.gauge(
+            "mcp_active_sessions", "Open streamable HTTP MCP sessions",
+            function=lambda: live_sessions,
+        )
+
+        async def metrics(request):
+            return PlainTextResponse(
+                REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+            )
+
         # Upload Excel file endpoint
         async def upload_excel(request):
+            start_time = time.perf_counter()
+            form = None
+            writer = None
             try:
-                # Get form data
-                form = await request.form()
+                # Validate file size (max 50MB) before and while reading the body
+                max_size = int(os.getenv("MAX_FILE_SIZE", "52428800"))  # 50MB default
+                max_body = max_size + multipart_overhead
+                content_length = request.headers.get("content-length")
+                if content_length and content_length.isdigit() and int(content_length) > max_body:
+                    raise HTTPException(status_code=413, detail=f"File size exceeds {max_size // (1024*1024)}MB limit")
+
+                # Get form data; the multipart parser spools the file part to disk
+                limited_request = Request(request.scope, limit_receive(request.receive, max_body))
+                form = await limited_request.form(max_files=1)
                 file = form.get("file")
                 
-                if not file:
+                if not file or isinstance(file, str):
                     raise HTTPException(status_code=400, detail="No file provided")
                 
                 # Validate file format
                 if not file.filename.endswith(('.xlsx', '.xls')):
                     raise HTTPException(status_code=400, detail="Only .xlsx and .xls files are supported")
                 
-                # Read file content
-                content = await file.read()
-                
-                # Validate file size (max 50MB)
-                max_size = int(os.getenv("MAX_FILE_SIZE", "52428800"))  # 50MB default
-                if len(content) > max_size:
-                    raise HTTPException(status_code=400, detail=f"File size exceeds {max_size // (1024*1024)}MB limit")
-                
-                # Generate unique file ID
-                file_id = str(uuid.uuid4())
-                
                 # Create directory if it doesn't exist
                 # Use /app/excel_files for Railway persistence instead of /tmp
-                excel_files_path = os.getenv("EXCEL_FILES_PATH", "/app/excel_files")
-                os.makedirs(excel_files_path, exist_ok=True)
+                excel_store = db_client.excel_store
                 
                 # Log directory creation for debug
-                logger.info(f"📁 Excel files directory: {excel_files_path}")
-                logger.info(f"📁 Directory exists: {os.path.exists(excel_files_path)}")
-                logger.info(f"📁 Directory writable: {os.access(excel_files_path, os.W_OK)}")
+                logger.info(f"📁 Excel files directory: {excel_store.base_path}")
+                
+                # Stream the file to disk in chunks, hashing and size-checking as it goes
+                writer = await anyio.to_thread.run_sync(UploadWriter, excel_store.blobs_path, max_size)
+                while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                    await anyio.to_thread.run_sync(writer.write, chunk)
                 
-                # Save file
-                file_path = os.path.join(excel_files_path, f"{file_id}.xlsx")
-                # Normalize path separators for DuckDB compatibility
-                file_path = file_path.replace("\\", "/")
-                with open(file_path, "wb") as f:
-                    f.write(content)
+                # Workbooks are stored once per content hash; the fileId is an alias
+                file_id, deduplicated = await anyio.to_thread.run_sync(
+                    excel_store.add_upload, writer, file.filename
+                )
+                file_path = excel_store.xlsx_path(file_id)
                 
-                logger.info(f"File uploaded: {file.filename} -> {file_id}")
+                if deduplicated:
+                    logger.info(f"♻️ File uploaded: {file.filename} -> {file_id} (same content as an earlier upload)")
+                else:
+                    logger.info(f"File uploaded: {file.filename} -> {file_id} ({writer.size} bytes)")
+
+                # Materialize sheets into DuckDB tables off the event loop so
+                # queries never have to re-parse the workbook; a no-op for known content
+                await anyio.to_thread.run_sync(excel_store.ensure_ingested, file_id)
+                UPLOAD_BYTES.observe(writer.size)
+                UPLOAD_DURATION.observe(time.perf_counter() - start_time)
                 
                 return JSONResponse({
                     "fileId": file_id,
                     "filename": file.filename,
                     "path": file_path,
-                    "size": len(content)
+                    "size": writer.size,
+                    "contentHash": writer.content_hash,
+                    "deduplicated": deduplicated
                 })
                 
+            except UploadTooLargeError as e:
+                raise HTTPException(status_code=413, detail=str(e))
             except HTTPException:
                 raise
             except Exception as e:
                 logger.error(f"Error uploading file: {e}")
                 raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
+            finally:
+                # No-op once committed; removes the partial file otherwise
+                if writer is not None:
+                    await anyio.to_thread.run_sync(writer.abort)
+                if form is not None:
+                    await form.close()
 
         # Download Excel file endpoint
         async def download_excel(request):
@@ -223,8 +489,7 @@ def main(
             if not file_id:
                 raise HTTPException(status_code=400, detail="File ID is required")
             
-            excel_files_path = os.getenv("EXCEL_FILES_PATH", "/app/excel_files")
-            file_path = os.path.join(excel_files_path, f"{file_id}.xlsx")
+            file_path = await anyio.to_thread.run_sync(db_client.excel_store.xlsx_path, file_id)
             
             if not os.path.exists(file_path):
                 raise HTTPException(status_code=404, detail="File not found")
@@ -241,34 +506,18 @@ def main(
             if not file_id:
                 raise HTTPException(status_code=400, detail="File ID is required")
             
-            excel_files_path = os.getenv("EXCEL_FILES_PATH", "/app/excel_files")
-            file_path = os.path.join(excel_files_path, f"{file_id}.xlsx")
+            file_path = await anyio.to_thread.run_sync(db_client.excel_store.xlsx_path, file_id)
             
             if not os.path.exists(file_path):
                 raise HTTPException(status_code=404, detail="File not found")
             
             try:
-                import openpyxl
-                wb = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
-                
-                sheets = []
-                total_rows = 0
-                
-                for idx, sheet_name in enumerate(wb.sheetnames):
-                    ws = wb[sheet_name]
-                    row_count = ws.max_row
-                    col_count = ws.max_column
-                    
-                    sheets.append({
-                        "name": sheet_name,
-                        "index": idx,
-                        "rowCount": row_count,
-                        "columnCount": col_count
-                    })
-                    total_rows += row_count
-                
-                wb.close()
-                
+                # Answered from the ingestion sidecar; only a missing one touches the workbook
+                sheets = await anyio.to_thread.run_sync(
+                    db_client.excel_store.sheet_summary, file_id
+                )
+                total_rows = sum(sheet["rowCount"] for sheet in sheets)
+
                 return JSONResponse({
                     "success": True,
                     "fileId": file_id,
@@ -280,6 +529,18 @@ def main(
                 logger.error(f"Error listing sheets: {e}")
                 raise HTTPException(status_code=500, detail=f"Failed to list sheets: {str(e)}")
 
+        # Delete an uploaded file; its blob is removed with the last fileId pointing at it
+        async def delete_file(request):
+            file_id = request.path_params.get("file_id")
+            if not file_id:
+                raise HTTPException(status_code=400, detail="File ID is required")
+            
+            deleted = await anyio.to_thread.run_sync(db_client.delete_excel_file, file_id)
+            if not deleted:
+                raise HTTPException(status_code=404, detail="File not found")
+            
+            return JSONResponse({"success": True, "fileId": file_id})
+
         @contextlib.asynccontextmanager
         async def lifespan(app: Starlette) -> AsyncIterator[None]:
             """Context manager for session manager."""
@@ -303,7 +564,9 @@ def main(
                 Route("/health", endpoint=health_check, methods=["GET"]),
                 Route("/upload", endpoint=upload_excel, methods=["POST"]),
                 Route("/download/{file_id:str}", endpoint=download_excel, methods=["GET"]),
+                Route("/metrics", endpoint=metrics, methods=["GET"]),
                 Route("/files/{file_id:str}/sheets", endpoint=list_sheets, methods=["GET"]),
+                Route("/files/{file_id:str}", endpoint=delete_file, methods=["DELETE"]),
                 Mount("/mcp", app=handle_streamable_http),
             ],
             lifespan=lifespan,
@@ -339,6 +602,7 @@ def main(
         )
 
     else:
+        import anyio
         from mcp.server.stdio import stdio_server
 
         logger.info("MCP server initialized in \033[32mstdio\033[0m mode")
@@ -1,9 +1,9 @@
 import os
 import logging
 from typing import Optional
-from fastapi import HTTPException, Header, Request
-from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
 from starlette.responses import Response
 
 logger = logging.getLogger("mcp_server_motherduck")
@@ -0,0 +1,151 @@
+import os
+import re
+import copy
+import json
+import logging
+import threading
+from collections import OrderedDict
+from typing import Hashable
+
+logger = logging.getLogger("mcp_server_motherduck")
+
+# String literals, quoted identifiers and comments, which normalization must not touch
+_SQL_TOKEN_RE = re.compile(
+    r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|(?:\s+|--[^\n]*|/\*.*?\*/)+", re.DOTALL
+)
+
+_READ_STATEMENT_RE = re.compile(
+    r"^\s*\(?\s*(SELECT|WITH|FROM|VALUES|TABLE|SUMMARIZE|DESCRIBE|SHOW|PIVOT|UNPIVOT)\b",
+    re.IGNORECASE,
+)
+
+# Functions and clauses whose result changes between identical executions
+_NON_DETERMINISTIC_RE = re.compile(
+    r"\b(random|uuid|gen_random_uuid|setseed|nextval|currval|now|today|"
+    r"current_timestamp|current_date|current_time|get_current_time|"
+    r"get_current_timestamp|localtimestamp|localtime|transaction_timestamp)\b"
+    r"|\bUSING\s+SAMPLE\b|\bTABLESAMPLE\b",
+    re.IGNORECASE,
+)
+
+_REMOTE_URL_RE = re.compile(r"'(?:s3|s3a|gcs|gs|r2|az|azure|abfss|https?|hf|md):", re.IGNORECASE)
+
+_STRING_LITERAL_RE = re.compile(r"'((?:[^']|'')*)'")
+
+# Path literals with glob characters, whose matched file set cannot be fingerprinted
+_GLOB_LITERAL_RE = re.compile(r"'[^']*[\\/][^']*[*?\[][^']*'")
+
+
+def normalize_sql(query: str) -> str:
+    """
+    Canonical form of a statement for cache keys: comments dropped, whitespace
+    collapsed, trailing semicolons stripped and, since DuckDB identifiers and
+    keywords are case-insensitive, lowercased outside literals and quoted names.
+    """
+    parts = []
+    pos = 0
+    for match in _SQL_TOKEN_RE.finditer(query):
+        parts.append(query[pos:match.start()].lower())
+        token = match.group(0)
+        parts.append(token if token[0] in "'\"" else " ")
+        pos = match.end()
+    parts.append(query[pos:].lower())
+    return "".join(parts).strip().rstrip(";").strip()
+
+
+def cache_bypass_reason(query: str) -> str | None:
+    """Why a statement's result must not be cached, or None if it can be"""
+    normalized = normalize_sql(query)
+    if not _READ_STATEMENT_RE.match(normalized):
+        return "write"
+    # Everything outside literals, so a ';' or function name inside a string does not count
+    code = _STRING_LITERAL_RE.sub("''", normalized)
+    if ";" in code:
+        return "multiple statements"
+    if _NON_DETERMINISTIC_RE.search(code):
+        return "non-deterministic"
+    if _REMOTE_URL_RE.search(normalized):
+        return "remote source"
+    if _GLOB_LITERAL_RE.search(normalized):
+        return "glob pattern"
+    return None
+
+
+def referenced_files(query: str) -> list[str]:
+    """Local files referenced through string literals, e.g. in read_xlsx('...')"""
+    paths = []
+    for literal in _STRING_LITERAL_RE.findall(query):
+        path = literal.replace("''", "'")
+        if path and os.path.isfile(path):
+            paths.append(path)
+    return paths
+
+
+def file_fingerprint(path: str) -> tuple:
+    try:
+        st = os.stat(path)
+        return (path, st.st_mtime_ns, st.st_size)
+    except OSError:
+        return (path, None, None)
+
+
+class QueryResultCache:
+    """
+    Memory-bounded LRU cache of JSON query responses.
+
+    Keys are built by the caller from the normalized SQL and the fingerprints
+    of everything the result depends on, so a changed file or database never
+    serves a stale entry; it just stops being hit and ages out.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.bypasses = 0
+        self._entries: OrderedDict[Hashable, tuple[dict, int]] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    @property
+    def size_bytes(self) -> int:
+        return self._size
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> dict | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return copy.deepcopy(entry[0])
+
+    def put(self, key: Hashable, response: dict) -> None:
+        size = len(json.dumps(response, default=str))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._size -= self._entries.pop(key)[1]
+            self._entries[key] = (copy.deepcopy(response), size)
+            self._size += size
+            while self._size > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._size -= evicted_size
+
+    def record_bypass(self) -> None:
+        with self._lock:
+            self.bypasses += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
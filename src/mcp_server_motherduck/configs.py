@@ -4,6 +4,22 @@ SERVER_VERSION = "0.7.2"
 
 SERVER_LOCALHOST = "0.0.0.0"
 
+# Maximum number of rows returned by a JSON query result
+DEFAULT_MAX_ROWS = 1000
+
+# Truncated results stay open for `fetch_more` until idle for this many seconds
+DEFAULT_CURSOR_TTL = 300.0
+DEFAULT_MAX_OPEN_CURSORS = 16
+
+# Memory budget of the query result cache, in bytes of serialized JSON
+DEFAULT_RESULT_CACHE_SIZE = 64 * 1024 * 1024
+
+# Disk budget of the S3 block cache, in bytes
+DEFAULT_S3_CACHE_SIZE = 1024 * 1024 * 1024
+
+# Seconds a query may run before it is interrupted; 0 lets queries run to completion
+DEFAULT_QUERY_TIMEOUT = 0.0
+
 UVICORN_LOGGING_CONFIG: dict[str, Any] = {
     "version": 1,
     "disable_existing_loggers": False,
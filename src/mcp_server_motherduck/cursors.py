@@ -0,0 +1,184 @@
+import time
+import uuid
+import secrets
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Iterator
+import duckdb
+
+logger = logging.getLogger("mcp_server_motherduck")
+
+# Closed cursors whose reason is remembered for a clearer fetch_more error
+CLOSED_CURSOR_MEMORY = 256
+
+
+class ResultCursorError(Exception):
+    """Raised when a cursor id or continuation token cannot be used"""
+
+
+class ResultCursor:
+    """A still-open query result that can be paged through with `fetch_more`"""
+
+    def __init__(
+        self,
+        conn: duckdb.DuckDBPyConnection | None,
+        columns: list[str],
+        query: str,
+        release: Callable[[], None],
+        pending_rows: list[tuple],
+        offset: int,
+        lock: "threading.RLock | None" = None,
+    ):
+        self.cursor_id = uuid.uuid4().hex
+        # None when the result was read up front and no connection stays open
+        self.conn = conn
+        self.columns = columns
+        self.query = query
+        # Rows already fetched from DuckDB but not yet returned to the client
+        self.pending_rows = pending_rows
+        # Number of rows returned to the client so far
+        self.offset = offset
+        self.token = secrets.token_urlsafe(12)
+        self.last_used = time.monotonic()
+        self.exhausted = False
+        self.evicted = False
+        # Rows beyond `pending_rows` that were not kept, for a result read up front
+        self.cut_off = False
+        # A cursor on a session's connection shares the session's lock, so
+        # fetches and the session's own statements never overlap
+        self.owns_lock = lock is None
+        self.lock = lock or threading.Lock()
+        self._release = release
+        self._released = False
+
+    def next_token(self) -> str:
+        self.token = secrets.token_urlsafe(12)
+        return self.token
+
+    def release(self) -> None:
+        if self._released:
+            return
+        self._released = True
+        try:
+            self._release()
+        except Exception as e:
+            logger.warning(f"Error releasing result cursor {self.cursor_id}: {e}")
+
+
+class ResultCursorRegistry:
+    """
+    Keeps truncated query results open so clients can page through them.
+
+    Each cursor pins the connection its result lives on, unless the result
+    was read up front. Cursors idle for longer than `ttl` seconds are closed,
+    and opening more than `max_open` cursors evicts the least recently used
+    one.
+    """
+
+    def __init__(self, ttl: float = 300.0, max_open: int = 16):
+        self.ttl = ttl
+        self.max_open = max_open
+        self._cursors: dict[str, ResultCursor] = {}
+        # Why recently closed cursors went away, by cursor id
+        self._closed: OrderedDict[str, str] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._cursors)
+
+    def open(
+        self,
+        conn: duckdb.DuckDBPyConnection | None,
+        columns: list[str],
+        query: str,
+        release: Callable[[], None],
+        pending_rows: list[tuple],
+        offset: int,
+        lock: "threading.RLock | None" = None,
+    ) -> ResultCursor:
+        cursor = ResultCursor(conn, columns, query, release, pending_rows, offset, lock)
+        with self._lock:
+            evicted = self._expired()
+            self._cursors[cursor.cursor_id] = cursor
+            while len(self._cursors) > self.max_open:
+                oldest = min(self._cursors.values(), key=lambda c: c.last_used)
+                evicted.append(self._cursors.pop(oldest.cursor_id))
+        self._close_all(evicted)
+        return cursor
+
+    @contextmanager
+    def checkout(self, cursor_id: str, token: str) -> Iterator[ResultCursor]:
+        """Lock a cursor for fetching after validating its continuation token"""
+        with self._lock:
+            evicted = self._expired()
+            cursor = self._cursors.get(cursor_id)
+        self._close_all(evicted)
+        if cursor is None:
+            reason = self._closed.get(cursor_id)
+            if reason is not None:
+                raise ResultCursorError(
+                    f"Cursor {cursor_id} was closed because {reason}. Re-run the query to read more rows."
+                )
+            raise ResultCursorError(
+                f"Unknown or expired cursor: {cursor_id}. Re-run the query to read more rows."
+            )
+
+        with cursor.lock:
+            if cursor.evicted:
+                raise ResultCursorError(
+                    f"Cursor {cursor_id} was closed. Re-run the query to read more rows."
+                )
+            if token != cursor.token:
+                raise ResultCursorError(
+                    "Stale continuation token: use the token returned by the latest page."
+                )
+            try:
+                yield cursor
+            finally:
+                cursor.last_used = time.monotonic()
+                if cursor.exhausted or cursor.evicted:
+                    with self._lock:
+                        self._cursors.pop(cursor.cursor_id, None)
+                    cursor.release()
+
+    def close(self, cursor_id: str, reason: str | None = None) -> bool:
+        with self._lock:
+            cursor = self._cursors.pop(cursor_id, None)
+            if cursor is not None and reason is not None:
+                self._closed[cursor_id] = reason
+                while len(self._closed) > CLOSED_CURSOR_MEMORY:
+                    self._closed.popitem(last=False)
+        if cursor is None:
+            return False
+        self._close_all([cursor])
+        return True
+
+    def sweep(self) -> None:
+        """Close cursors that outlived their TTL"""
+        with self._lock:
+            expired = self._expired()
+        self._close_all(expired)
+
+    def _expired(self) -> list[ResultCursor]:
+        # Called with the registry lock held
+        now = time.monotonic()
+        expired = [c for c in self._cursors.values() if now - c.last_used > self.ttl]
+        for cursor in expired:
+            del self._cursors[cursor.cursor_id]
+        return expired
+
+    def _close_all(self, cursors: list[ResultCursor]) -> None:
+        for cursor in cursors:
+            logger.info(f"🗑️ Closing result cursor {cursor.cursor_id}")
+            if not cursor.owns_lock:
+                # The session owns the connection; waiting for its lock here could
+                # deadlock two sessions evicting each other's cursors
+                cursor.evicted = True
+                cursor.release()
+                continue
+            # Wait for an in-flight fetch on this cursor to finish first
+            with cursor.lock:
+                cursor.evicted = True
+                cursor.release()
@@ -1,16 +1,58 @@
 import os
 import duckdb
-from typing import Literal, Optional
-import io
-from contextlib import redirect_stdout
-from tabulate import tabulate
+from typing import Callable, Iterator, Literal, Optional
+from contextlib import contextmanager, nullcontext
 import logging
 import time
 import json
-from .configs import SERVER_VERSION
+import threading
+import weakref
+from .configs import (
+    DEFAULT_MAX_ROWS,
+    DEFAULT_CURSOR_TTL,
+    DEFAULT_MAX_OPEN_CURSORS,
+    DEFAULT_RESULT_CACHE_SIZE,
+    DEFAULT_QUERY_TIMEOUT,
+    DEFAULT_S3_CACHE_SIZE,
+)
+from .cursors import ResultCursorRegistry
+from .cache import (
+    QueryResultCache,
+    cache_bypass_reason,
+    file_fingerprint,
+    normalize_sql,
+    referenced_files,
+)
+from .deadline import QueryCancelledError, QueryDeadline, QueryTimeoutError
+from .excel_store import ExcelStore
+from .extensions import ExtensionLoader, extensions_for
+from .pool import PooledConnection, ReadOnlyConnectionPool
+from .query_profile import drain, profiling
+from .render import DEFAULT_MAX_WIDTH, TableRenderer
+from .s3_cache import S3BlockCacheProxy, prefetch_metadata
+from .sessions import SessionConnectionManager
+from . import startup
+from .sheet_profile import profile_source, quote_identifier
 
 logger = logging.getLogger("mcp_server_motherduck")
 
+# Rows pulled from DuckDB per fetchmany() call when building JSON results
+FETCH_BATCH_SIZE = 2048
+
+# Rows kept for fetch_more beyond the first page in --read-only mode, where a
+# truncated result is read up front instead of pinning a pooled connection
+READ_ONLY_CURSOR_ROWS = 50000
+
+# Rows previewed next to the operator profile returned by profile_query
+PROFILE_PREVIEW_ROWS = 5
+
+# Maximum number of statements in one query_batch call, and how many run concurrently
+MAX_BATCH_STATEMENTS = 20
+BATCH_MAX_WORKERS = 4
+
+# Maximum number of sheets profiled concurrently by discover_excel_structure
+PROFILE_MAX_WORKERS = 4
+
 
 class DatabaseClient:
     def __init__(
@@ -20,18 +62,94 @@ class DatabaseClient:
         home_dir: str | None = None,
         saas_mode: bool = False,
         read_only: bool = False,
+        pool_size: int = 4,
+        pool_idle_timeout: float = 5.0,
+        max_rows: int = DEFAULT_MAX_ROWS,
+        cursor_ttl: float = DEFAULT_CURSOR_TTL,
+        max_open_cursors: int = DEFAULT_MAX_OPEN_CURSORS,
+        result_cache_size: int = DEFAULT_RESULT_CACHE_SIZE,
+        query_timeout: float = DEFAULT_QUERY_TIMEOUT,
+        extension_directory: str | None = None,
+        offline_extensions: bool = False,
+        memory_limit: str | None = None,
+        threads: int | None = None,
+        temp_directory: str | None = None,
+        s3_cache_directory: str | None = None,
+        s3_cache_size: int = DEFAULT_S3_CACHE_SIZE,
+        s3_cache_prefetch: bool = False,
+        fan_out: Callable[[Callable, list, int], list] | None = None,
     ):
         self._read_only = read_only
+        # Runs independent statements of one call side by side, e.g. QueryExecutor.map;
+        # without one they run in turn
+        self._fan_out = fan_out or (lambda func, items, max_workers: [func(item) for item in items])
+        self.max_rows = max_rows
+        # Seconds before a running query is interrupted; 0 disables the deadline
+        self.query_timeout = query_timeout
+        self.result_cursors = ResultCursorRegistry(
+            ttl=cursor_ttl, max_open=max_open_cursors
+        )
+        self.result_cache = QueryResultCache(max_bytes=result_cache_size)
+        # Bumped around every statement that may change data or session state
+        self._write_generation = 0
         self.db_path, self.db_type = self._resolve_db_path_type(
             db_path, motherduck_token, saas_mode
         )
         logger.info(f"Database client initialized in `{self.db_type}` mode")
 
+        # Remote reads of an S3 database go through a local on-disk block cache
+        self.s3_cache: S3BlockCacheProxy | None = None
+        if self.db_type == "s3" and s3_cache_directory:
+            self.s3_cache = S3BlockCacheProxy(s3_cache_directory, s3_cache_size, self.db_path)
+        self._s3_cache_prefetch = s3_cache_prefetch
+
         # Set the home directory for DuckDB
         if home_dir:
             os.environ["HOME"] = home_dir
 
-        self.conn = self._initialize_connection()
+        # Extensions are installed once here; every connection below only loads them
+        # Resource limits are per DuckDB instance: shared by every session on the
+        # main database, and applied separately to each workbook ingestion
+        settings = {}
+        if memory_limit:
+            settings["memory_limit"] = memory_limit
+        if threads:
+            settings["threads"] = threads
+        if temp_directory:
+            settings["temp_directory"] = temp_directory
+        self.extensions = ExtensionLoader(
+            extension_directory, offline=offline_extensions, settings=settings
+        )
+        with startup.phase("extensions"):
+            self.extensions.prepare(extensions_for(self.db_type))
+
+        self.excel_store = ExcelStore(extensions=self.extensions)
+        # Ingested workbooks attached to every connection, as catalog -> database path
+        self._excel_catalogs: dict[str, str] = {}
+        self._excel_tables: dict[str, set[str]] = {}
+        self._excel_lock = threading.Lock()
+        # Per connection: the workbook put in front of its search_path, and the path to restore
+        self._search_paths: weakref.WeakKeyDictionary[duckdb.DuckDBPyConnection, dict] = (
+            weakref.WeakKeyDictionary()
+        )
+
+        # Catalog selected with `USE` on the main connection, replayed on cursors
+        self._default_catalog: str | None = None
+        # Each worker thread queries through its own cursor on the shared database,
+        # and each MCP session through a connection of its own
+        self._local = threading.local()
+        self.sessions = SessionConnectionManager(self._new_cursor, self.result_cursors.close)
+
+        with startup.phase("connect"):
+            self.conn = self._initialize_connection()
+        self._pool: ReadOnlyConnectionPool | None = None
+        if self.conn is None:
+            self._pool = ReadOnlyConnectionPool(
+                self._open_read_only_connection,
+                self.db_path,
+                max_size=pool_size,
+                idle_timeout=pool_idle_timeout,
+            )
 
     def _initialize_connection(self) -> Optional[duckdb.DuckDBPyConnection]:
         """Initialize connection to the MotherDuck or DuckDB database"""
@@ -47,9 +165,7 @@ class DatabaseClient:
             try:
                 conn = duckdb.connect(
                     self.db_path,
-                    config={
-                        "custom_user_agent": f"mcp-server-motherduck/{SERVER_VERSION}"
-                    },
+                    config=self.extensions.config(),
                     read_only=self._read_only,
                 )
                 conn.execute("SELECT 1")
@@ -62,27 +178,8 @@ class DatabaseClient:
         # Check if this is an S3 path
         if self.db_type == "s3":
             # For S3, we need to create an in-memory connection and attach the S3 database
-            conn = duckdb.connect(':memory:')
-            
-            # Install and load the httpfs extension for S3 support
-            import io
-            from contextlib import redirect_stdout, redirect_stderr
-            
-            null_file = io.StringIO()
-            with redirect_stdout(null_file), redirect_stderr(null_file):
-                try:
-                    conn.execute("INSTALL httpfs;")
-                except:
-                    pass  # Extension might already be installed
-                conn.execute("LOAD httpfs;")
-            
-            # Install and load the excel extension for reading .xlsx files
-            with redirect_stdout(null_file), redirect_stderr(null_file):
-                try:
-                    conn.execute("INSTALL excel;")
-                except:
-                    pass  # Extension might already be installed
-                conn.execute("LOAD excel;")
+            # httpfs and excel are loaded by the extension loader
+            conn = self.extensions.connect(':memory:')
             
             # Configure S3 credentials from environment variables using CREATE SECRET
             aws_access_key = os.environ.get('AWS_ACCESS_KEY_ID')
@@ -100,7 +197,22 @@ class DatabaseClient:
                         REGION '{aws_region}'
                     );
                 """)
-            
+
+            if self.s3_cache is not None:
+                # Scoped to the database file (and its WAL), so other S3 reads
+                # keep going straight to S3 with the secret above
+                endpoint = self.s3_cache.start()
+                scope = self.db_path.replace("'", "''")
+                conn.execute(f"""
+                    CREATE SECRET IF NOT EXISTS s3_block_cache (
+                        TYPE S3,
+                        ENDPOINT '{endpoint}',
+                        URL_STYLE 'path',
+                        USE_SSL false,
+                        SCOPE '{scope}'
+                    );
+                """)
+
             # Attach the S3 database
             try:
                 # For S3, we always attach as READ_ONLY since S3 storage is typically read-only
@@ -108,42 +220,47 @@ class DatabaseClient:
                 conn.execute(f"ATTACH '{self.db_path}' AS s3db (READ_ONLY);")
                 # Use the attached database
                 conn.execute("USE s3db;")
+                self._default_catalog = "s3db"
                 logger.info(f"✅ Successfully connected to {self.db_type} database (attached as read-only)")
             except Exception as e:
                 logger.error(f"Failed to attach S3 database: {e}")
                 # If the database doesn't exist and we're not in read-only mode, try to create it
                 if "database does not exist" in str(e) and not self._read_only:
                     logger.info("S3 database doesn't exist, attempting to create it...")
+                    if self.s3_cache is not None:
+                        # The block cache only serves reads; a new database is written to S3 directly
+                        logger.info("💾 S3 block cache is not used for a newly created database")
+                        conn.execute("DROP SECRET IF EXISTS s3_block_cache")
+                        self.s3_cache.close()
+                        self.s3_cache = None
                     try:
                         # Create a new database at the S3 location
                         conn.execute(f"ATTACH '{self.db_path}' AS s3db;")
                         conn.execute("USE s3db;")
+                        self._default_catalog = "s3db"
                         logger.info(f"✅ Created new S3 database at {self.db_path}")
                     except Exception as create_error:
                         logger.error(f"Failed to create S3 database: {create_error}")
                         raise
                 else:
                     raise
-                
+
+            if self.s3_cache is not None and self._s3_cache_prefetch:
+                # Best effort: a failed prefetch only means slower first queries
+                started = time.perf_counter()
+                try:
+                    with startup.phase("s3 metadata prefetch"):
+                        tables = prefetch_metadata(conn, "s3db")
+                    logger.info(
+                        f"💾 Prefetched metadata of {tables} tables in "
+                        f"{time.perf_counter() - started:.2f}s"
+                    )
+                except Exception as e:
+                    logger.warning(f"S3 metadata prefetch failed: {e}")
+
             return conn
 
-        conn = duckdb.connect(
-            self.db_path,
-            config={"custom_user_agent": f"mcp-server-motherduck/{SERVER_VERSION}"},
-            read_only=self._read_only,
-        )
-        
-        # Install and load the excel extension for reading .xlsx files
-        import io
-        from contextlib import redirect_stdout, redirect_stderr
-        
-        null_file = io.StringIO()
-        with redirect_stdout(null_file), redirect_stderr(null_file):
-            try:
-                conn.execute("INSTALL excel;")
-            except:
-                pass  # Extension might already be installed
-            conn.execute("LOAD excel;")
+        conn = self.extensions.connect(self.db_path, read_only=self._read_only)
 
         logger.info(f"✅ Successfully connected to {self.db_type} database")
 
@@ -190,192 +307,732 @@ class DatabaseClient:
 
         return db_path, "duckdb"
 
-    def _execute(self, query: str) -> str:
-        if self.conn is None:
-            # open short lived readonly connection for local DuckDB, run query, close connection, return result
-            conn = duckdb.connect(
-                self.db_path,
-                config={"custom_user_agent": f"mcp-server-motherduck/{SERVER_VERSION}"},
-                read_only=self._read_only,
+    def _cursor(self) -> duckdb.DuckDBPyConnection:
+        """Cursor of the calling thread, so concurrent queries do not serialize on one connection"""
+        cursor = getattr(self._local, "cursor", None)
+        if cursor is None:
+            cursor = self._local.cursor = self._new_cursor()
+        return cursor
+
+    def _new_cursor(self) -> duckdb.DuckDBPyConnection:
+        """New connection on the shared database, with its own temp schema and settings"""
+        cursor = self.conn.cursor()
+        if self._default_catalog:
+            cursor.execute(f"USE {self._default_catalog};")
+        return cursor
+
+    def _open_read_only_connection(self) -> duckdb.DuckDBPyConnection:
+        # Pooled connections get read_xlsx too, like the main connection
+        return self.extensions.connect(self.db_path, read_only=self._read_only)
+
+    def _acquire_connection(
+        self, use_session: bool = True
+    ) -> tuple[duckdb.DuckDBPyConnection, Callable[[], None]]:
+        """
+        Connection to run a query on from the calling thread, and the callback
+        that gives it back. Without `use_session`, the thread's own cursor is
+        used even inside an MCP session.
+        """
+        if self.conn is not None:
+            session = self.sessions.acquire() if use_session else None
+            if session is not None:
+                return session.conn, session.lock.release
+            return self._cursor(), lambda: None
+
+        # Read-only mode: borrow a pooled connection instead of connecting per query
+        pooled = self._pool.acquire()
+        try:
+            self._attach_excel_catalogs(pooled)
+        except Exception:
+            self._pool.release(pooled)
+            raise
+        return pooled.conn, lambda: self._pool.release(pooled)
+
+    def _detach_connection(self, conn: duckdb.DuckDBPyConnection) -> Callable[[], None]:
+        """Take ownership of the thread's cursor, e.g. to keep a result open on it"""
+        # The thread gets a fresh cursor for its next query
+        self._local.cursor = None
+        return conn.close
+
+    @contextmanager
+    def _connection(self) -> Iterator[duckdb.DuckDBPyConnection]:
+        conn, release = self._acquire_connection()
+        try:
+            yield conn
+        finally:
+            release()
+
+    def _attach_excel_catalogs(self, pooled: PooledConnection) -> None:
+        # Catalogs of deleted workbooks are dropped lazily on each connection
+        for catalog in pooled.catalogs - set(self._excel_catalogs):
+            pooled.conn.execute(f"DETACH DATABASE IF EXISTS {catalog}")
+            pooled.catalogs.discard(catalog)
+        for catalog, db_path in list(self._excel_catalogs.items()):
+            if catalog in pooled.catalogs:
+                continue
+            escaped_path = db_path.replace("'", "''")
+            pooled.conn.execute(
+                f"ATTACH IF NOT EXISTS '{escaped_path}' AS {catalog} (READ_ONLY)"
             )
-            q = conn.execute(query)
+            pooled.catalogs.add(catalog)
+
+    def attach_excel_file(self, file_id: str) -> str | None:
+        """Attach the ingested tables of an uploaded workbook, ingesting it on first access"""
+        catalog = self.excel_store.catalog_name(file_id)
+        if catalog is None:
+            return None
+        if catalog in self._excel_catalogs:
+            return catalog
+
+        db_path = self.excel_store.ensure_ingested(file_id)
+        if db_path is None:
+            return None
+
+        with self._excel_lock:
+            if catalog in self._excel_catalogs:
+                return catalog
+            escaped_path = db_path.replace("'", "''")
+            with self._connection() as conn:
+                conn.execute(f"ATTACH IF NOT EXISTS '{escaped_path}' AS {catalog} (READ_ONLY)")
+                tables = conn.execute(
+                    "SELECT table_name FROM duckdb_tables() WHERE database_name = ?",
+                    [catalog],
+                ).fetchall()
+            self._excel_tables[catalog] = {t[0] for t in tables}
+            self._excel_catalogs[catalog] = db_path
+
+        logger.info(f"📎 Attached ingested workbook {file_id} as `{catalog}`")
+        return catalog
+
+    def delete_excel_file(self, file_id: str) -> bool:
+        """Remove an uploaded workbook's fileId, detaching its tables once no fileId uses them"""
+        catalog = self.excel_store.catalog_name(file_id)
+        existed, deleted_hash = self.excel_store.remove(file_id)
+        if deleted_hash is not None and catalog is not None:
+            with self._excel_lock:
+                self._excel_catalogs.pop(catalog, None)
+                self._excel_tables.pop(catalog, None)
+                if self.conn is not None:
+                    with self._connection() as conn:
+                        conn.execute(f"DETACH DATABASE IF EXISTS {catalog}")
+        return existed
+
+    def workbook_sheets(self, catalog: str) -> set[str]:
+        """Sheets of an attached workbook that can be queried by name"""
+        return self._excel_tables.get(catalog, set())
+
+    def _use_workbook(self, conn: duckdb.DuckDBPyConnection, workbook: str | None) -> None:
+        """
+        Resolve unqualified table names on `conn` in the `workbook` catalog
+        first, so its sheets can be queried, joined and nested by name.
+
+        The search path in effect is read before every statement on a
+        connection that had a workbook applied, so a `USE` or
+        `SET search_path` run since then becomes the path restored for
+        statements without a workbook, and the one the next workbook goes
+        in front of. Nothing is queried on connections that never had a
+        workbook.
+        """
+        state = self._search_paths.get(conn)
+        if state is None and workbook is None:
+            return
+        current_path, current_schema = conn.execute(
+            "SELECT current_setting('search_path'), current_database() || '.' || current_schema()"
+        ).fetchone()
+        if state is not None and current_path == state["path"]:
+            if state["workbook"] == workbook:
+                return
+            own_path, base_path = state["own_path"], state["base_path"]
         else:
-            q = self.conn.execute(query)
+            # First workbook on this connection, or its path was replaced since
+            own_path, base_path = current_path, current_path or current_schema
 
-        out = tabulate(
-            q.fetchall(),
-            headers=[d[0] + "\n" + str(d[1]) for d in q.description],
-            tablefmt="pretty",
-        )
+        if workbook is None:
+            if own_path:
+                escaped_path = own_path.replace("'", "''")
+                conn.execute(f"SET search_path = '{escaped_path}'")
+            else:
+                conn.execute("RESET search_path")
+            del self._search_paths[conn]
+            return
+        escaped_path = f"{workbook}.main,{base_path}".replace("'", "''")
+        conn.execute(f"SET search_path = '{escaped_path}'")
+        # Read back in DuckDB's own spelling, to recognize it on the next statement
+        applied_path = conn.execute("SELECT current_setting('search_path')").fetchone()[0]
+        self._search_paths[conn] = {
+            "workbook": workbook,
+            "path": applied_path,
+            "own_path": own_path,
+            "base_path": base_path,
+        }
 
-        if self.conn is None:
-            conn.close()
+    def excel_table(self, file_id: str, sheet: str) -> str | None:
+        """Qualified name of the materialized table for a sheet, or None to fall back to read_xlsx"""
+        catalog = self.attach_excel_file(file_id)
+        if catalog is None or sheet not in self._excel_tables.get(catalog, set()):
+            return None
+        return f"{catalog}.{quote_identifier(sheet)}"
 
-        return out
+    def _execute(
+        self,
+        query: str,
+        max_rows: int | None = None,
+        table_format: str = "pretty",
+        max_width: int = DEFAULT_MAX_WIDTH,
+        deadline: QueryDeadline | None = None,
+        workbook: str | None = None,
+    ) -> str:
+        """Execute query and render at most max_rows rows as a text table"""
+        max_rows = self._resolve_max_rows(max_rows)
+        with self._connection() as conn:
+            self._use_workbook(conn, workbook)
+            with deadline.watch(conn) if deadline is not None else nullcontext():
+                q = conn.execute(query)
+                if not q.description:
+                    return "OK"
+                renderer = TableRenderer(
+                    [d[0] for d in q.description],
+                    [str(d[1]) for d in q.description],
+                    table_format=table_format,
+                    max_width=max_width,
+                )
+                # Stream batches into the renderer; one extra row only signals truncation
+                remaining = max_rows + 1
+                truncated = False
+                while remaining > 0:
+                    batch = q.fetchmany(min(FETCH_BATCH_SIZE, remaining))
+                    if not batch:
+                        break
+                    remaining -= len(batch)
+                    if remaining == 0:
+                        batch, truncated = batch[:-1], True
+                    renderer.add_rows(batch)
+
+        return renderer.render(truncated=truncated)
 
-    def _execute_json(self, query: str) -> dict:
+    def _execute_json(
+        self,
+        query: str,
+        max_rows: int | None = None,
+        open_cursor: bool = False,
+        deadline: QueryDeadline | None = None,
+        profile: bool = False,
+        workbook: str | None = None,
+        use_session: bool = True,
+    ) -> dict:
         """Execute query and return structured JSON response"""
         start_time = time.time()
-        
-        if self.conn is None:
-            # open short lived readonly connection for local DuckDB, run query, close connection, return result
-            conn = duckdb.connect(
-                self.db_path,
-                config={"custom_user_agent": f"mcp-server-motherduck/{SERVER_VERSION}"},
-                read_only=self._read_only,
-            )
-            q = conn.execute(query)
-        else:
-            q = self.conn.execute(query)
+        max_rows = self._resolve_max_rows(max_rows)
+        self.result_cursors.sweep()
 
-        # Fetch results as DataFrame
-        df = q.fetchdf()
-        
-        # Limit to 1000 rows to prevent context overflow
-        truncated = False
-        if len(df) > 1000:
-            df = df.head(1000)
-            truncated = True
+        cursor = None
+        query_profile = None
+        cut_off = False
+        conn, release = self._acquire_connection(use_session)
+        try:
+            self._use_workbook(conn, workbook)
+            with deadline.watch(conn) if deadline is not None else nullcontext(), \
+                    profiling(conn) if profile else nullcontext() as query_profile:
+                q = conn.execute(query)
+                columns = [d[0] for d in q.description] if q.description else []
 
-        execution_time = int((time.time() - start_time) * 1000)  # milliseconds
+                # Stream at most max_rows + 1 rows; the extra row only signals truncation
+                rows = self._fetch_rows(q, max_rows + 1)
+                if profile and len(rows) > max_rows:
+                    # The profile is only written once the statement completes
+                    drain(q)
+                elif open_cursor and self.conn is None and len(rows) > max_rows \
+                        and self.result_cursors.max_open > 0:
+                    # Pooled read-only connections hold the file lock, so keep no result
+                    # open on one: read what fetch_more may return now, within a bound
+                    kept = max_rows + READ_ONLY_CURSOR_ROWS
+                    rows += self._fetch_rows(q, kept + 1 - len(rows))
+                    cut_off = len(rows) > kept
+                    rows = rows[:kept]
 
-        if self.conn is None:
-            conn.close()
+            # Limit rows to prevent context overflow
+            truncated = len(rows) > max_rows
+            if truncated:
+                session = self.sessions.owner(conn)
+                if open_cursor and self.result_cursors.max_open > 0 and session is not None:
+                    # The rest of the result stays on the session's connection
+                    # until fetch_more drains it or the session runs another statement
+                    cursor = self.result_cursors.open(
+                        conn,
+                        columns,
+                        query,
+                        lambda: None,
+                        pending_rows=rows[max_rows:],
+                        offset=max_rows,
+                        lock=session.lock,
+                    )
+                    session.cursor_id = cursor.cursor_id
+                elif open_cursor and self.result_cursors.max_open > 0 and self.conn is None:
+                    # The rest was read above; the connection goes back to the pool now
+                    cursor = self.result_cursors.open(
+                        None,
+                        columns,
+                        query,
+                        lambda: None,
+                        pending_rows=rows[max_rows:],
+                        offset=max_rows,
+                    )
+                    cursor.cut_off = cut_off
+                elif open_cursor and self.result_cursors.max_open > 0:
+                    # Keep the rest of the result open for fetch_more
+                    cursor = self.result_cursors.open(
+                        conn,
+                        columns,
+                        query,
+                        self._detach_connection(conn),
+                        pending_rows=rows[max_rows:],
+                        offset=max_rows,
+                    )
+                    release = None
+                rows = rows[:max_rows]
+        finally:
+            if release is not None:
+                release()
 
-        return {
+        execution_time = int((time.time() - start_time) * 1000)  # milliseconds
+
+        response = {
             "success": True,
-            "data": df.to_dict(orient="records"),
-            "columns": list(df.columns),
-            "rowCount": len(df),
+            "data": [dict(zip(columns, row)) for row in rows],
+            "columns": columns,
+            "rowCount": len(rows),
             "executionTime": execution_time,
             "truncated": truncated,
             "query": query
         }
+        if cursor is not None:
+            response["cursorId"] = cursor.cursor_id
+            response["continuationToken"] = cursor.token
+        if query_profile is not None:
+            response["profile"] = query_profile.summary()
+        return response
+
+    def query_deadline(self, timeout: float | None = None) -> QueryDeadline:
+        """Deadline for one query; a per-call timeout can only shorten the server default"""
+        if timeout is None or timeout <= 0:
+            return QueryDeadline(self.query_timeout)
+        if self.query_timeout:
+            timeout = min(timeout, self.query_timeout)
+        return QueryDeadline(timeout)
 
-    def query(self, query: str) -> str:
+    def _resolve_max_rows(self, max_rows: int | None) -> int:
+        """Per-call row cap, bounded by the server-wide cap"""
+        if max_rows is None or max_rows <= 0:
+            return self.max_rows
+        return min(max_rows, self.max_rows)
+
+    @staticmethod
+    def _fetch_rows(q: duckdb.DuckDBPyConnection, limit: int) -> list[tuple]:
+        """Fetch up to `limit` rows in batches without materializing the full result"""
+        rows: list[tuple] = []
+        while len(rows) < limit:
+            batch = q.fetchmany(min(FETCH_BATCH_SIZE, limit - len(rows)))
+            if not batch:
+                break
+            rows.extend(batch)
+        return rows
+
+    @contextmanager
+    def _statement(self, query: str) -> Iterator[str | None]:
+        """
+        Bookkeeping around every statement, whatever its result format.
+        Yields why the result must not be cached, if it must not.
+
+        Statements that may write bump the write generation before and after
+        running, so no cached result from around them is served again, and
+        mark the session as having state of its own.
+        """
+        bypass_reason = cache_bypass_reason(query)
+        may_write = bypass_reason in ("write", "multiple statements")
+        if may_write:
+            self._write_generation += 1
+            # Results of this session may now depend on its temp tables or settings
+            self.sessions.mark_stateful()
+        try:
+            yield bypass_reason
+        finally:
+            if may_write:
+                self._write_generation += 1
+
+    def query(
+        self,
+        query: str,
+        max_rows: int | None = None,
+        table_format: str = "pretty",
+        max_width: int = DEFAULT_MAX_WIDTH,
+        deadline: QueryDeadline | None = None,
+        workbook: str | None = None,
+    ) -> str:
         try:
-            return self._execute(query)
+            with self._statement(query):
+                return self._execute(query, max_rows, table_format, max_width, deadline, workbook)
 
         except Exception as e:
             raise ValueError(f"❌ Error executing query: {e}")
 
-    def query_json(self, query: str) -> dict:
-        """Execute query and return JSON response"""
+    def query_json(
+        self,
+        query: str,
+        max_rows: int | None = None,
+        deadline: QueryDeadline | None = None,
+        profile: bool = False,
+        open_cursor: bool = True,
+        workbook: str | None = None,
+    ) -> dict:
+        """
+        Execute query and return JSON response. With `profile`, the statement
+        runs to completion with DuckDB profiling on and the response carries
+        its operator profile; such results are neither cached nor kept open.
+        Unqualified table names resolve in the `workbook` catalog first.
+        """
+        start_time = time.time()
+        if deadline is None:
+            deadline = self.query_deadline()
         try:
-            return self._execute_json(query)
+            with self._statement(query) as bypass_reason:
+                cache_key = None
+                if self.result_cache.enabled and bypass_reason is None and not profile:
+                    cache_key = self._cache_key(query, max_rows, workbook)
+
+                if cache_key is not None:
+                    cached = self.result_cache.get(cache_key)
+                    if cached is not None:
+                        cached["executionTime"] = int((time.time() - start_time) * 1000)
+                        cached["cache"] = "hit"
+                        return cached
+                elif self.result_cache.enabled:
+                    self.result_cache.record_bypass()
+
+                open_cursor = open_cursor and not profile
+                # Until a session has state of its own, its reads run on a cursor that
+                # can be detached, so a truncated result outlives the session's next
+                # statement; on the session's connection it would be closed by it
+                use_session = not (
+                    open_cursor
+                    and bypass_reason not in ("write", "multiple statements")
+                    and self.sessions.cache_scope() is None
+                )
+                response = self._execute_json(
+                    query,
+                    max_rows,
+                    open_cursor=open_cursor,
+                    deadline=deadline,
+                    profile=profile,
+                    workbook=workbook,
+                    use_session=use_session,
+                )
+
+                # Truncated results hold an open cursor and are not reusable
+                if cache_key is not None and not response["truncated"]:
+                    self.result_cache.put(cache_key, response)
+                response["cache"] = "miss" if cache_key is not None else "bypass"
+                return response
         except Exception as e:
-            return {
+            response = {
                 "success": False,
                 "error": str(e),
                 "query": query,
                 "data": [],
                 "columns": [],
                 "rowCount": 0,
-                "executionTime": 0,
+                "executionTime": int((time.time() - start_time) * 1000),
                 "truncated": False
             }
+            if isinstance(e, QueryTimeoutError):
+                response["timedOut"] = True
+                response["timeout"] = e.timeout
+            elif isinstance(e, QueryCancelledError):
+                response["cancelled"] = True
+            return response
+
+    def profile_query(
+        self, query: str, deadline: QueryDeadline | None = None, workbook: str | None = None
+    ) -> dict:
+        """Operator profile of query, with a short preview of its result"""
+        return self.query_json(query, PROFILE_PREVIEW_ROWS, deadline, profile=True, workbook=workbook)
+
+    def query_batch(
+        self,
+        queries: list[str],
+        max_rows: int | None = None,
+        deadline: QueryDeadline | None = None,
+        workbook: str | None = None,
+    ) -> dict:
+        """
+        Run several statements for one call and return all their results.
+
+        Independent reads run concurrently, each on its own cursor. A batch
+        that writes, or a session that created its own temp tables or
+        settings, runs in order on the session's connection instead, so
+        statements see each other's effects. Results are not kept open for
+        fetch_more, and one failing statement does not stop the others.
+        """
+        start_time = time.time()
+        if deadline is None:
+            deadline = self.query_deadline()
+        sequential = len(queries) < 2 or self.sessions.cache_scope() is not None or any(
+            cache_bypass_reason(query) in ("write", "multiple statements") for query in queries
+        )
 
-    def discover_excel_structure(self, file_path: str, sheet_filter: str = "*", sample_rows: int = 5) -> dict:
+        def run(query: str) -> dict:
+            # Every statement gets the full timeout; cancelling the call cancels all of them
+            return self.query_json(
+                query, max_rows, deadline.spawn(), open_cursor=False, workbook=workbook
+            )
+
+        if sequential:
+            results = [run(query) for query in queries]
+        else:
+            # Extra threads take idle executor workers and do not carry the session,
+            # so each uses its own cursor
+            results = self._fan_out(run, queries, BATCH_MAX_WORKERS)
+
+        failed = sum(not result["success"] for result in results)
+        return {
+            "success": failed == 0,
+            "results": [{"index": i, **result} for i, result in enumerate(results)],
+            "statementCount": len(results),
+            "failedCount": failed,
+            "concurrent": not sequential,
+            "executionTime": int((time.time() - start_time) * 1000),
+        }
+
+    def _cache_key(
+        self, query: str, max_rows: int | None, workbook: str | None = None
+    ) -> tuple | None:
+        """Result cache key: normalized SQL plus fingerprints of everything it reads"""
+        if self.db_type != "duckdb":
+            # MotherDuck and S3 databases can change without us noticing
+            return None
+
+        database = (self._write_generation,)
+        if self.db_path != ":memory:":
+            database += (
+                file_fingerprint(self.db_path),
+                file_fingerprint(f"{self.db_path}.wal"),
+            )
+        files = tuple(file_fingerprint(path) for path in referenced_files(query))
+        catalogs = tuple(
+            file_fingerprint(path)
+            for catalog, path in list(self._excel_catalogs.items())
+            if catalog in query or catalog == workbook
+        )
+        return (
+            normalize_sql(query),
+            self._resolve_max_rows(max_rows),
+            database,
+            files,
+            catalogs,
+            workbook,
+            self.sessions.cache_scope(),
+        )
+
+    def fetch_more(
+        self,
+        cursor_id: str,
+        continuation_token: str,
+        max_rows: int | None = None,
+        deadline: QueryDeadline | None = None,
+    ) -> dict:
+        """Return the next page of a truncated result kept open by query_json"""
+        start_time = time.time()
+        if deadline is None:
+            deadline = self.query_deadline()
+        try:
+            max_rows = self._resolve_max_rows(max_rows)
+            with self.result_cursors.checkout(cursor_id, continuation_token) as cursor:
+                rows = cursor.pending_rows
+                if len(rows) <= max_rows and cursor.conn is not None:
+                    try:
+                        with deadline.watch(cursor.conn):
+                            rows = rows + self._fetch_rows(cursor.conn, max_rows + 1 - len(rows))
+                    except Exception:
+                        # An interrupted result cannot be continued
+                        cursor.exhausted = True
+                        raise
+                page, cursor.pending_rows = rows[:max_rows], rows[max_rows:]
+
+                offset = cursor.offset
+                cursor.offset += len(page)
+                truncated = bool(cursor.pending_rows)
+                cursor.exhausted = not truncated
+                columns = cursor.columns
+                token = cursor.next_token() if truncated else None
+                cut_off = cursor.cut_off
+
+            response = {
+                "success": True,
+                "data": [dict(zip(columns, row)) for row in page],
+                "columns": columns,
+                "rowCount": len(page),
+                "offset": offset,
+                "executionTime": int((time.time() - start_time) * 1000),
+                "truncated": truncated,
+            }
+            if truncated:
+                response["cursorId"] = cursor_id
+                response["continuationToken"] = token
+            elif cut_off:
+                # Read-only mode kept a bounded number of rows; the rest needs a new query
+                response["truncated"] = True
+                response["warning"] = (
+                    f"Only {READ_ONLY_CURSOR_ROWS} rows past the first page are kept for fetch_more "
+                    f"in read-only mode. Re-run the query with LIMIT/OFFSET {offset + len(page)} "
+                    "to read the rest."
+                )
+            return response
+        except Exception as e:
+            response = {
+                "success": False,
+                "error": str(e),
+                "cursorId": cursor_id,
+                "data": [],
+                "columns": [],
+                "rowCount": 0,
+                "executionTime": int((time.time() - start_time) * 1000),
+                "truncated": False
+            }
+            if isinstance(e, QueryTimeoutError):
+                response["timedOut"] = True
+                response["timeout"] = e.timeout
+            elif isinstance(e, QueryCancelledError):
+                response["cancelled"] = True
+            return response
+
+    def close_cursor(self, cursor_id: str) -> bool:
+        return self.result_cursors.close(cursor_id)
+
+    def _structure_from_metadata(
+        self, file_id: str, sheet_filter: str, sample_rows: int
+    ) -> dict | None:
+        """Structure of a stored workbook read from its sidecar, or None to profile it live"""
+        # Attaching also makes the sheets queryable as `<catalog>.<sheet>` from any query
+        catalog = self.attach_excel_file(file_id)
+        if catalog is None:
+            return None
+        metadata = self.excel_store.load_metadata(file_id)
+        if metadata is None or sample_rows > metadata.get("sampleRows", 0):
+            return None
+
+        sheets = {sheet["name"]: sheet for sheet in metadata["sheets"]}
+        if sheet_filter == "*":
+            target_sheets = list(sheets)
+        else:
+            target_sheets = [sheet_filter] if sheet_filter in sheets else []
+        if not target_sheets:
+            return {
+                "success": False,
+                "error": f"Sheet '{sheet_filter}' not found",
+                "availableSheets": list(sheets),
+                "sheets": {}
+            }
+
+        sheets_data = {}
+        for name in target_sheets:
+            sheet = sheets[name]
+            if sheet.get("error"):
+                # Profiling it live through read_xlsx would only fail the same way again
+                sheets_data[name] = {
+                    "error": sheet["error"],
+                    "columns": [],
+                    "rowCount": 0,
+                    "sampleData": []
+                }
+                continue
+            sheets_data[name] = {
+                "table": f"{catalog}.{quote_identifier(name)}",
+                "columns": sheet["columns"],
+                "rowCount": sheet["rowCount"],
+                "sampleData": sheet["sampleData"][:sample_rows],
+            }
+        return {
+            "success": True,
+            "fileId": file_id,
+            "contentHash": metadata.get("contentHash"),
+            "catalog": catalog,
+            "sheets": sheets_data
+        }
+
+    def discover_excel_structure(
+        self,
+        file_id: str,
+        sheet_filter: str = "*",
+        sample_rows: int = 5,
+        deadline: QueryDeadline | None = None,
+    ) -> dict:
         """Discover structure of Excel sheets with schema and sample data"""
+        if deadline is None:
+            deadline = self.query_deadline()
         try:
-            import openpyxl
-            
             # Verificar se arquivo existe
-            if not os.path.exists(file_path):
+            if not self.excel_store.exists(file_id):
                 return {
                     "success": False,
-                    "error": f"File not found: {file_path}",
+                    "error": f"File not found: {file_id}",
                     "sheets": {}
                 }
             
-            wb = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+            file_path = self.excel_store.xlsx_path(file_id)
+
+            # Uploaded workbooks are immutable, so answer from the ingestion sidecar
+            cached = self._structure_from_metadata(file_id, sheet_filter, sample_rows)
+            if cached is not None:
+                return cached
+
+            sheet_names = self.excel_store.sheet_names(file_id)
             
             # Determinar quais sheets analisar
             if sheet_filter == "*":
-                target_sheets = wb.sheetnames
+                target_sheets = sheet_names
             else:
-                target_sheets = [sheet_filter] if sheet_filter in wb.sheetnames else []
+                target_sheets = [sheet_filter] if sheet_filter in sheet_names else []
             
             if not target_sheets:
-                wb.close()
                 return {
                     "success": False,
                     "error": f"Sheet '{sheet_filter}' not found",
-                    "availableSheets": wb.sheetnames,
+                    "availableSheets": sheet_names,
                     "sheets": {}
                 }
             
-            sheets_data = {}
-            
-            for sheet_name in target_sheets:
+            def profile_sheet(sheet_name: str) -> dict:
                 try:
-                    # Usar DuckDB para análise eficiente
-                    query = f"""
-                    SELECT * 
-                    FROM read_xlsx('{file_path}', 
-                                  sheet='{sheet_name}', 
-                                  all_varchar=true, 
-                                  ignore_errors=true) 
-                    LIMIT {sample_rows}
-                    """
-                    
-                    sample_result = self._execute_json(query)
-                    
-                    if not sample_result.get("success"):
-                        sheets_data[sheet_name] = {
-                            "error": sample_result.get("error"),
-                            "columns": [],
-                            "rowCount": 0,
-                            "sampleData": []
-                        }
-                        continue
-                    
-                    sample_data = sample_result.get("data", [])
-                    columns = sample_result.get("columns", [])
-                    
-                    # Análise de colunas
-                    columns_info = []
-                    for col in columns:
-                        col_values = [row.get(col) for row in sample_data if row.get(col) is not None]
-                        
-                        columns_info.append({
-                            "name": col,
-                            "type": self._infer_column_type(col_values),
-                            "distinctCount": len(set(str(v) for v in col_values)),
-                            "nonNullCount": len(col_values)
-                        })
-                    
-                    # Obter total de linhas (sem limite)
-                    count_query = f"""
-                    SELECT COUNT(*) as total
-                    FROM read_xlsx('{file_path}', 
-                                  sheet='{sheet_name}', 
-                                  all_varchar=true, 
-                                  ignore_errors=true)
-                    """
-                    count_result = self._execute_json(count_query)
-                    total_rows = count_result.get("data", [{}])[0].get("total", 0) if count_result.get("success") else 0
-                    
-                    sheets_data[sheet_name] = {
-                        "columns": columns_info,
-                        "rowCount": total_rows,
-                        "sampleData": sample_data
-                    }
-                    
+                    # Usar tabela materializada quando disponível
+                    table = self.excel_table(file_id, sheet_name)
+                    source = table
+                    if source is None:
+                        escaped_path = file_path.replace("'", "''")
+                        escaped_sheet = sheet_name.replace("'", "''")
+                        source = f"read_xlsx('{escaped_path}', sheet='{escaped_sheet}', all_varchar=true, ignore_errors=true)"
+
+                    # Contagens, nulos, distintos, min/max e tipos em um único scan
+                    # Each sheet gets the full timeout; cancelling the call cancels all of them
+                    with self._connection() as conn, deadline.spawn().watch(conn):
+                        profile = profile_source(conn, source, sample_rows)
+                    return {"table": table, **profile} if table else profile
+
                 except Exception as e:
                     logger.error(f"Error analyzing sheet {sheet_name}: {e}")
-                    sheets_data[sheet_name] = {
+                    return {
                         "error": str(e),
                         "columns": [],
                         "rowCount": 0,
                         "sampleData": []
                     }
-            
-            wb.close()
+
+            # Sheets are independent, so profile them in parallel on idle executor workers
+            profiles = self._fan_out(profile_sheet, target_sheets, PROFILE_MAX_WORKERS)
+            sheets_data = dict(zip(target_sheets, profiles))
             
             return {
                 "success": True,
-                "fileId": os.path.basename(file_path).replace(".xlsx", ""),
+                "fileId": file_id,
+                "catalog": self.attach_excel_file(file_id),
                 "sheets": sheets_data
             }
             
@@ -386,22 +1043,3 @@ class DatabaseClient:
                 "error": str(e),
                 "sheets": {}
             }
-
-    def _infer_column_type(self, values: list) -> str:
-        """Infer data type from sample values"""
-        if not values:
-            return "VARCHAR"
-        
-        # Tentar inferir tipo baseado nos valores
-        try:
-            # Verificar se todos são números
-            numeric_count = sum(1 for v in values if str(v).replace('.', '', 1).replace('-', '', 1).isdigit())
-            if numeric_count == len(values):
-                # Verificar se tem pontos decimais
-                if any('.' in str(v) for v in values):
-                    return "DOUBLE"
-                return "INTEGER"
-        except:
-            pass
-        
-        return "VARCHAR"
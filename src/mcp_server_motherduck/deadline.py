@@ -0,0 +1,103 @@
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Iterator
+import duckdb
+
+logger = logging.getLogger("mcp_server_motherduck")
+
+
+class QueryTimeoutError(Exception):
+    """Raised when a query is interrupted because its deadline expired"""
+
+    def __init__(self, timeout: float):
+        super().__init__(
+            f"Query timed out after {timeout:g}s and was cancelled. "
+            "Narrow it down (filters, LIMIT, fewer joins) and try again."
+        )
+        self.timeout = timeout
+
+
+class QueryCancelledError(Exception):
+    """Raised when the client gave up on a query before or while it ran"""
+
+    def __init__(self):
+        super().__init__("Query was cancelled by the client")
+
+
+class QueryDeadline:
+    """
+    Interrupts the DuckDB connection running a query when its time runs out
+    or when the caller stops waiting for it.
+
+    The clock starts when the query starts executing, so time spent queued
+    behind other queries does not count. A `timeout` of None or 0 disables
+    the deadline; cancellation still works.
+    """
+
+    def __init__(self, timeout: float | None = None):
+        self.timeout = timeout if timeout and timeout > 0 else None
+        self.timed_out = False
+        self.cancelled = False
+        self._conn: duckdb.DuckDBPyConnection | None = None
+        self._children: list["QueryDeadline"] = []
+        self._lock = threading.Lock()
+
+    def spawn(self) -> "QueryDeadline":
+        """Deadline with the same timeout for one of several statements; cancelling this one cancels it too"""
+        child = QueryDeadline(self.timeout)
+        with self._lock:
+            child.cancelled = self.cancelled
+            self._children.append(child)
+        return child
+
+    @contextmanager
+    def watch(self, conn: duckdb.DuckDBPyConnection) -> Iterator[None]:
+        """Guard the statement executed on `conn` inside the block"""
+        with self._lock:
+            if self.cancelled:
+                raise QueryCancelledError()
+            self._conn = conn
+
+        timer = None
+        if self.timeout is not None:
+            timer = threading.Timer(self.timeout, self._expire)
+            timer.daemon = True
+            timer.start()
+        try:
+            yield
+        except duckdb.InterruptException:
+            if self.timed_out:
+                raise QueryTimeoutError(self.timeout)
+            if self.cancelled:
+                raise QueryCancelledError()
+            raise
+        finally:
+            if timer is not None:
+                timer.cancel()
+            with self._lock:
+                self._conn = None
+
+    def cancel(self) -> None:
+        with self._lock:
+            self.cancelled = True
+            self._interrupt()
+            children = list(self._children)
+        for child in children:
+            child.cancel()
+
+    def _expire(self) -> None:
+        with self._lock:
+            if self._conn is None:
+                return
+            self.timed_out = True
+            logger.warning(f"⏱️ Query exceeded its {self.timeout:g}s deadline, interrupting")
+            self._interrupt()
+
+    def _interrupt(self) -> None:
+        # Called with the lock held
+        if self._conn is not None:
+            try:
+                self._conn.interrupt()
+            except Exception as e:
+                logger.warning(f"Error interrupting query: {e}")
@@ -0,0 +1,445 @@
+import os
+import re
+import json
+import time
+import uuid
+import hashlib
+import logging
+import threading
+from .extensions import ExtensionLoader
+from .metrics import XLSX_PARSE_DURATION
+from .sheet_profile import infer_column_types, profile_source, quote_identifier, typed_select
+from .xlsx_reader import read_sheet_dimensions, read_sheet_names
+
+# Sample rows kept per sheet in the metadata sidecar
+SIDECAR_SAMPLE_ROWS = 20
+
+# Layout of ingested databases; blobs ingested by an older version are re-ingested
+# (2: sheet columns are typed instead of all VARCHAR)
+INGEST_VERSION = 2
+
+# Temporary table holding a sheet as text while its column types are inferred
+RAW_SHEET_TABLE = "temp.__raw_sheet"
+
+# Bytes copied per step when streaming an upload to disk
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# fileIds are generated uuids; anything else must never reach a file path
+FILE_ID_RE = re.compile(r"[A-Za-z0-9_-]+")
+
+logger = logging.getLogger("mcp_server_motherduck")
+
+
+def get_excel_files_path() -> str:
+    """Directory where uploaded Excel files are stored"""
+    # Use /app/excel_files for Railway persistence instead of /tmp
+    return os.getenv("EXCEL_FILES_PATH", "/app/excel_files")
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class UploadTooLargeError(Exception):
+    """Raised when an upload grows past the configured size limit"""
+
+
+class UploadWriter:
+    """
+    Writes an upload to a temporary file chunk by chunk.
+
+    The size limit is enforced and the sha256 computed as bytes arrive, so an
+    upload never has to be held in memory; `commit` atomically renames the
+    finished file into place and `abort` discards it.
+    """
+
+    def __init__(self, directory: str, max_size: int):
+        os.makedirs(directory, exist_ok=True)
+        self.max_size = max_size
+        self.size = 0
+        self._digest = hashlib.sha256()
+        self._tmp_path = os.path.join(
+            directory, f".upload.{os.getpid()}.{threading.get_ident()}.{id(self)}.tmp"
+        )
+        self._file = open(self._tmp_path, "wb")
+
+    @property
+    def content_hash(self) -> str:
+        return self._digest.hexdigest()
+
+    def write(self, chunk: bytes) -> None:
+        self.size += len(chunk)
+        if self.size > self.max_size:
+            raise UploadTooLargeError(
+                f"File size exceeds {self.max_size // (1024*1024)}MB limit"
+            )
+        self._digest.update(chunk)
+        self._file.write(chunk)
+
+    def commit(self, path: str) -> None:
+        self._file.close()
+        os.replace(self._tmp_path, path)
+
+    def abort(self) -> None:
+        self._file.close()
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+
+
+class ExcelStore:
+    """
+    Content-addressed storage of uploaded workbooks and their DuckDB copies.
+
+    Workbooks are stored once per content hash under `blobs/<sha256>.xlsx`,
+    and each fileId is a small `<fileId>.json` alias record pointing at its
+    blob, so re-uploading the same spreadsheet costs only the hash. Each
+    sheet of a blob is parsed once into a table of `blobs/<sha256>.duckdb`,
+    attached read-only so queries scan columnar tables instead of re-reading
+    the workbook XML with `read_xlsx` on every call. Sheet names, dimensions,
+    column profiles and sample rows are computed in the same pass and kept in
+    the `blobs/<sha256>.meta.json` sidecar. Blobs are reference counted by
+    their aliases and deleted with the last one.
+    """
+
+    def __init__(self, base_path: str | None = None, extensions: ExtensionLoader | None = None):
+        self._base_path = base_path
+        self.extensions = extensions or ExtensionLoader()
+        self._locks: dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        # fileId -> content hash, and content hash -> number of aliases
+        self._aliases: dict[str, str] = {}
+        self._refcounts: dict[str, int] | None = None
+        self._refs_lock = threading.RLock()
+
+    @property
+    def base_path(self) -> str:
+        return self._base_path or get_excel_files_path()
+
+    @property
+    def blobs_path(self) -> str:
+        return os.path.join(self.base_path, "blobs").replace("\\", "/")
+
+    def blob_path(self, content_hash: str, extension: str = "xlsx") -> str:
+        # Normalize path separators for DuckDB compatibility
+        return os.path.join(self.blobs_path, f"{content_hash}.{extension}").replace("\\", "/")
+
+    def alias_path(self, file_id: str) -> str:
+        return os.path.join(self.base_path, f"{file_id}.json").replace("\\", "/")
+
+    def legacy_path(self, file_id: str) -> str:
+        """Where workbooks were stored before content addressing"""
+        return os.path.join(self.base_path, f"{file_id}.xlsx").replace("\\", "/")
+
+    def content_hash(self, file_id: str) -> str | None:
+        """Hash of the blob a fileId points at, or None for an unknown fileId"""
+        if not FILE_ID_RE.fullmatch(file_id or ""):
+            return None
+        content_hash = self._aliases.get(file_id)
+        if content_hash is not None:
+            return content_hash
+        try:
+            with open(self.alias_path(file_id), encoding="utf-8") as f:
+                content_hash = json.load(f)["contentHash"]
+        except (OSError, ValueError, KeyError):
+            content_hash = self._adopt_legacy(file_id)
+        if content_hash is not None:
+            self._aliases[file_id] = content_hash
+        return content_hash
+
+    def exists(self, file_id: str) -> bool:
+        content_hash = self.content_hash(file_id)
+        return content_hash is not None and os.path.exists(self.blob_path(content_hash))
+
+    def xlsx_path(self, file_id: str) -> str:
+        content_hash = self.content_hash(file_id)
+        if content_hash is None:
+            return self.legacy_path(file_id)
+        return self.blob_path(content_hash)
+
+    def database_path(self, file_id: str) -> str:
+        return self.blob_path(self.content_hash(file_id) or file_id, "duckdb")
+
+    def metadata_path(self, file_id: str) -> str:
+        return self.blob_path(self.content_hash(file_id) or file_id, "meta.json")
+
+    def catalog_name(self, file_id: str) -> str | None:
+        """Catalog alias under which the ingested blob is attached, shared by all its fileIds"""
+        content_hash = self.content_hash(file_id)
+        if content_hash is None:
+            return None
+        return f"xlsx_{content_hash[:16]}"
+
+    def refcount(self, content_hash: str) -> int:
+        with self._refs_lock:
+            return self._load_refcounts().get(content_hash, 0)
+
+    def _load_refcounts(self) -> dict[str, int]:
+        # Called with the refs lock held; alias records are the source of truth
+        if self._refcounts is None:
+            refcounts: dict[str, int] = {}
+            try:
+                names = os.listdir(self.base_path)
+            except OSError:
+                names = []
+            for name in names:
+                if not name.endswith(".json"):
+                    continue
+                try:
+                    with open(os.path.join(self.base_path, name), encoding="utf-8") as f:
+                        content_hash = json.load(f)["contentHash"]
+                except (OSError, ValueError, KeyError):
+                    continue
+                refcounts[content_hash] = refcounts.get(content_hash, 0) + 1
+            self._refcounts = refcounts
+        return self._refcounts
+
+    def _write_alias(self, file_id: str, content_hash: str, filename: str | None, size: int) -> None:
+        # Called with the refs lock held; counts must be loaded before the new record exists
+        refcounts = self._load_refcounts()
+        alias_path = self.alias_path(file_id)
+        tmp_path = f"{alias_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "fileId": file_id,
+                "contentHash": content_hash,
+                "filename": filename,
+                "size": size,
+                "createdAt": time.time(),
+            }, f)
+        os.replace(tmp_path, alias_path)
+        refcounts[content_hash] = refcounts.get(content_hash, 0) + 1
+        self._aliases[file_id] = content_hash
+
+    def add_upload(self, writer: "UploadWriter", filename: str | None = None) -> tuple[str, bool]:
+        """Store a finished upload under a new fileId; returns the fileId and whether the blob already existed"""
+        content_hash = writer.content_hash
+        blob_path = self.blob_path(content_hash)
+        file_id = str(uuid.uuid4())
+        with self._refs_lock:
+            deduplicated = os.path.exists(blob_path)
+            if deduplicated:
+                writer.abort()
+            else:
+                writer.commit(blob_path)
+            self._write_alias(file_id, content_hash, filename, writer.size)
+        return file_id, deduplicated
+
+    def _adopt_legacy(self, file_id: str) -> str | None:
+        """Move a workbook stored as `<fileId>.xlsx` into the blob store"""
+        legacy_path = self.legacy_path(file_id)
+        if not os.path.exists(legacy_path):
+            return None
+        try:
+            content_hash = file_sha256(legacy_path)
+            with self._refs_lock:
+                if not os.path.exists(legacy_path):
+                    return self._aliases.get(file_id)
+                os.makedirs(self.blobs_path, exist_ok=True)
+                if os.path.exists(self.blob_path(content_hash)):
+                    os.remove(legacy_path)
+                else:
+                    os.replace(legacy_path, self.blob_path(content_hash))
+                self._write_alias(file_id, content_hash, None, os.path.getsize(self.blob_path(content_hash)))
+                # Derived files of the old layout are rebuilt per blob
+                for extension in ("duckdb", "meta.json"):
+                    old_path = os.path.join(self.base_path, f"{file_id}.{extension}")
+                    if os.path.exists(old_path):
+                        os.remove(old_path)
+        except OSError as e:
+            logger.warning(f"⚠️ Could not move workbook {file_id} into the blob store: {e}")
+            return None
+        logger.info(f"📦 Moved workbook {file_id} into blob {content_hash[:12]}")
+        return content_hash
+
+    def remove(self, file_id: str) -> tuple[bool, str | None]:
+        """
+        Drop a fileId alias. Returns whether it existed and, if it was the
+        last reference to its blob, the content hash of the deleted blob.
+        """
+        content_hash = self.content_hash(file_id)
+        if content_hash is None:
+            return False, None
+        with self._refs_lock:
+            try:
+                os.remove(self.alias_path(file_id))
+            except FileNotFoundError:
+                return False, None
+            self._aliases.pop(file_id, None)
+            refcounts = self._load_refcounts()
+            refcounts[content_hash] = max(refcounts.get(content_hash, 0) - 1, 0)
+            if refcounts[content_hash] > 0:
+                return True, None
+            del refcounts[content_hash]
+            for extension in ("xlsx", "duckdb", "meta.json"):
+                path = self.blob_path(content_hash, extension)
+                if os.path.exists(path):
+                    os.remove(path)
+        logger.info(f"🗑️ Deleted blob {content_hash[:12]}, no fileIds left")
+        return True, content_hash
+
+    def is_ingested(self, file_id: str) -> bool:
+        if not os.path.exists(self.database_path(file_id)):
+            return False
+        return self.load_metadata(file_id) is not None
+
+    def load_metadata(self, file_id: str) -> dict | None:
+        """Sidecar of an ingested workbook, or None if missing or stale"""
+        try:
+            with open(self.metadata_path(file_id), encoding="utf-8") as f:
+                metadata = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if metadata.get("version") != INGEST_VERSION:
+            return None
+
+        # Re-ingest if the workbook was replaced after materialization
+        try:
+            st = os.stat(self.xlsx_path(file_id))
+        except OSError:
+            return metadata
+        if (st.st_size, st.st_mtime_ns) != (metadata.get("size"), metadata.get("mtimeNs")):
+            return None
+        return metadata
+
+    def sheet_names(self, file_id: str) -> list[str]:
+        return read_sheet_names(self.xlsx_path(file_id))
+
+    def sheet_summary(self, file_id: str) -> list[dict]:
+        """Name, position and dimensions of every sheet of a workbook"""
+        metadata = self.load_metadata(file_id)
+        if metadata is not None:
+            return [
+                {
+                    "name": sheet["name"],
+                    "index": sheet["index"],
+                    "rowCount": sheet["rowCount"],
+                    "columnCount": sheet["columnCount"],
+                }
+                for sheet in metadata["sheets"]
+            ]
+
+        # Not ingested yet: read the dimensions from the zip without loading the workbook
+        sheets = read_sheet_dimensions(self.xlsx_path(file_id))
+        for sheet in sheets:
+            # Dimensions count the header row
+            sheet["rowCount"] = max(sheet["rowCount"] - 1, 0)
+        return sheets
+
+    def _lock_for(self, file_id: str) -> threading.Lock:
+        # Aliases of the same blob share one ingestion
+        key = self.content_hash(file_id) or file_id
+        with self._locks_guard:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def ensure_ingested(self, file_id: str) -> str | None:
+        """Return the path of the ingested database, materializing it on first access"""
+        if self.is_ingested(file_id):
+            return self.database_path(file_id)
+        if not self.exists(file_id):
+            return None
+
+        with self._lock_for(file_id):
+            # Another thread may have finished ingestion while we were waiting
+            if self.is_ingested(file_id):
+                return self.database_path(file_id)
+            try:
+                self.ingest(file_id)
+            except Exception as e:
+                logger.warning(f"⚠️ Could not ingest workbook {file_id}: {e}")
+                return None
+        return self.database_path(file_id)
+
+    def ingest(self, file_id: str) -> list[str]:
+        """Parse every sheet of the workbook into a table of its own DuckDB database"""
+        xlsx_path = self.xlsx_path(file_id)
+        db_path = self.database_path(file_id)
+        tmp_suffix = f"{os.getpid()}.{threading.get_ident()}.tmp"
+        tmp_path = f"{db_path}.{tmp_suffix}"
+        st = os.stat(xlsx_path)
+
+        sheets = self.sheet_names(file_id)
+        logger.info(f"📥 Ingesting {len(sheets)} sheet(s) from {xlsx_path}")
+
+        conn = self.extensions.connect(tmp_path)
+        ingested = []
+        sheets_metadata = []
+        try:
+            for index, sheet_name in enumerate(sheets):
+                try:
+                    # Read as text first, since cell types within a column are not consistent
+                    with XLSX_PARSE_DURATION.time():
+                        conn.execute(
+                            f"CREATE OR REPLACE TEMP TABLE {RAW_SHEET_TABLE} AS "
+                            "SELECT * FROM read_xlsx(?, sheet=?, all_varchar=true, ignore_errors=true)",
+                            [xlsx_path, sheet_name],
+                        )
+                    # Columns whose values all cast cleanly are stored typed, so queries
+                    # aggregate, filter and sort numbers and dates without casting
+                    cell_types = [
+                        row[1] for row in conn.execute(
+                            "DESCRIBE SELECT * FROM read_xlsx(?, sheet=?, ignore_errors=true)",
+                            [xlsx_path, sheet_name],
+                        ).fetchall()
+                    ]
+                    columns = infer_column_types(conn, RAW_SHEET_TABLE, cell_types)
+                    conn.execute(
+                        f"CREATE TABLE {quote_identifier(sheet_name)} AS "
+                        f"SELECT {typed_select(columns)} FROM {RAW_SHEET_TABLE}"
+                    )
+                    conn.execute(f"DROP TABLE {RAW_SHEET_TABLE}")
+                    ingested.append(sheet_name)
+                    # Profile while the table is hot so structure discovery never rescans it
+                    profile = profile_source(
+                        conn, quote_identifier(sheet_name), SIDECAR_SAMPLE_ROWS
+                    )
+                    sheets_metadata.append({
+                        "name": sheet_name,
+                        "index": index,
+                        "rowCount": profile["rowCount"],
+                        "columnCount": len(profile["columns"]),
+                        "columns": profile["columns"],
+                        "sampleData": profile["sampleData"],
+                    })
+                except Exception as e:
+                    # Empty or malformed sheets keep being served by read_xlsx
+                    logger.warning(f"⚠️ Skipping sheet {sheet_name} of {file_id}: {e}")
+                    sheets_metadata.append({
+                        "name": sheet_name,
+                        "index": index,
+                        "rowCount": 0,
+                        "columnCount": 0,
+                        "columns": [],
+                        "sampleData": [],
+                        "error": str(e),
+                    })
+            conn.execute("CHECKPOINT")
+        except Exception:
+            conn.close()
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        conn.close()
+
+        metadata = {
+            "version": INGEST_VERSION,
+            "contentHash": self.content_hash(file_id),
+            "size": st.st_size,
+            "mtimeNs": st.st_mtime_ns,
+            "ingestedAt": time.time(),
+            "sampleRows": SIDECAR_SAMPLE_ROWS,
+            "sheets": sheets_metadata,
+        }
+        metadata_path = self.metadata_path(file_id)
+        metadata_tmp_path = f"{metadata_path}.{tmp_suffix}"
+        with open(metadata_tmp_path, "w", encoding="utf-8") as f:
+            json.dump(metadata, f, default=str)
+
+        # Atomic renames so concurrent readers never see a half-written database
+        os.replace(tmp_path, db_path)
+        os.replace(metadata_tmp_path, metadata_path)
+        logger.info(f"✅ Ingested {len(ingested)} sheet(s) into {db_path}")
+        return ingested
@@ -0,0 +1,255 @@
+import math
+import time
+import logging
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Iterator, TypeVar
+import anyio
+from .deadline import QueryDeadline
+from .metrics import QUERY_QUEUE_WAIT
+from .sessions import current_session_key
+
+logger = logging.getLogger("mcp_server_motherduck")
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+# Weight of the latest call in the moving average of service times
+SERVICE_TIME_ALPHA = 0.2
+
+# Seconds spent queued by the calls of the current tool call
+_queue_wait: ContextVar[list[float] | None] = ContextVar("queue_wait", default=None)
+
+
+class QueryQueueFullError(Exception):
+    """Raised when the executor queue has no room for another call"""
+
+    def __init__(self, queue_depth: int, retry_after: int):
+        super().__init__(
+            f"Server busy: {queue_depth} queries already queued, retry after {retry_after}s"
+        )
+        self.queue_depth = queue_depth
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    def __init__(self):
+        self.event = anyio.Event()
+        self.granted = False
+
+
+class QueryExecutor:
+    """
+    Runs blocking database calls on a bounded pool of worker threads.
+
+    At most `max_concurrency` calls execute at once; up to `max_queue` more
+    wait for a free worker, and anything beyond that is rejected with an
+    estimate of when to retry instead of piling up on the event loop.
+
+    Free workers are handed out round-robin across MCP sessions, and a
+    session runs at most `max_per_session` calls at a time, so one agent
+    firing a burst of queries cannot starve the others. Calls made outside
+    a session share a single queue without a per-session cap.
+
+    A running call can spread independent work over workers that are idle
+    with `map`; those count against `max_concurrency` like any other call.
+    """
+
+    def __init__(self, max_concurrency: int = 4, max_queue: int = 32, max_per_session: int = 1):
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_per_session = max_per_session
+        self._active = 0
+        self._active_by_session: dict[int | None, int] = {}
+        # Waiting calls per session, in the order sessions get their next turn
+        self._queues: OrderedDict[int | None, deque[_Waiter]] = OrderedDict()
+        self._queued = 0
+        self._service_time = 0.0
+        self._limiter = anyio.CapacityLimiter(max_concurrency)
+        # Shared by every map() call; the calling worker is the remaining slot
+        self._fan_out = ThreadPoolExecutor(
+            max_workers=max(max_concurrency - 1, 1), thread_name_prefix="query-fan-out"
+        )
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queued
+
+    @property
+    def retry_after(self) -> int:
+        """Seconds until the queue has likely drained enough to accept a call"""
+        backlog = (self._queued + 1) / self.max_concurrency
+        return max(1, math.ceil(backlog * self._service_time))
+
+    @staticmethod
+    @contextmanager
+    def track_queue_wait() -> Iterator[list[float]]:
+        """Collect the queue wait of every call made inside the block"""
+        waits: list[float] = []
+        token = _queue_wait.set(waits)
+        try:
+            yield waits
+        finally:
+            _queue_wait.reset(token)
+
+    @staticmethod
+    def queue_wait_ms() -> int:
+        """Milliseconds the current tool call has spent queued so far"""
+        return int(sum(_queue_wait.get() or ()) * 1000)
+
+    def _may_run(self, key: int | None) -> bool:
+        if self._active >= self.max_concurrency:
+            return False
+        return key is None or self._active_by_session.get(key, 0) < self.max_per_session
+
+    def _start(self, key: int | None) -> None:
+        self._active += 1
+        self._active_by_session[key] = self._active_by_session.get(key, 0) + 1
+
+    def _dispatch(self) -> None:
+        """Hand free workers to waiting calls, one session at a time"""
+        while self._active < self.max_concurrency:
+            for key, queue in self._queues.items():
+                if self._may_run(key):
+                    break
+            else:
+                return
+            waiter = queue.popleft()
+            self._queued -= 1
+            if queue:
+                # Back of the line for this session's next call
+                self._queues.move_to_end(key)
+            else:
+                del self._queues[key]
+            self._start(key)
+            waiter.granted = True
+            waiter.event.set()
+
+    def _finish(self, key: int | None) -> None:
+        self._active -= 1
+        remaining = self._active_by_session[key] - 1
+        if remaining:
+            self._active_by_session[key] = remaining
+        else:
+            del self._active_by_session[key]
+        self._dispatch()
+
+    def _borrow(self, wanted: int) -> int:
+        """Take up to `wanted` idle workers for a running call, never ahead of queued calls"""
+        if self._queues:
+            return 0
+        granted = max(min(wanted, self.max_concurrency - self._active), 0)
+        self._active += granted
+        return granted
+
+    def _give_back(self, count: int) -> None:
+        self._active -= count
+        self._dispatch()
+
+    async def _admit(self, key: int | None) -> None:
+        if not self._queues and self._may_run(key):
+            self._start(key)
+            return
+        if self._queued >= self.max_queue:
+            raise QueryQueueFullError(self._queued, self.retry_after)
+
+        waiter = _Waiter()
+        self._queues.setdefault(key, deque()).append(waiter)
+        self._queued += 1
+        self._dispatch()
+        try:
+            await waiter.event.wait()
+        except BaseException:
+            if waiter.granted:
+                self._finish(key)
+            else:
+                queue = self._queues[key]
+                queue.remove(waiter)
+                self._queued -= 1
+                if not queue:
+                    del self._queues[key]
+            raise
+
+    async def run(
+        self, func: Callable[..., T], *args: Any, deadline: QueryDeadline | None = None
+    ) -> T:
+        """
+        Run `func(*args)` on a worker thread. With a `deadline`, cancelling the
+        caller (e.g. the MCP client cancelling its request) interrupts the query
+        instead of waiting for it to finish.
+        """
+        key = current_session_key()
+        queued_at = time.perf_counter()
+        await self._admit(key)
+        started_at = time.perf_counter()
+        wait = started_at - queued_at
+        QUERY_QUEUE_WAIT.observe(wait)
+        waits = _queue_wait.get()
+        if waits is not None:
+            waits.append(wait)
+
+        try:
+            return await anyio.to_thread.run_sync(
+                func,
+                *args,
+                abandon_on_cancel=deadline is not None,
+                limiter=self._limiter,
+            )
+        except anyio.get_cancelled_exc_class():
+            if deadline is not None:
+                logger.info("🛑 Request cancelled, interrupting its query")
+                deadline.cancel()
+            raise
+        finally:
+            elapsed = time.perf_counter() - started_at
+            self._service_time += SERVICE_TIME_ALPHA * (elapsed - self._service_time)
+            self._finish(key)
+
+    def map(self, func: Callable[[T], R], items: list[T], max_workers: int | None = None) -> list[R]:
+        """
+        Apply `func` to each item from inside a call running on this executor,
+        using up to `max_workers` threads including the caller's own. Extra
+        threads only take workers that are idle and not owed to queued calls;
+        with none free, or outside an executor call, the items run in turn.
+        """
+        wanted = min(len(items), max_workers or len(items)) - 1
+        try:
+            borrowed = anyio.from_thread.run_sync(self._borrow, wanted) if wanted > 0 else 0
+        except RuntimeError:
+            # Not on one of this executor's worker threads
+            borrowed = 0
+        if borrowed == 0:
+            return [func(item) for item in items]
+
+        results: list = [None] * len(items)
+        pending = iter(enumerate(items))
+        lock = threading.Lock()
+
+        def work() -> None:
+            while True:
+                with lock:
+                    entry = next(pending, None)
+                if entry is None:
+                    return
+                index, item = entry
+                results[index] = func(item)
+
+        futures = [self._fan_out.submit(work) for _ in range(borrowed)]
+        try:
+            work()
+        finally:
+            for future in futures:
+                future.exception()
+            anyio.from_thread.run_sync(self._give_back, borrowed)
+        for future in futures:
+            future.result()
+        return results
@@ -0,0 +1,117 @@
+import io
+import time
+import logging
+import threading
+from contextlib import redirect_stdout, redirect_stderr
+import duckdb
+from .configs import SERVER_VERSION
+
+logger = logging.getLogger("mcp_server_motherduck")
+
+# Extensions every connection needs, plus the ones specific to a database type
+REQUIRED_EXTENSIONS = ("excel",)
+DB_TYPE_EXTENSIONS = {
+    "s3": ("httpfs",),
+    "motherduck": ("motherduck",),
+}
+# Everything a deployment may need, installed by `--install-extensions`
+BUNDLED_EXTENSIONS = ("excel", "httpfs", "motherduck")
+
+
+def extensions_for(db_type: str) -> tuple[str, ...]:
+    return REQUIRED_EXTENSIONS + DB_TYPE_EXTENSIONS.get(db_type, ())
+
+
+class MissingExtensionError(RuntimeError):
+    """Raised at startup when an extension is not installed and may not be downloaded"""
+
+    def __init__(self, names: list[str], directory: str | None):
+        location = directory or "the default DuckDB extension directory"
+        super().__init__(
+            f"DuckDB extension(s) {', '.join(names)} not found in {location}. "
+            "Bundle them with `--install-extensions` or allow downloads by dropping `--offline-extensions`."
+        )
+        self.names = names
+
+
+class ExtensionLoader:
+    """
+    Installs the DuckDB extensions the server needs once at startup and
+    loads them on every connection it opens.
+
+    All connections share one config, with `extension_directory` pointing at
+    the bundled extensions when given, so loading is a local file read, and
+    any extra `settings` such as resource limits applied. With
+    `offline` nothing is ever downloaded: a missing extension fails startup
+    instead of the first query, and DuckDB's own autoinstall is disabled.
+    """
+
+    def __init__(
+        self, directory: str | None = None, offline: bool = False, settings: dict | None = None
+    ):
+        self.directory = directory
+        self.offline = offline
+        self.settings = settings or {}
+        self._extensions: tuple[str, ...] = ()
+        self._lock = threading.Lock()
+
+    def config(self) -> dict:
+        """Config for `duckdb.connect`, identical for every connection of the process"""
+        config = {"custom_user_agent": f"mcp-server-motherduck/{SERVER_VERSION}", **self.settings}
+        if self.directory:
+            config["extension_directory"] = self.directory
+        if self.offline:
+            config["autoinstall_known_extensions"] = False
+        return config
+
+    def connect(self, database: str = ":memory:", read_only: bool = False) -> duckdb.DuckDBPyConnection:
+        """Open a connection with the shared config and the prepared extensions loaded"""
+        conn = duckdb.connect(database, config=self.config(), read_only=read_only)
+        try:
+            self.load(conn)
+        except Exception:
+            conn.close()
+            raise
+        return conn
+
+    def installed(self, names: tuple[str, ...]) -> set[str]:
+        conn = duckdb.connect(":memory:", config=self.config())
+        try:
+            rows = conn.execute(
+                "SELECT extension_name FROM duckdb_extensions() WHERE installed AND list_contains(?, extension_name)",
+                [list(names)],
+            ).fetchall()
+        finally:
+            conn.close()
+        return {row[0] for row in rows}
+
+    def prepare(self, names: tuple[str, ...]) -> None:
+        """Make sure `names` are installed, downloading missing ones unless offline"""
+        with self._lock:
+            names = tuple(dict.fromkeys(self._extensions + tuple(names)))
+            installed = self.installed(names)
+            missing = [name for name in names if name not in installed]
+            if missing and self.offline:
+                raise MissingExtensionError(missing, self.directory)
+            if missing:
+                self.install(missing)
+            self._extensions = names
+
+    def install(self, names: list[str]) -> None:
+        start_time = time.perf_counter()
+        conn = duckdb.connect(":memory:", config=self.config())
+        try:
+            # INSTALL prints download progress
+            null_file = io.StringIO()
+            with redirect_stdout(null_file), redirect_stderr(null_file):
+                for name in names:
+                    conn.execute(f"INSTALL {name};")
+        finally:
+            conn.close()
+        logger.info(
+            f"📦 Installed DuckDB extension(s) {', '.join(names)} in {time.perf_counter() - start_time:.2f}s"
+        )
+
+    def load(self, conn: duckdb.DuckDBPyConnection) -> None:
+        for name in self._extensions:
+            conn.execute(f"LOAD {name};")
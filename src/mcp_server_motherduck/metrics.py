@@ -0,0 +1,200 @@
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+# Bucket bounds, in seconds for latencies and raw counts/bytes otherwise
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+ROW_BUCKETS = (0, 1, 10, 100, 500, 1000, 5000, 10000, 100000)
+BYTE_BUCKETS = tuple(4**i * 1024 for i in range(11))  # 1 KiB .. 1 GiB
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: tuple[tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(str(v))}"' for k, v in labels) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    """A named metric with optional labels, rendered in the Prometheus text format"""
+
+    type_name = "untyped"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple[tuple[str, str], ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple((name, str(labels[name])) for name in self.labelnames)
+
+    def samples(self) -> Iterator[tuple[str, tuple, float]]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.help_text}",
+            f"# TYPE {self.name} {self.type_name}",
+        ]
+        for name, labels, value in self.samples():
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class _ValueMetric(Metric):
+    """A metric holding one value per label set, or computed by a function at scrape time"""
+
+    def __init__(self, name, help_text, labelnames=(), function: Callable[[], float] | None = None):
+        super().__init__(name, help_text, labelnames)
+        self._values: dict[tuple, float] = {}
+        self._function = function
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        self._function = function
+
+    def samples(self):
+        if self._function is not None:
+            yield self.name, (), self._function()
+            return
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in values:
+            yield self.name, labels, value
+
+
+class Counter(_ValueMetric):
+    type_name = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_ValueMetric):
+    type_name = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    type_name = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # labels -> (per-bucket counts, sum, count)
+        self._values: dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with self._lock:
+            values = [(labels, list(entry[0]), entry[1], entry[2]) for labels, entry in self._values.items()]
+        for labels, counts, total, count in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = "+Inf" if math.isinf(bound) else _format_value(bound)
+                yield f"{self.name}_bucket", labels + (("le", le),), cumulative
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, count
+
+
+class MetricsRegistry:
+    """Collects metrics and renders them for the `/metrics` endpoint"""
+
+    def __init__(self):
+        self._metrics: dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        with self._lock:
+            # Re-registering keeps the existing series, e.g. when the app is rebuilt
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help_text, labelnames=(), function=None) -> Counter:
+        counter = self.register(Counter(name, help_text, labelnames))
+        if function is not None:
+            counter.set_function(function)
+        return counter
+
+    def gauge(self, name, help_text, labelnames=(), function=None) -> Gauge:
+        gauge = self.register(Gauge(name, help_text, labelnames))
+        if function is not None:
+            gauge.set_function(function)
+        return gauge
+
+    def histogram(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help_text, labelnames, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+TOOL_CALLS = REGISTRY.counter(
+    "mcp_tool_calls_total", "MCP tool calls by tool and outcome", ("tool", "status")
+)
+TOOL_CALL_DURATION = REGISTRY.histogram(
+    "mcp_tool_call_duration_seconds", "Latency of MCP tool calls", ("tool",)
+)
+TOOL_ROWS_RETURNED = REGISTRY.histogram(
+    "mcp_tool_rows_returned", "Rows returned per tool call", ("tool",), ROW_BUCKETS
+)
+TOOL_RESPONSE_BYTES = REGISTRY.histogram(
+    "mcp_tool_response_bytes", "Size of tool call responses", ("tool",), BYTE_BUCKETS
+)
+QUERY_QUEUE_WAIT = REGISTRY.histogram(
+    "query_queue_wait_seconds", "Time calls spent waiting for a free worker"
+)
+XLSX_PARSE_DURATION = REGISTRY.histogram(
+    "excel_read_xlsx_duration_seconds", "Time spent parsing a sheet with read_xlsx during ingestion"
+)
+UPLOAD_BYTES = REGISTRY.histogram(
+    "excel_upload_bytes", "Size of uploaded workbooks", buckets=BYTE_BUCKETS
+)
+UPLOAD_DURATION = REGISTRY.histogram(
+    "excel_upload_duration_seconds", "Time to receive, store and ingest an upload"
+)
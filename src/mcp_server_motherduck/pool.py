@@ -0,0 +1,140 @@
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Callable, Iterator
+import duckdb
+
+logger = logging.getLogger("mcp_server_motherduck")
+
+
+class PooledConnection:
+    """A pooled DuckDB connection and the bookkeeping that travels with it"""
+
+    def __init__(self, conn: duckdb.DuckDBPyConnection, generation: int):
+        self.conn = conn
+        self.generation = generation
+        self.released_at = time.monotonic()
+        # Excel catalogs already attached on this connection
+        self.catalogs: set[str] = set()
+
+
+class ReadOnlyConnectionPool:
+    """
+    Reuses read-only connections to a local DuckDB file across queries.
+
+    Connections are discarded when the database file changes on disk
+    (mtime/size of the file and its WAL), so writes made by other processes
+    become visible, and idle connections are closed after `idle_timeout`
+    seconds so those writers can take the file lock between bursts.
+    """
+
+    def __init__(
+        self,
+        connect: Callable[[], duckdb.DuckDBPyConnection],
+        db_path: str,
+        max_size: int = 4,
+        idle_timeout: float = 5.0,
+    ):
+        self._connect = connect
+        self._db_path = db_path
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self._idle: list[PooledConnection] = []
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._fingerprint = self._file_fingerprint()
+        self._reaper: threading.Thread | None = None
+
+    def _file_fingerprint(self) -> tuple:
+        fingerprint = []
+        for path in (self._db_path, f"{self._db_path}.wal"):
+            try:
+                st = os.stat(path)
+                fingerprint.append((st.st_mtime_ns, st.st_size))
+            except OSError:
+                fingerprint.append(None)
+        return tuple(fingerprint)
+
+    def _check_fingerprint(self) -> list[PooledConnection]:
+        """Bump the generation if the file changed; returns idle connections to close"""
+        fingerprint = self._file_fingerprint()
+        if fingerprint == self._fingerprint:
+            return []
+        logger.info("🔄 Database file changed on disk, recycling read-only connections")
+        self._fingerprint = fingerprint
+        self._generation += 1
+        stale, self._idle = self._idle, []
+        return stale
+
+    def acquire(self) -> PooledConnection:
+        with self._lock:
+            stale = self._check_fingerprint()
+            pooled = self._idle.pop() if self._idle else None
+            generation = self._generation
+        self._close_all(stale)
+
+        if pooled is None:
+            pooled = PooledConnection(self._connect(), generation)
+        return pooled
+
+    def release(self, pooled: PooledConnection) -> None:
+        with self._lock:
+            stale = self._check_fingerprint()
+            keep = (
+                pooled.generation == self._generation
+                and len(self._idle) < self.max_size
+            )
+            if keep:
+                pooled.released_at = time.monotonic()
+                self._idle.append(pooled)
+                self._start_reaper()
+        if not keep:
+            stale.append(pooled)
+        self._close_all(stale)
+
+    @contextmanager
+    def connection(self) -> Iterator[PooledConnection]:
+        pooled = self.acquire()
+        try:
+            yield pooled
+        finally:
+            self.release(pooled)
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        self._close_all(idle)
+
+    def _close_all(self, connections: list[PooledConnection]) -> None:
+        for pooled in connections:
+            try:
+                pooled.conn.close()
+            except Exception as e:
+                logger.warning(f"Error closing pooled connection: {e}")
+
+    def _start_reaper(self) -> None:
+        # Called with the lock held
+        if self._reaper is None or not self._reaper.is_alive():
+            self._reaper = threading.Thread(
+                target=self._reap_idle, name="duckdb-pool-reaper", daemon=True
+            )
+            self._reaper.start()
+
+    def _reap_idle(self) -> None:
+        """Close connections idle for longer than `idle_timeout`, exiting once the pool is empty"""
+        while True:
+            time.sleep(max(self.idle_timeout / 2, 0.05))
+            now = time.monotonic()
+            with self._lock:
+                expired = [
+                    p for p in self._idle if now - p.released_at >= self.idle_timeout
+                ]
+                self._idle = [p for p in self._idle if p not in expired]
+                done = not self._idle
+                if done:
+                    self._reaper = None
+            self._close_all(expired)
+            if done:
+                return
@@ -0,0 +1,125 @@
+import json
+import logging
+import os
+import tempfile
+from contextlib import contextmanager
+from typing import Iterator
+import duckdb
+
+logger = logging.getLogger("mcp_server_motherduck")
+
+# Operators listed in `hotspots`, slowest first
+HOTSPOT_COUNT = 3
+
+# Vectors of 2048 rows pulled per chunk while draining a profiled result
+DRAIN_VECTORS = 16
+
+
+class QueryProfile:
+    """Holds DuckDB's JSON profile of the statement run inside `profiling()`"""
+
+    def __init__(self):
+        self.raw: dict | None = None
+
+    def summary(self) -> dict | None:
+        return summarize(self.raw) if self.raw is not None else None
+
+
+@contextmanager
+def profiling(conn: duckdb.DuckDBPyConnection) -> Iterator[QueryProfile]:
+    """
+    Profile the statement executed on `conn` inside the block.
+
+    Profiling settings are per connection, so concurrent queries on other
+    connections are unaffected. DuckDB only writes the profile once the
+    statement has run to completion; use `drain` after a partial fetch.
+    """
+    fd, path = tempfile.mkstemp(prefix="mcp-profile-", suffix=".json")
+    os.close(fd)
+    profile = QueryProfile()
+    escaped_path = path.replace("'", "''")
+    try:
+        conn.execute(f"SET profiling_output = '{escaped_path}'")
+        conn.execute("SET enable_profiling = 'json'")
+        try:
+            yield profile
+        finally:
+            conn.execute("RESET enable_profiling")
+            conn.execute("RESET profiling_output")
+        if os.path.getsize(path):
+            with open(path) as f:
+                profile.raw = json.load(f)
+    finally:
+        try:
+            os.remove(path)
+        except OSError as e:
+            logger.warning(f"Could not remove query profile {path}: {e}")
+
+
+def drain(q: duckdb.DuckDBPyConnection) -> None:
+    """Run a partially fetched result to completion without building Python rows"""
+    while len(q.fetch_df_chunk(DRAIN_VECTORS)):
+        pass
+
+
+def _ms(seconds: float | None) -> float:
+    return round((seconds or 0.0) * 1000, 3)
+
+
+def _is_read_xlsx(node: dict) -> bool:
+    extra = node.get("extra_info") or {}
+    return extra.get("Function") == "READ_XLSX" or node.get("operator_name", "").strip() == "READ_XLSX"
+
+
+def _operator(node: dict, operators: list[dict]) -> dict:
+    entry = {
+        "operator": node.get("operator_name", "").strip() or node.get("operator_type", ""),
+        "timingMs": _ms(node.get("operator_timing")),
+        "cardinality": node.get("operator_cardinality", 0),
+    }
+    if node.get("operator_rows_scanned"):
+        entry["rowsScanned"] = node["operator_rows_scanned"]
+    if node.get("extra_info"):
+        entry["details"] = node["extra_info"]
+    operators.append(entry)
+    children = [_operator(child, operators) for child in node.get("children", [])]
+    if children:
+        entry["children"] = children
+    # Kept out of the tree; only used for the read_xlsx split
+    entry["_readXlsx"] = _is_read_xlsx(node)
+    return entry
+
+
+def summarize(raw: dict) -> dict:
+    """
+    Operator tree with per-operator timings and cardinalities, plus the share
+    of operator time spent reading workbooks with `read_xlsx`.
+    """
+    operators: list[dict] = []
+    plan = [_operator(child, operators) for child in raw.get("children", [])]
+
+    total = sum((op["timingMs"] for op in operators), 0.0)
+    read_xlsx = sum((op["timingMs"] for op in operators if op["_readXlsx"]), 0.0)
+    hotspots = sorted(operators, key=lambda op: op["timingMs"], reverse=True)[:HOTSPOT_COUNT]
+    hotspots = [
+        {
+            "operator": op["operator"],
+            "timingMs": op["timingMs"],
+            "share": round(op["timingMs"] / total, 3) if total else 0.0,
+        }
+        for op in hotspots
+        if op["timingMs"] > 0
+    ]
+    for op in operators:
+        del op["_readXlsx"]
+
+    return {
+        "latencyMs": _ms(raw.get("latency")),
+        "rowsReturned": raw.get("rows_returned", 0),
+        "peakBufferMemoryBytes": raw.get("system_peak_buffer_memory", 0),
+        "operatorTimeMs": round(total, 3),
+        "readXlsxMs": round(read_xlsx, 3),
+        "readXlsxShare": round(read_xlsx / total, 3) if total else 0.0,
+        "hotspots": hotspots,
+        "plan": plan,
+    }
@@ -0,0 +1,115 @@
+from typing import Iterable
+
+# Text tables for the plain-text query path. Rows arrive in batches and are
+# rendered to strings once, with widths tracked per column as they stream in,
+# so output size is bounded by the row and column-width budgets rather than
+# by the result.
+
+TABLE_FORMATS = ("pretty", "markdown")
+DEFAULT_MAX_WIDTH = 40
+ELLIPSIS = "…"
+
+_NUMERIC_TYPES = (
+    "TINYINT", "SMALLINT", "INTEGER", "BIGINT", "HUGEINT",
+    "UTINYINT", "USMALLINT", "UINTEGER", "UBIGINT", "UHUGEINT",
+    "FLOAT", "DOUBLE", "DECIMAL",
+)
+
+
+def is_numeric(type_name: str) -> bool:
+    return type_name.upper().startswith(_NUMERIC_TYPES)
+
+
+def format_cell(value: object, max_width: int) -> str:
+    text = "NULL" if value is None else str(value)
+    if "\n" in text or "\r" in text:
+        text = text.replace("\r\n", "\\n").replace("\n", "\\n").replace("\r", "\\n")
+    if max_width and len(text) > max_width:
+        text = text[: max(max_width - 1, 0)] + ELLIPSIS
+    return text
+
+
+class TableRenderer:
+    """
+    Renders a query result as a `pretty` box table or a compact `markdown` table.
+
+    Feed row batches with `add_rows`; each cell is cut to `max_width`
+    characters with a trailing ellipsis. `render` emits the table, plus a
+    marker line when the caller stopped before the end of the result.
+    """
+
+    def __init__(
+        self,
+        columns: list[str],
+        types: list[str],
+        table_format: str = "pretty",
+        max_width: int = DEFAULT_MAX_WIDTH,
+    ):
+        if table_format not in TABLE_FORMATS:
+            raise ValueError(f"Unknown table format '{table_format}', expected one of {', '.join(TABLE_FORMATS)}")
+        self.table_format = table_format
+        self.max_width = max_width
+        self.columns = [format_cell(c, max_width) for c in columns]
+        self.types = [format_cell(t, max_width) for t in types]
+        self.numeric = [is_numeric(t) for t in types]
+        self.rows: list[list[str]] = []
+        if table_format == "pretty":
+            self.widths = [max(len(c), len(t)) for c, t in zip(self.columns, self.types)]
+        else:
+            self.widths = [max(len(c), 3) for c in self.columns]
+
+    def add_rows(self, batch: Iterable[tuple]) -> None:
+        escape = self.table_format == "markdown"
+        cells = [
+            [
+                format_cell(value, self.max_width).replace("|", "\\|") if escape
+                else format_cell(value, self.max_width)
+                for value in row
+            ]
+            for row in batch
+        ]
+        if not cells:
+            return
+        self.rows.extend(cells)
+        # Column-wise over the batch instead of cell by cell
+        self.widths = [
+            max(width, max(map(len, column)))
+            for width, column in zip(self.widths, zip(*cells))
+        ]
+
+    def _align(self, text: str, index: int) -> str:
+        width = self.widths[index]
+        return text.rjust(width) if self.numeric[index] else text.ljust(width)
+
+    def _render_pretty(self) -> list[str]:
+        border = "+" + "+".join("-" * (w + 2) for w in self.widths) + "+"
+        lines = [
+            border,
+            "| " + " | ".join(c.center(w) for c, w in zip(self.columns, self.widths)) + " |",
+            "| " + " | ".join(t.center(w) for t, w in zip(self.types, self.widths)) + " |",
+            border,
+        ]
+        for row in self.rows:
+            lines.append("| " + " | ".join(self._align(v, i) for i, v in enumerate(row)) + " |")
+        if self.rows:
+            lines.append(border)
+        return lines
+
+    def _render_markdown(self) -> list[str]:
+        separator = [
+            "-" * (w - 1) + ":" if numeric else "-" * w
+            for w, numeric in zip(self.widths, self.numeric)
+        ]
+        lines = [
+            "| " + " | ".join(c.ljust(w) for c, w in zip(self.columns, self.widths)) + " |",
+            "| " + " | ".join(separator) + " |",
+        ]
+        for row in self.rows:
+            lines.append("| " + " | ".join(self._align(v, i) for i, v in enumerate(row)) + " |")
+        return lines
+
+    def render(self, truncated: bool = False) -> str:
+        lines = self._render_pretty() if self.table_format == "pretty" else self._render_markdown()
+        if truncated:
+            lines.append(f"{ELLIPSIS} more rows not shown (first {len(self.rows)} rows)")
+        return "\n".join(lines)
@@ -0,0 +1,471 @@
+import os
+import hmac
+import time
+import hashlib
+import logging
+import threading
+import http.client
+from collections import OrderedDict
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote, unquote, urlsplit
+import duckdb
+from .sheet_profile import quote_identifier
+
+logger = logging.getLogger("mcp_server_motherduck")
+
+# Bytes per cached block; DuckDB reads its 256 KiB storage blocks, so one
+# upstream request also covers the next few
+BLOCK_SIZE = 1024 * 1024
+
+# Contiguous missing blocks fetched from S3 with a single ranged GET
+MAX_FETCH_BLOCKS = 8
+
+# Seconds an object's size and ETag are trusted before they are checked again
+METADATA_TTL = 30.0
+
+# Seconds to wait on S3 before a block fetch fails
+UPSTREAM_TIMEOUT = 30.0
+
+_EMPTY_SHA256 = hashlib.sha256(b"").hexdigest()
+
+
+class S3OriginError(Exception):
+    """An S3 request answered with an error status"""
+
+    def __init__(self, status: int, body: bytes = b""):
+        super().__init__(f"S3 returned HTTP {status}")
+        self.status = status
+        self.body = body
+
+
+class ObjectInfo:
+    def __init__(self, size: int, etag: str | None, last_modified: str | None):
+        self.size = size
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched_at = time.monotonic()
+
+    def cache_id(self, bucket: str, key: str) -> str:
+        """Cache directory of this version of the object; a new ETag starts a new one"""
+        version = self.etag or f"{self.last_modified}:{self.size}"
+        return hashlib.sha256(f"{bucket}/{key}@{version}".encode()).hexdigest()[:32]
+
+
+class BlockCache:
+    """
+    Fixed-size blocks of remote objects kept on local disk, at most `max_bytes`
+    in total. The least recently used blocks are evicted first. Block files
+    are touched on every hit, so the order survives a restart.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = os.path.abspath(os.path.expanduser(directory))
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.size_bytes = 0
+        # Relative block path -> size, least recently used first
+        self._blocks: OrderedDict[str, int] = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self._blocks)
+
+    def _load(self) -> None:
+        found = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                if name.endswith(".tmp"):
+                    # Left behind by a write that never completed
+                    os.remove(path)
+                    continue
+                stat = os.stat(path)
+                found.append((stat.st_mtime, os.path.relpath(path, self.directory), stat.st_size))
+        for _, name, size in sorted(found):
+            self._blocks[name] = size
+            self.size_bytes += size
+        with self._lock:
+            self._evict()
+        if found:
+            logger.info(
+                f"💾 S3 block cache holds {len(self._blocks)} blocks "
+                f"({self.size_bytes / (1024 * 1024):.1f} MB) in {self.directory}"
+            )
+
+    def get(self, object_id: str, index: int) -> bytes | None:
+        name = os.path.join(object_id, str(index))
+        with self._lock:
+            if name not in self._blocks:
+                self.misses += 1
+                return None
+            self._blocks.move_to_end(name)
+            self.hits += 1
+        path = os.path.join(self.directory, name)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+            return data
+        except OSError:
+            # Removed behind our back; fetch it again
+            with self._lock:
+                self.size_bytes -= self._blocks.pop(name, 0)
+                self.hits -= 1
+                self.misses += 1
+            return None
+
+    def put(self, object_id: str, index: int, data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return
+        name = os.path.join(object_id, str(index))
+        path = os.path.join(self.directory, name)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not cache S3 block {name}: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return
+        with self._lock:
+            self.size_bytes += len(data) - self._blocks.pop(name, 0)
+            self._blocks[name] = len(data)
+            self._evict()
+
+    def _evict(self) -> None:
+        while self.size_bytes > self.max_bytes and self._blocks:
+            name, size = self._blocks.popitem(last=False)
+            self.size_bytes -= size
+            self.evictions += 1
+            path = os.path.join(self.directory, name)
+            try:
+                os.remove(path)
+                os.rmdir(os.path.dirname(path))
+            except OSError:
+                # The object directory still holds other blocks
+                pass
+
+
+class S3Origin:
+    """
+    Signed HEAD and ranged GET requests against S3, using the same AWS
+    environment variables as the DuckDB secret. `AWS_ENDPOINT_URL` points it
+    at an S3-compatible server such as MinIO, addressed path-style.
+    """
+
+    def __init__(self):
+        self.access_key = os.environ.get("AWS_ACCESS_KEY_ID")
+        self.secret_key = os.environ.get("AWS_SECRET_ACCESS_KEY")
+        self.session_token = os.environ.get("AWS_SESSION_TOKEN")
+        self.region = os.environ.get("AWS_DEFAULT_REGION", "us-east-1")
+        self.endpoint = os.environ.get("AWS_ENDPOINT_URL")
+        self.requests = 0
+        self.bytes_fetched = 0
+        # Keep-alive connections, one per worker thread and host
+        self._local = threading.local()
+
+    def _locate(self, bucket: str, key: str) -> tuple[str, str, str]:
+        if self.endpoint:
+            endpoint = urlsplit(self.endpoint)
+            return endpoint.scheme or "https", endpoint.netloc, quote(f"/{bucket}/{key}", safe="/~")
+        if "." in bucket:
+            # Dotted bucket names break the wildcard certificate of virtual-hosted URLs
+            return "https", f"s3.{self.region}.amazonaws.com", quote(f"/{bucket}/{key}", safe="/~")
+        return "https", f"{bucket}.s3.{self.region}.amazonaws.com", quote(f"/{key}", safe="/~")
+
+    def _sign(self, method: str, host: str, path: str) -> dict[str, str]:
+        amz_date = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        headers = {"host": host, "x-amz-content-sha256": _EMPTY_SHA256, "x-amz-date": amz_date}
+        if self.session_token:
+            headers["x-amz-security-token"] = self.session_token
+        if not (self.access_key and self.secret_key):
+            # Anonymous access to a public bucket
+            return headers
+
+        signed_headers = ";".join(sorted(headers))
+        canonical_request = "\n".join([
+            method,
+            path,
+            "",
+            "".join(f"{name}:{headers[name]}\n" for name in sorted(headers)),
+            signed_headers,
+            _EMPTY_SHA256,
+        ])
+        scope = f"{amz_date[:8]}/{self.region}/s3/aws4_request"
+        string_to_sign = "\n".join([
+            "AWS4-HMAC-SHA256",
+            amz_date,
+            scope,
+            hashlib.sha256(canonical_request.encode()).hexdigest(),
+        ])
+        key = f"AWS4{self.secret_key}".encode()
+        for part in (amz_date[:8], self.region, "s3", "aws4_request"):
+            key = hmac.new(key, part.encode(), hashlib.sha256).digest()
+        signature = hmac.new(key, string_to_sign.encode(), hashlib.sha256).hexdigest()
+        headers["authorization"] = (
+            f"AWS4-HMAC-SHA256 Credential={self.access_key}/{scope}, "
+            f"SignedHeaders={signed_headers}, Signature={signature}"
+        )
+        return headers
+
+    def _connection(self, scheme: str, host: str, fresh: bool = False) -> http.client.HTTPConnection:
+        connections = getattr(self._local, "connections", None)
+        if connections is None:
+            connections = self._local.connections = {}
+        conn = connections.get((scheme, host))
+        if conn is None or fresh:
+            if conn is not None:
+                conn.close()
+            factory = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+            conn = connections[(scheme, host)] = factory(host, timeout=UPSTREAM_TIMEOUT)
+        return conn
+
+    def _request(self, method: str, bucket: str, key: str, headers: dict | None = None):
+        scheme, host, path = self._locate(bucket, key)
+        for attempt in range(2):
+            request_headers = {**self._sign(method, host, path), **(headers or {})}
+            conn = self._connection(scheme, host, fresh=attempt > 0)
+            try:
+                conn.request(method, path, headers=request_headers)
+                response = conn.getresponse()
+                body = response.read()
+                break
+            except (OSError, http.client.HTTPException):
+                # A kept-alive connection the server already closed; retry once on a new one
+                conn.close()
+                if attempt:
+                    raise
+        self.requests += 1
+        if response.status >= 400:
+            raise S3OriginError(response.status, body)
+        return response, body
+
+    def head(self, bucket: str, key: str) -> ObjectInfo:
+        response, _ = self._request("HEAD", bucket, key)
+        return ObjectInfo(
+            int(response.getheader("Content-Length", "0")),
+            response.getheader("ETag"),
+            response.getheader("Last-Modified"),
+        )
+
+    def get_range(self, bucket: str, key: str, start: int, end: int) -> bytes:
+        """Bytes `start` to `end` of the object, both inclusive"""
+        _, body = self._request("GET", bucket, key, {"Range": f"bytes={start}-{end}"})
+        if len(body) != end - start + 1:
+            raise S3OriginError(502, f"Expected {end - start + 1} bytes, got {len(body)}".encode())
+        self.bytes_fetched += len(body)
+        return body
+
+
+def parse_range(header: str | None, size: int) -> tuple[int, int] | None:
+    """Inclusive byte range of a single-range `Range` header, or None for the whole object"""
+    if not header:
+        return None
+    unit, _, spec = header.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        raise ValueError(f"Unsupported range: {header}")
+    first, _, last = spec.strip().partition("-")
+    if not first:
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start > end or start >= size:
+        raise ValueError(f"Range not satisfiable: {header}")
+    return start, end
+
+
+class _ProxyHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "_ProxyServer"
+
+    def log_message(self, format, *args):
+        logger.debug(f"S3 block cache: {format % args}")
+
+    def _object(self) -> tuple[str, str]:
+        bucket, _, key = unquote(urlsplit(self.path).path).lstrip("/").partition("/")
+        return bucket, key
+
+    def _error(self, status: int, body: bytes = b"") -> None:
+        self.send_response(status)
+        self.send_header("Content-Length", str(0 if self.command == "HEAD" else len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _send_headers(self, status: int, info: ObjectInfo, length: int) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(length))
+        self.send_header("Accept-Ranges", "bytes")
+        if info.etag:
+            self.send_header("ETag", info.etag)
+        if info.last_modified:
+            self.send_header("Last-Modified", info.last_modified)
+
+    def do_HEAD(self):
+        bucket, key = self._object()
+        if not self.server.proxy.serves(bucket, key):
+            return self._error(403)
+        try:
+            info = self.server.proxy.stat(bucket, key)
+        except S3OriginError as e:
+            return self._error(e.status)
+        self._send_headers(200, info, info.size)
+        self.end_headers()
+
+    def do_GET(self):
+        bucket, key = self._object()
+        proxy = self.server.proxy
+        if not proxy.serves(bucket, key):
+            return self._error(403, b"Only the attached database goes through the S3 block cache")
+        try:
+            info = proxy.stat(bucket, key)
+            byte_range = parse_range(self.headers.get("Range"), info.size)
+        except S3OriginError as e:
+            return self._error(e.status, e.body)
+        except ValueError as e:
+            return self._error(416, str(e).encode())
+
+        start, end = byte_range or (0, info.size - 1)
+        self._send_headers(206 if byte_range else 200, info, end - start + 1)
+        if byte_range:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{info.size}")
+        self.end_headers()
+        try:
+            for chunk in proxy.read(bucket, key, info, start, end):
+                self.wfile.write(chunk)
+        except S3OriginError as e:
+            # Headers are already out; a short body makes the client fail the read
+            logger.warning(f"S3 block fetch for s3://{bucket}/{key} failed: {e}")
+            self.close_connection = True
+
+    def _not_supported(self):
+        self._error(501, b"Only object reads go through the S3 block cache")
+
+    do_PUT = do_POST = do_DELETE = _not_supported
+
+
+class _ProxyServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, proxy: "S3BlockCacheProxy"):
+        super().__init__(("127.0.0.1", 0), _ProxyHandler)
+        self.proxy = proxy
+
+
+class S3BlockCacheProxy:
+    """
+    Local endpoint DuckDB's httpfs reads an S3 database through.
+
+    Ranged reads are served from the on-disk `BlockCache` and only missing
+    blocks are fetched from S3, so a restarted server or a repeated
+    dashboard query reads the hot parts of the file from local disk.
+    Blocks are keyed by the object's ETag; a rewritten object is fetched
+    afresh and its old blocks age out of the cache.
+
+    Requests are signed with the server's AWS credentials but the endpoint
+    takes no credentials of its own, so it only serves `database_url`, an
+    `s3://bucket/key` URL, and its WAL; anything else is refused.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, database_url: str):
+        bucket, _, key = database_url.removeprefix("s3://").partition("/")
+        if not bucket or not key:
+            raise ValueError(f"Not an S3 object URL: {database_url}")
+        self._served = {(bucket, key), (bucket, f"{key}.wal")}
+        self.cache = BlockCache(directory, max_bytes)
+        self.origin = S3Origin()
+        self._objects: dict[tuple[str, str], ObjectInfo] = {}
+        self._server: _ProxyServer | None = None
+
+    @property
+    def endpoint(self) -> str:
+        if self._server is None:
+            raise RuntimeError("S3 block cache is not running")
+        host, port = self._server.server_address[:2]
+        return f"{host}:{port}"
+
+    def start(self) -> str:
+        if self._server is None:
+            self._server = _ProxyServer(self)
+            threading.Thread(
+                target=self._server.serve_forever, name="s3-block-cache", daemon=True
+            ).start()
+            logger.info(f"💾 S3 block cache serving on {self.endpoint}")
+        return self.endpoint
+
+    def close(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def serves(self, bucket: str, key: str) -> bool:
+        return (bucket, key) in self._served
+
+    def stat(self, bucket: str, key: str) -> ObjectInfo:
+        info = self._objects.get((bucket, key))
+        if info is None or time.monotonic() - info.fetched_at > METADATA_TTL:
+            info = self._objects[(bucket, key)] = self.origin.head(bucket, key)
+        return info
+
+    def read(self, bucket: str, key: str, info: ObjectInfo, start: int, end: int):
+        """Yield bytes `start` to `end` of the object, block by block"""
+        object_id = info.cache_id(bucket, key)
+        first, last = start // BLOCK_SIZE, end // BLOCK_SIZE
+        index = first
+        # Cached block found while looking for the end of a missing run
+        found: bytes | None = None
+        while index <= last:
+            block = found if found is not None else self.cache.get(object_id, index)
+            found = None
+            if block is None:
+                # Fetch this block and any missing ones right after it in one request
+                run_end = index
+                while run_end < last and run_end - index + 1 < MAX_FETCH_BLOCKS:
+                    found = self.cache.get(object_id, run_end + 1)
+                    if found is not None:
+                        break
+                    run_end += 1
+                data = self.origin.get_range(
+                    bucket, key,
+                    index * BLOCK_SIZE,
+                    min((run_end + 1) * BLOCK_SIZE, info.size) - 1,
+                )
+                blocks = [data[i:i + BLOCK_SIZE] for i in range(0, len(data), BLOCK_SIZE)]
+                for offset, fetched in enumerate(blocks):
+                    self.cache.put(object_id, index + offset, fetched)
+            else:
+                blocks = [block]
+
+            for block in blocks:
+                block_start = index * BLOCK_SIZE
+                yield block[max(start - block_start, 0):end - block_start + 1]
+                index += 1
+
+
+def prefetch_metadata(conn: duckdb.DuckDBPyConnection, catalog: str) -> int:
+    """
+    Load the storage metadata of every table in `catalog`, pulling its row
+    group and segment pointers through the block cache ahead of the first
+    query. Returns the number of tables visited.
+    """
+    tables = conn.execute(
+        "SELECT schema_name, table_name FROM duckdb_tables() WHERE database_name = ?",
+        [catalog],
+    ).fetchall()
+    for schema, table in tables:
+        qualified = ".".join(quote_identifier(name) for name in (catalog, schema, table))
+        conn.execute("SELECT count(*) FROM pragma_storage_info(?)", [qualified]).fetchall()
+    return len(tables)
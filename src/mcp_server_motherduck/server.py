@@ -1,18 +1,49 @@
 import logging
 import json
 import os
+import re
+import time
 from pydantic import AnyUrl
 from typing import Literal
 import mcp.types as types
 from mcp.server import NotificationOptions, Server
 from mcp.server.models import InitializationOptions
-from .configs import SERVER_VERSION
-from .database import DatabaseClient
+from .configs import (
+    SERVER_VERSION,
+    DEFAULT_MAX_ROWS,
+    DEFAULT_CURSOR_TTL,
+    DEFAULT_MAX_OPEN_CURSORS,
+    DEFAULT_RESULT_CACHE_SIZE,
+    DEFAULT_QUERY_TIMEOUT,
+    DEFAULT_S3_CACHE_SIZE,
+)
+from .database import MAX_BATCH_STATEMENTS, DatabaseClient
+from .executor import QueryExecutor, QueryQueueFullError
+from .metrics import (
+    REGISTRY,
+    TOOL_CALLS,
+    TOOL_CALL_DURATION,
+    TOOL_RESPONSE_BYTES,
+    TOOL_ROWS_RETURNED,
+)
 from .prompt import PROMPT_TEMPLATE
+from .render import DEFAULT_MAX_WIDTH, TABLE_FORMATS
+from . import startup
 
 
 logger = logging.getLogger("mcp_server_motherduck")
 
+# `FROM '{{file}}'` reads a whole workbook sheet, which is served from its ingested table
+FILE_TABLE_RE = re.compile(r"\b(FROM|JOIN)\s+'\{\{file\}\}'", re.IGNORECASE)
+
+
+def sheet_reference_re(sheet: str) -> re.Pattern:
+    """`FROM <sheet>` or `JOIN <sheet>`, with the name bare, double- or single-quoted"""
+    name = re.escape(sheet)
+    return re.compile(
+        rf"\b(FROM|JOIN)\s+(?:\"{name}\"|'{name}'|{name}(?![\w.]))", re.IGNORECASE
+    )
+
 
 def build_application(
     db_path: str,
@@ -20,16 +51,107 @@ def build_application(
     home_dir: str | None = None,
     saas_mode: bool = False,
     read_only: bool = False,
+    pool_size: int = 4,
+    pool_idle_timeout: float = 5.0,
+    max_rows: int = DEFAULT_MAX_ROWS,
+    cursor_ttl: float = DEFAULT_CURSOR_TTL,
+    max_open_cursors: int = DEFAULT_MAX_OPEN_CURSORS,
+    result_cache_size: int = DEFAULT_RESULT_CACHE_SIZE,
+    query_timeout: float = DEFAULT_QUERY_TIMEOUT,
+    extension_directory: str | None = None,
+    offline_extensions: bool = False,
+    memory_limit: str | None = None,
+    threads: int | None = None,
+    temp_directory: str | None = None,
+    s3_cache_directory: str | None = None,
+    s3_cache_size: int = DEFAULT_S3_CACHE_SIZE,
+    s3_cache_prefetch: bool = False,
+    max_concurrent_queries: int = 4,
+    max_queued_queries: int = 32,
 ):
     logger.info("Starting MotherDuck MCP Server")
     server = Server("mcp-server-motherduck")
-    db_client = DatabaseClient(
-        db_path=db_path,
-        motherduck_token=motherduck_token,
-        home_dir=home_dir,
-        saas_mode=saas_mode,
-        read_only=read_only,
+    # Blocking DuckDB work runs on worker threads so one slow query cannot
+    # stall other sessions, health checks or uploads on the event loop
+    executor = QueryExecutor(
+        max_concurrency=max_concurrent_queries, max_queue=max_queued_queries
+    )
+    with startup.phase("database client"):
+        db_client = DatabaseClient(
+            db_path=db_path,
+            motherduck_token=motherduck_token,
+            home_dir=home_dir,
+            saas_mode=saas_mode,
+            read_only=read_only,
+            pool_size=pool_size,
+            pool_idle_timeout=pool_idle_timeout,
+            max_rows=max_rows,
+            cursor_ttl=cursor_ttl,
+            max_open_cursors=max_open_cursors,
+            result_cache_size=result_cache_size,
+            query_timeout=query_timeout,
+            extension_directory=extension_directory,
+            offline_extensions=offline_extensions,
+            memory_limit=memory_limit,
+            threads=threads,
+            temp_directory=temp_directory,
+            s3_cache_directory=s3_cache_directory,
+            s3_cache_size=s3_cache_size,
+            s3_cache_prefetch=s3_cache_prefetch,
+            fan_out=executor.map,
+        )
+
+    # Load and cache gauges are read from the live objects at scrape time
+    REGISTRY.gauge(
+        "query_queue_depth", "Queries waiting for a free worker",
+        function=lambda: executor.queue_depth,
+    )
+    REGISTRY.gauge(
+        "query_active", "Queries currently executing", function=lambda: executor.active
     )
+    REGISTRY.gauge(
+        "result_cursors_open", "Truncated results kept open for fetch_more",
+        function=lambda: len(db_client.result_cursors),
+    )
+    REGISTRY.gauge(
+        "session_connections_open", "DuckDB connections held by live MCP sessions",
+        function=lambda: len(db_client.sessions),
+    )
+    cache = db_client.result_cache
+    REGISTRY.counter("result_cache_hits_total", "Result cache hits", function=lambda: cache.hits)
+    REGISTRY.counter("result_cache_misses_total", "Result cache misses", function=lambda: cache.misses)
+    REGISTRY.counter(
+        "result_cache_bypasses_total", "Queries that could not be cached", function=lambda: cache.bypasses
+    )
+    REGISTRY.gauge(
+        "result_cache_hit_ratio", "Share of cacheable lookups served from the cache",
+        function=lambda: cache.hits / max(cache.hits + cache.misses, 1),
+    )
+    REGISTRY.gauge(
+        "result_cache_bytes", "Serialized size of cached results", function=lambda: cache.size_bytes
+    )
+    if db_client.s3_cache is not None:
+        blocks = db_client.s3_cache.cache
+        origin = db_client.s3_cache.origin
+        REGISTRY.counter("s3_cache_hits_total", "S3 blocks read from the local cache", function=lambda: blocks.hits)
+        REGISTRY.counter("s3_cache_misses_total", "S3 blocks fetched from S3", function=lambda: blocks.misses)
+        REGISTRY.counter(
+            "s3_cache_evictions_total", "S3 blocks evicted to stay within the cache size",
+            function=lambda: blocks.evictions,
+        )
+        REGISTRY.gauge(
+            "s3_cache_hit_ratio", "Share of S3 block reads served from the local cache",
+            function=lambda: blocks.hits / max(blocks.hits + blocks.misses, 1),
+        )
+        REGISTRY.gauge("s3_cache_bytes", "Size of the S3 blocks cached on disk", function=lambda: blocks.size_bytes)
+        REGISTRY.counter(
+            "s3_cache_upstream_requests_total", "Requests sent to S3 by the block cache",
+            function=lambda: origin.requests,
+        )
+        REGISTRY.counter(
+            "s3_cache_upstream_bytes_total", "Bytes fetched from S3 by the block cache",
+            function=lambda: origin.bytes_fetched,
+        )
 
     logger.info("Registering handlers")
 
@@ -107,7 +229,82 @@ def build_application(
                     "properties": {
                         "query": {
                             "type": "string",
-                            "description": "SQL query to execute that is a dialect of DuckDB SQL. Use {{file}} or sheet name directly in FROM clause.",
+                            "description": "SQL query to execute that is a dialect of DuckDB SQL. With a fileId, every sheet of the workbook is a table named after the sheet, so sheets can be selected, joined and nested by name, e.g. SELECT * FROM \"Sheet 1\" (double-quote names with spaces or special characters). {{file}} is replaced by the workbook path for read_xlsx.",
+                        },
+                        "fileId": {
+                            "type": "string",
+                            "description": "Optional file ID of an uploaded workbook whose sheets the query references by name.",
+                        },
+                        "sheet": {
+                            "type": "string",
+                            "description": "Optional sheet name the query reads; checked to exist before the query runs.",
+                        },
+                        "maxRows": {
+                            "type": "integer",
+                            "description": f"Optional maximum number of rows to return (at most {max_rows}). Results with more rows are marked as truncated and include a cursorId and continuationToken for fetch_more.",
+                        },
+                        "timeout": {
+                            "type": "number",
+                            "description": "Optional number of seconds after which the query is cancelled"
+                            + (f" (at most {query_timeout:g})" if query_timeout else "")
+                            + ". Timed out queries return an error with timedOut set.",
+                        },
+                        "format": {
+                            "type": "string",
+                            "enum": ["json", "markdown", "pretty"],
+                            "description": "Optional result format. `json` (default) returns rows as objects and supports fetch_more; `markdown` returns a compact table and `pretty` a boxed text table, both with long values cut short and extra rows omitted.",
+                        },
+                        "profile": {
+                            "type": "boolean",
+                            "description": "Optional. With the json format, run the query to completion with profiling on and add its operator profile to the response. Profiled results are not cached and cannot be continued with fetch_more.",
+                        },
+                    },
+                    "required": ["query"],
+                },
+            ),
+            types.Tool(
+                name="query_batch",
+                description="Run several independent SQL queries in one call, e.g. the counts, distinct values and samples of an exploration step. Read-only queries run concurrently. Returns every result with its own timing and error.",
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "queries": {
+                            "type": "array",
+                            "items": {"type": "string"},
+                            "minItems": 1,
+                            "maxItems": MAX_BATCH_STATEMENTS,
+                            "description": f"SQL queries to execute, at most {MAX_BATCH_STATEMENTS}. Results are returned in the same order. A batch containing writes runs its queries one after another, in order.",
+                        },
+                        "fileId": {
+                            "type": "string",
+                            "description": "Optional file ID for Excel file analysis, applied to every query.",
+                        },
+                        "sheet": {
+                            "type": "string",
+                            "description": "Optional sheet name the queries read; checked to exist before they run.",
+                        },
+                        "maxRows": {
+                            "type": "integer",
+                            "description": f"Optional maximum number of rows per query (at most {max_rows}). Truncated results are not kept open for fetch_more.",
+                        },
+                        "timeout": {
+                            "type": "number",
+                            "description": "Optional number of seconds after which each query is cancelled"
+                            + (f" (at most {query_timeout:g})" if query_timeout else ""),
+                        },
+                    },
+                    "required": ["queries"],
+                },
+            ),
+            types.Tool(
+                name="profile_query",
+                description="Run a query with DuckDB profiling and return its operator tree with per-operator timings and cardinalities, the share of time spent in read_xlsx, and a short preview of the result. Use it to find out why a query is slow.",
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "query": {
+                            "type": "string",
+                            "description": "SQL query to profile, as for the query tool",
                         },
                         "fileId": {
                             "type": "string",
@@ -115,12 +312,44 @@ def build_application(
                         },
                         "sheet": {
                             "type": "string",
-                            "description": "Optional sheet name for Excel files. If not provided, uses first sheet.",
+                            "description": "Optional sheet name the query reads; checked to exist before it runs.",
+                        },
+                        "timeout": {
+                            "type": "number",
+                            "description": "Optional number of seconds after which the query is cancelled"
+                            + (f" (at most {query_timeout:g})" if query_timeout else ""),
                         },
                     },
                     "required": ["query"],
                 },
             ),
+            types.Tool(
+                name="fetch_more",
+                description="Fetch the next page of a truncated query result without re-running the query",
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "cursorId": {
+                            "type": "string",
+                            "description": "cursorId returned by a truncated query or fetch_more result",
+                        },
+                        "continuationToken": {
+                            "type": "string",
+                            "description": "continuationToken returned with the latest page of that cursor",
+                        },
+                        "maxRows": {
+                            "type": "integer",
+                            "description": f"Optional maximum number of rows to return (at most {max_rows})",
+                        },
+                        "timeout": {
+                            "type": "number",
+                            "description": "Optional number of seconds after which reading the page is cancelled"
+                            + (f" (at most {query_timeout:g})" if query_timeout else ""),
+                        },
+                    },
+                    "required": ["cursorId", "continuationToken"],
+                },
+            ),
             types.Tool(
                 name="discover_structure",
                 description="Discover schema and structure of Excel sheets with sample data",
@@ -141,6 +370,11 @@ def build_application(
                             "description": "Number of sample rows to return",
                             "default": 5,
                         },
+                        "timeout": {
+                            "type": "number",
+                            "description": "Optional number of seconds after which profiling each sheet is cancelled"
+                            + (f" (at most {query_timeout:g})" if query_timeout else ""),
+                        },
                     },
                     "required": ["fileId"],
                 },
@@ -150,6 +384,132 @@ def build_application(
     @server.call_tool()
     async def handle_tool_call(
         name: str, arguments: dict | None
+    ) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
+        """Run a tool call and record its latency, outcome and response size"""
+        start_time = time.perf_counter()
+        status = "error"
+        try:
+            session = server.request_context.session
+        except LookupError:
+            session = None
+        try:
+            # Database work of the call runs on the session's own connection
+            with db_client.sessions.bind(session), executor.track_queue_wait():
+                result = await call_tool(name, arguments)
+            status = "ok"
+            return result
+        finally:
+            tool = name
+            if status == "ok" and result and getattr(result[0], "text", "").startswith("Unsupported tool"):
+                # Keep label cardinality bounded whatever clients send
+                tool = "unknown"
+            TOOL_CALLS.inc(tool=tool, status=status)
+            TOOL_CALL_DURATION.observe(time.perf_counter() - start_time, tool=tool)
+            if status == "ok":
+                TOOL_RESPONSE_BYTES.observe(
+                    sum(len(getattr(item, "text", "")) for item in result), tool=tool
+                )
+
+    def resolve_workbook(
+        file_id: str, sheet: str | None, reads_file_table: bool
+    ) -> tuple[str, str | None, str | None, list[str]]:
+        """
+        Path of an uploaded workbook, the catalog of its ingested sheets, the
+        source `FROM '{{file}}'` reads (the named sheet, or the first one as
+        read_xlsx would pick) and the workbook's sheet names. Runs on a
+        worker thread.
+        """
+        excel_store = db_client.excel_store
+        file_path = excel_store.xlsx_path(file_id)
+        if not os.path.exists(file_path):
+            return file_path, None, None, []
+
+        catalog = db_client.attach_excel_file(file_id)
+        sheet_names = excel_store.sheet_names(file_id)
+        source = None
+        if sheet and sheet in sheet_names and (
+            catalog is None or sheet not in db_client.workbook_sheets(catalog)
+        ):
+            # Ingestion skipped or failed for this sheet; it is still read with read_xlsx
+            escaped_path = file_path.replace("'", "''")
+            escaped_sheet = sheet.replace("'", "''")
+            source = (
+                f"read_xlsx('{escaped_path}', sheet='{escaped_sheet}', "
+                "all_varchar=true, ignore_errors=true)"
+            )
+        elif catalog is not None and reads_file_table:
+            sheet = sheet or (sheet_names[0] if sheet_names else None)
+            source = db_client.excel_table(file_id, sheet) if sheet else None
+        return file_path, catalog, source, sheet_names
+
+    async def prepare_queries(
+        arguments: dict, queries: list[str]
+    ) -> tuple[list[str], str | None, dict | None]:
+        """
+        Resolve the uploaded workbook queries run against, once for all of
+        them. Returns the queries with `{{file}}` substituted, the catalog
+        whose sheets they can reference by name, and an error response if
+        the workbook or sheet does not exist.
+        """
+        file_id = arguments.get("fileId")
+        sheet = arguments.get("sheet")
+        if not file_id:
+            return queries, None, None
+
+        excel_store = db_client.excel_store
+        file_path, catalog, source, sheet_names = await executor.run(
+            resolve_workbook, file_id, sheet, any(FILE_TABLE_RE.search(q) for q in queries)
+        )
+        error_response = {
+            "success": False,
+            **({"query": queries[0]} if len(queries) == 1 else {"queries": queries}),
+            "data": [],
+            "columns": [],
+            "rowCount": 0
+        }
+
+        if not os.path.exists(file_path):
+            logger.error(f"❌ File not found: {file_id}")
+            try:
+                files_in_dir = os.listdir(excel_store.base_path)
+                logger.error(f"📂 Files in directory: {files_in_dir}")
+            except Exception as e:
+                logger.error(f"📂 Cannot list directory: {e}")
+
+            return queries, None, {**error_response, "error": f"File not found: {file_id}"}
+
+        if sheet and sheet not in sheet_names:
+            return queries, None, {
+                **error_response,
+                "error": f"Sheet '{sheet}' not found in the workbook",
+                "availableSheets": sheet_names,
+            }
+
+        # Sheets are tables of the workbook's catalog, looked up by name like any table;
+        # a sheet without one is read in place wherever the query names it
+        sheet_re = None
+        if sheet and (catalog is None or sheet not in db_client.workbook_sheets(catalog)):
+            sheet_re = sheet_reference_re(sheet)
+            logger.info(f"📊 Sheet '{sheet}' is not ingested, reading it with read_xlsx")
+
+        prepared = []
+        for query in queries:
+            if source:
+                query = FILE_TABLE_RE.sub(lambda m: f"{m.group(1)} {source}", query)
+            if sheet_re is not None:
+                query = sheet_re.sub(lambda m: f"{m.group(1)} {source}", query)
+            # Substituir {{file}} placeholder
+            prepared.append(query.replace("{{file}}", file_path))
+        logger.info(f"📁 Executing query with file: {file_path}" + (f" as `{catalog}`" if catalog else ""))
+        return prepared, catalog, None
+
+    async def prepare_query(arguments: dict) -> tuple[str, str | None, dict | None]:
+        """`prepare_queries` for the single query of a call"""
+        (query,), catalog, error_response = await prepare_queries(arguments, [arguments["query"]])
+        return query, catalog, error_response
+
+    async def call_tool(
+        name: str, arguments: dict | None
     ) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
         """
         Handle tool execution requests.
@@ -163,58 +523,126 @@ def build_application(
                         types.TextContent(type="text", text="Error: No query provided")
                     ]
                 
-                query = arguments["query"]
-                file_id = arguments.get("fileId")
-                sheet = arguments.get("sheet")
-                
-                # Se fileId fornecido, substituir placeholder
-                if file_id:
-                    excel_files_path = os.getenv("EXCEL_FILES_PATH", "/app/excel_files")
-                    file_path = os.path.join(excel_files_path, f"{file_id}.xlsx")
-                    file_path = file_path.replace("\\", "/")
-                    
-                    if not os.path.exists(file_path):
-                        logger.error(f"❌ File not found: {file_path}")
-                        try:
-                            files_in_dir = os.listdir(excel_files_path)
-                            logger.error(f"📂 Files in directory: {files_in_dir}")
-                        except Exception as e:
-                            logger.error(f"📂 Cannot list directory: {e}")
-                        
-                        error_response = {
-                            "success": False,
-                            "error": f"File not found: {file_id}",
-                            "query": query,
-                            "data": [],
-                            "columns": [],
-                            "rowCount": 0
-                        }
-                        return [types.TextContent(type="text", text=json.dumps(error_response))]
-                    
-                    # Se sheet especificada, construir query read_xlsx completa
-                    if sheet:
-                        # Substituir "FROM sheet_name" por read_xlsx call
-                        import re
-                        pattern = rf'FROM\s+["\']?{re.escape(sheet)}["\']?'
-                        replacement = f"FROM read_xlsx('{file_path}', sheet='{sheet}', all_varchar=true, ignore_errors=true)"
-                        query = re.sub(pattern, replacement, query, flags=re.IGNORECASE)
-                        logger.info(f"📊 Executing query with sheet: {sheet}")
-                    else:
-                        # Substituir {{file}} placeholder
-                        query = query.replace("{{file}}", file_path)
-                    
-                    logger.info(f"📁 Executing query with file: {file_path}")
-                
+                query_max_rows = arguments.get("maxRows")
+                query, workbook, error_response = await prepare_query(arguments)
+                if error_response is not None:
+                    return [types.TextContent(type="text", text=json.dumps(error_response))]
+
                 # Executar query
-                tool_response = db_client.query_json(query)
+                deadline = db_client.query_deadline(arguments.get("timeout"))
+                table_format = arguments.get("format", "json")
+                if table_format in TABLE_FORMATS:
+                    try:
+                        text = await executor.run(
+                            db_client.query, query, query_max_rows, table_format,
+                            DEFAULT_MAX_WIDTH, deadline, workbook,
+                            deadline=deadline,
+                        )
+                    except ValueError as e:
+                        text = str(e)
+                    return [types.TextContent(type="text", text=text)]
+
+                tool_response = await executor.run(
+                    db_client.query_json, query, query_max_rows, deadline,
+                    bool(arguments.get("profile")), True, workbook,
+                    deadline=deadline,
+                )
                 
                 logger.info(f"✅ Query executed: {tool_response.get('rowCount', 0)} rows")
+                tool_response["queueWaitMs"] = executor.queue_wait_ms()
+                TOOL_ROWS_RETURNED.observe(tool_response.get("rowCount", 0), tool=name)
                 
-                # Converter dict para JSON string
-                response_text = json.dumps(tool_response, indent=2)
+                # Converter dict para JSON string (datas, decimais etc. como texto)
+                response_text = json.dumps(tool_response, indent=2, default=str)
                 
                 return [types.TextContent(type="text", text=response_text)]
 
+            elif name == "query_batch":
+                queries = (arguments or {}).get("queries")
+                if not isinstance(queries, list) or not queries:
+                    return [types.TextContent(type="text", text="Error: queries must be a non-empty list")]
+                if len(queries) > MAX_BATCH_STATEMENTS:
+                    return [types.TextContent(
+                        type="text",
+                        text=f"Error: at most {MAX_BATCH_STATEMENTS} queries per batch, got {len(queries)}",
+                    )]
+
+                for index, query in enumerate(queries):
+                    if not isinstance(query, str) or not query.strip():
+                        return [types.TextContent(type="text", text=json.dumps({
+                            "success": False,
+                            "error": f"Query {index} must be a non-empty SQL string",
+                            "index": index,
+                        }))]
+
+                prepared, workbook, error_response = await prepare_queries(arguments, queries)
+                if error_response is not None:
+                    return [types.TextContent(type="text", text=json.dumps(error_response))]
+
+                deadline = db_client.query_deadline(arguments.get("timeout"))
+                tool_response = await executor.run(
+                    db_client.query_batch, prepared, arguments.get("maxRows"), deadline, workbook,
+                    deadline=deadline,
+                )
+
+                logger.info(
+                    f"✅ Batch executed: {tool_response['statementCount']} queries, "
+                    f"{tool_response['failedCount']} failed"
+                )
+                tool_response["queueWaitMs"] = executor.queue_wait_ms()
+                TOOL_ROWS_RETURNED.observe(
+                    sum(result.get("rowCount", 0) for result in tool_response["results"]), tool=name
+                )
+
+                response_text = json.dumps(tool_response, indent=2, default=str)
+                return [types.TextContent(type="text", text=response_text)]
+
+            elif name == "profile_query":
+                if arguments is None or not arguments.get("query"):
+                    return [types.TextContent(type="text", text="Error: No query provided")]
+
+                query, workbook, error_response = await prepare_query(arguments)
+                if error_response is not None:
+                    return [types.TextContent(type="text", text=json.dumps(error_response))]
+
+                deadline = db_client.query_deadline(arguments.get("timeout"))
+                tool_response = await executor.run(
+                    db_client.profile_query, query, deadline, workbook,
+                    deadline=deadline,
+                )
+
+                profile = tool_response.get("profile")
+                if profile:
+                    logger.info(
+                        f"⏱️ Profiled query: {profile['latencyMs']:.1f}ms, "
+                        f"{profile['readXlsxShare']:.0%} in read_xlsx"
+                    )
+                tool_response["queueWaitMs"] = executor.queue_wait_ms()
+
+                response_text = json.dumps(tool_response, indent=2, default=str)
+                return [types.TextContent(type="text", text=response_text)]
+
+            elif name == "fetch_more":
+                if arguments is None or not arguments.get("cursorId"):
+                    return [types.TextContent(type="text", text="Error: cursorId is required")]
+
+                deadline = db_client.query_deadline(arguments.get("timeout"))
+                tool_response = await executor.run(
+                    db_client.fetch_more,
+                    arguments["cursorId"],
+                    arguments.get("continuationToken", ""),
+                    arguments.get("maxRows"),
+                    deadline,
+                    deadline=deadline,
+                )
+
+                logger.info(f"✅ Fetched {tool_response.get('rowCount', 0)} more rows")
+                tool_response["queueWaitMs"] = executor.queue_wait_ms()
+                TOOL_ROWS_RETURNED.observe(tool_response.get("rowCount", 0), tool=name)
+
+                response_text = json.dumps(tool_response, indent=2, default=str)
+                return [types.TextContent(type="text", text=response_text)]
+
             elif name == "discover_structure":
                 if arguments is None:
                     return [types.TextContent(type="text", text="Error: No fileId provided")]
@@ -226,19 +654,33 @@ def build_application(
                 if not file_id:
                     return [types.TextContent(type="text", text="Error: fileId is required")]
                 
-                excel_files_path = os.getenv("EXCEL_FILES_PATH", "/app/excel_files")
-                file_path = os.path.join(excel_files_path, f"{file_id}.xlsx")
-                file_path = file_path.replace("\\", "/")
-                
                 logger.info(f"🔍 Discovering structure for file: {file_id}, sheet: {sheet}")
                 
-                result = db_client.discover_excel_structure(file_path, sheet, sample_rows)
+                deadline = db_client.query_deadline(arguments.get("timeout"))
+                result = await executor.run(
+                    db_client.discover_excel_structure, file_id, sheet, sample_rows, deadline,
+                    deadline=deadline,
+                )
+                result["queueWaitMs"] = executor.queue_wait_ms()
                 
-                response_text = json.dumps(result, indent=2)
+                response_text = json.dumps(result, indent=2, default=str)
                 return [types.TextContent(type="text", text=response_text)]
 
             return [types.TextContent(type="text", text=f"Unsupported tool: {name}")]
 
+        except QueryQueueFullError as e:
+            logger.warning(f"⏳ Rejecting tool {name}: {e}")
+            error_response = {
+                "success": False,
+                "error": str(e),
+                "retryAfter": e.retry_after,
+                "queueDepth": e.queue_depth,
+                "queueWaitMs": executor.queue_wait_ms(),
+                "data": [],
+                "columns": [],
+                "rowCount": 0,
+            }
+            return [types.TextContent(type="text", text=json.dumps(error_response))]
         except Exception as e:
             logger.error(f"❌ Error executing tool {name}: {e}", exc_info=True)
             raise ValueError(f"Error executing tool {name}: {str(e)}")
@@ -252,4 +694,4 @@ def build_application(
         ),
     )
 
-    return server, initialization_options
+    return server, initialization_options, db_client, executor
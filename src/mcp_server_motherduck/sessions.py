@@ -0,0 +1,130 @@
+import logging
+import threading
+import weakref
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Iterator
+import duckdb
+
+logger = logging.getLogger("mcp_server_motherduck")
+
+# MCP session the current tool call belongs to; copied into worker threads by anyio
+_current_session: ContextVar[object | None] = ContextVar("mcp_session", default=None)
+
+
+def current_session_key() -> int | None:
+    """Identity of the MCP session the current call belongs to, if any"""
+    session = _current_session.get()
+    return id(session) if session is not None else None
+
+
+class SessionConnection:
+    """A session's own connection, and the lock that keeps its statements in order"""
+
+    def __init__(self, key: int, conn: duckdb.DuckDBPyConnection):
+        self.key = key
+        self.conn = conn
+        # Re-entrant so a statement can close the session's open result cursor,
+        # which shares this lock
+        self.lock = threading.RLock()
+        # Truncated result still open on this connection, closed by the next statement
+        self.cursor_id: str | None = None
+        self.closed = False
+
+
+class SessionConnectionManager:
+    """
+    Gives each MCP session its own DuckDB connection on the shared database.
+
+    Temporary tables, `USE`, `SET` and prepared state stay private to the
+    session instead of leaking to whichever session runs next on the same
+    worker thread. A session's statements run one at a time, so a single
+    client cannot occupy every worker. Connections are closed when their
+    session object is garbage collected, i.e. when the session ends.
+    """
+
+    def __init__(
+        self,
+        open_connection: Callable[[], duckdb.DuckDBPyConnection],
+        close_cursor: Callable[[str, str], object],
+    ):
+        self._open_connection = open_connection
+        # Closes a session's open result cursor before its connection is reused or closed
+        self._close_cursor = close_cursor
+        self._connections: dict[int, SessionConnection] = {}
+        # Sessions that changed their own state, e.g. created temp tables or ran USE/SET
+        self._stateful: set[int] = set()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._connections)
+
+    @staticmethod
+    @contextmanager
+    def bind(session: object | None) -> Iterator[None]:
+        """Run the block on behalf of `session`; None keeps the shared per-thread cursors"""
+        token = _current_session.set(session)
+        try:
+            yield
+        finally:
+            _current_session.reset(token)
+
+    def acquire(self) -> SessionConnection | None:
+        """Lock and return the current session's connection, or None outside a session"""
+        session = _current_session.get()
+        if session is None:
+            return None
+        key = id(session)
+        with self._lock:
+            entry = self._connections.get(key)
+            if entry is None:
+                entry = SessionConnection(key, self._open_connection())
+                self._connections[key] = entry
+                weakref.finalize(session, self.close, key)
+                logger.info(f"🔗 Opened connection for MCP session {key:x} ({len(self._connections)} open)")
+        entry.lock.acquire()
+        if entry.closed:
+            entry.lock.release()
+            raise RuntimeError("MCP session has ended")
+        if entry.cursor_id is not None:
+            # DuckDB keeps one pending result per connection; the new statement replaces it
+            cursor_id, entry.cursor_id = entry.cursor_id, None
+            self._close_cursor(cursor_id, "a later statement ran on the same MCP session")
+        return entry
+
+    def owner(self, conn: duckdb.DuckDBPyConnection) -> SessionConnection | None:
+        session = _current_session.get()
+        entry = self._connections.get(id(session)) if session is not None else None
+        if entry is not None and entry.conn is conn:
+            return entry
+        return None
+
+    def mark_stateful(self) -> None:
+        session = _current_session.get()
+        if session is not None:
+            self._stateful.add(id(session))
+
+    def cache_scope(self) -> int | None:
+        """Result cache partition of the current session: shared until it changes its own state"""
+        key = id(_current_session.get())
+        return key if key in self._stateful else None
+
+    def close(self, key: int) -> None:
+        with self._lock:
+            entry = self._connections.pop(key, None)
+            self._stateful.discard(key)
+        if entry is None:
+            return
+        with entry.lock:
+            entry.closed = True
+            if entry.cursor_id is not None:
+                self._close_cursor(entry.cursor_id, "the MCP session ended")
+            try:
+                entry.conn.close()
+            except Exception as e:
+                logger.warning(f"Error closing connection of MCP session {key:x}: {e}")
+        logger.info(f"🔌 Closed connection for MCP session {key:x} ({len(self._connections)} open)")
+
+    def close_all(self) -> None:
+        for key in list(self._connections):
+            self.close(key)
@@ -0,0 +1,165 @@
+import duckdb
+
+# Type checks run over every VARCHAR column, in order of preference. Each is an
+# aggregate counting the values that fit the type, so the whole profile of a
+# sheet is computed by a single scan.
+TYPE_CHECKS: list[tuple[str, str]] = [
+    ("BIGINT", "COUNT_IF(regexp_full_match(trim({col}), '[+-]?[0-9]+') AND TRY_CAST(trim({col}) AS BIGINT) IS NOT NULL)"),
+    ("DOUBLE", "COUNT(TRY_CAST(trim({col}) AS DOUBLE))"),
+    ("DATE", "COUNT_IF(TRY_CAST(trim({col}) AS TIMESTAMP) = TRY_CAST(trim({col}) AS DATE))"),
+    ("TIMESTAMP", "COUNT(TRY_CAST(trim({col}) AS TIMESTAMP))"),
+    ("BOOLEAN", "COUNT_IF(lower(trim({col})) IN ('true', 'false'))"),
+]
+
+NUMERIC_TYPES = {"BIGINT", "DOUBLE"}
+
+# Codes that only look numeric, such as zip codes with leading zeros or account
+# numbers too long for BIGINT/DOUBLE to keep every digit, stay text
+IDENTIFIER_CHECK = "COUNT_IF(regexp_full_match(trim({col}), '[+-]?(0[0-9]+|[0-9]{{16,}})'))"
+
+# Cell types Excel stores as numbers, which read as serials when read as text
+SERIAL_TYPES = {"DATE", "TIMESTAMP", "BOOLEAN"}
+
+# Casts from text to each inferred type; dates and booleans also accept Excel serials
+CASTS = {
+    "BIGINT": "TRY_CAST(trim({col}) AS BIGINT)",
+    "DOUBLE": "TRY_CAST(trim({col}) AS DOUBLE)",
+    "DATE": "COALESCE(TRY_CAST(trim({col}) AS DATE), "
+    "DATE '1899-12-30' + CAST(floor(TRY_CAST(trim({col}) AS DOUBLE)) AS INTEGER))",
+    "TIMESTAMP": "COALESCE(TRY_CAST(trim({col}) AS TIMESTAMP), TIMESTAMP '1899-12-30' + "
+    "to_microseconds(CAST(round(TRY_CAST(trim({col}) AS DOUBLE) * 86400000000) AS BIGINT)))",
+    "BOOLEAN": "TRY_CAST(trim({col}) AS BOOLEAN)",
+}
+
+
+def quote_identifier(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def profile_source(
+    conn: duckdb.DuckDBPyConnection, source: str, sample_rows: int = 5
+) -> dict:
+    """
+    Profile a table or table function in one pass: row count, and per column
+    null count, approximate distinct count, min/max and inferred type.
+    """
+    described = conn.execute(f"DESCRIBE SELECT * FROM {source}").fetchall()
+    columns = [(row[0], row[1]) for row in described]
+
+    exprs = ["COUNT(*)"]
+    for name, column_type in columns:
+        col = quote_identifier(name)
+        exprs += [
+            f"COUNT({col})",
+            f"APPROX_COUNT_DISTINCT({col})",
+            f"MIN({col})",
+            f"MAX({col})",
+        ]
+        if column_type == "VARCHAR":
+            exprs += [check.format(col=col) for _, check in TYPE_CHECKS]
+            exprs.append(IDENTIFIER_CHECK.format(col=col))
+            exprs += [
+                f"MIN(TRY_CAST(trim({col}) AS DOUBLE))",
+                f"MAX(TRY_CAST(trim({col}) AS DOUBLE))",
+            ]
+
+    stats = list(conn.execute(f"SELECT {', '.join(exprs)} FROM {source}").fetchone())
+    row_count = stats.pop(0)
+
+    columns_info = []
+    for name, column_type in columns:
+        non_null, distinct, min_value, max_value = stats[:4]
+        del stats[:4]
+
+        inferred = column_type
+        if column_type == "VARCHAR":
+            fits = stats[: len(TYPE_CHECKS)]
+            identifiers, numeric_min, numeric_max = stats[len(TYPE_CHECKS) : len(TYPE_CHECKS) + 3]
+            del stats[: len(TYPE_CHECKS) + 3]
+            inferred = "VARCHAR" if identifiers else infer_type(non_null, fits)
+            if inferred in NUMERIC_TYPES:
+                min_value, max_value = numeric_min, numeric_max
+                if inferred == "BIGINT":
+                    min_value, max_value = int(min_value), int(max_value)
+
+        columns_info.append({
+            "name": name,
+            "type": inferred,
+            # HyperLogLog estimate, which can overshoot on small columns
+            "distinctCount": min(distinct, non_null),
+            "nonNullCount": non_null,
+            "nullCount": row_count - non_null,
+            "min": min_value,
+            "max": max_value,
+        })
+
+    sample = conn.execute(f"SELECT * FROM {source} LIMIT {int(sample_rows)}")
+    sample_columns = [d[0] for d in sample.description]
+    sample_data = [dict(zip(sample_columns, row)) for row in sample.fetchall()]
+
+    return {
+        "columns": columns_info,
+        "rowCount": row_count,
+        "sampleData": sample_data,
+    }
+
+
+def infer_column_types(
+    conn: duckdb.DuckDBPyConnection, source: str, cell_types: list[str] | None = None
+) -> list[tuple[str, str]]:
+    """
+    Name and type of every column of `source`, typing each VARCHAR column as
+    the most specific type all its values cast to, in one vectorized scan.
+
+    `cell_types` are the types read_xlsx sniffs from the first rows of the
+    sheet, by position. A column of dates or booleans whose text values are
+    all numbers holds Excel serials and takes the sniffed type.
+    """
+    described = conn.execute(f"DESCRIBE SELECT * FROM {source}").fetchall()
+    columns = [(row[0], row[1]) for row in described]
+    if cell_types is None or len(cell_types) != len(columns):
+        cell_types = [None] * len(columns)
+    text_columns = [name for name, column_type in columns if column_type == "VARCHAR"]
+    if not text_columns:
+        return columns
+
+    exprs = []
+    for name in text_columns:
+        col = quote_identifier(name)
+        exprs.append(f"COUNT({col})")
+        exprs += [check.format(col=col) for _, check in TYPE_CHECKS]
+        exprs.append(IDENTIFIER_CHECK.format(col=col))
+    stats = list(conn.execute(f"SELECT {', '.join(exprs)} FROM {source}").fetchone())
+
+    double_check = [type_name for type_name, _ in TYPE_CHECKS].index("DOUBLE")
+    typed = []
+    for (name, column_type), cell_type in zip(columns, cell_types):
+        if column_type == "VARCHAR":
+            non_null, *fits, identifiers = stats[: len(TYPE_CHECKS) + 2]
+            del stats[: len(TYPE_CHECKS) + 2]
+            if cell_type in SERIAL_TYPES and non_null and fits[double_check] == non_null:
+                column_type = cell_type
+            elif not identifiers:
+                column_type = infer_type(non_null, fits)
+        typed.append((name, column_type))
+    return typed
+
+
+def typed_select(columns: list[tuple[str, str]]) -> str:
+    """Select list casting text columns to their inferred types"""
+    exprs = []
+    for name, column_type in columns:
+        col = quote_identifier(name)
+        cast = CASTS.get(column_type)
+        exprs.append(f"{cast.format(col=col)} AS {col}" if cast else col)
+    return ", ".join(exprs)
+
+
+def infer_type(non_null: int, fits: list[int]) -> str:
+    """Most specific type that every non-null value of a VARCHAR column fits"""
+    if non_null == 0:
+        return "VARCHAR"
+    for (type_name, _), count in zip(TYPE_CHECKS, fits):
+        if count == non_null:
+            return type_name
+    return "VARCHAR"
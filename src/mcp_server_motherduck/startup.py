@@ -0,0 +1,36 @@
+import sys
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+# Interpreter start is not observable, so times are relative to this module's import,
+# which is the first thing `mcp_server_motherduck` does
+_started = time.perf_counter()
+_phases: list[list] = []
+_depth = 0
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    """Record how long a startup step takes, for `--profile-startup`"""
+    global _depth
+    entry = [name, _depth, 0.0]
+    _phases.append(entry)
+    _depth += 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        entry[2] = time.perf_counter() - start
+        _depth -= 1
+
+
+def report() -> str:
+    """Phase timings as an indented table, with the modules loaded so far"""
+    lines = [f"{'phase':<44} {'ms':>9}"]
+    for name, depth, elapsed in _phases:
+        label = "  " * depth + name
+        lines.append(f"{label:<44} {elapsed * 1000:>9.1f}")
+    lines.append(f"{'total since package import':<44} {(time.perf_counter() - _started) * 1000:>9.1f}")
+    lines.append(f"{len(sys.modules)} modules loaded")
+    return "\n".join(lines)
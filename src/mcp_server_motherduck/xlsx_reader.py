@@ -0,0 +1,119 @@
+import re
+import posixpath
+import zipfile
+import xml.etree.ElementTree as ET
+
+# Sheet list and dimensions read straight from the xlsx zip container, without
+# loading the workbook: names come from xl/workbook.xml, sizes from each sheet's
+# <dimension ref="A1:D3001"/> element, which writers place before the cell data.
+
+_REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+_CELL_REF_RE = re.compile(r"\$?([A-Z]+)\$?(\d+)")
+_DIMENSION_RE = re.compile(rb'<(?:\w+:)?dimension\b[^>]*\bref="([^"]+)"')
+_ROW_RE = re.compile(rb'<(?:\w+:)?row\b[^>]*?\br="(\d+)"')
+_CELL_RE = re.compile(rb'<(?:\w+:)?c\b[^>]*?\br="([A-Z]+)\d+"')
+
+_CHUNK_SIZE = 256 * 1024
+
+
+def _local(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+def column_index(letters: str) -> int:
+    """1-based index of a column given by its letters (A -> 1, AA -> 27)"""
+    index = 0
+    for letter in letters:
+        index = index * 26 + ord(letter) - ord("A") + 1
+    return index
+
+
+def parse_dimension(ref: str) -> tuple[int, int] | None:
+    """Rows and columns spanned by a range such as `A1:D3001`"""
+    cells = [_CELL_REF_RE.fullmatch(part) for part in ref.upper().split(":")]
+    if not cells or not all(cells):
+        return None
+    first, last = cells[0], cells[-1]
+    rows = int(last.group(2)) - int(first.group(2)) + 1
+    columns = column_index(last.group(1)) - column_index(first.group(1)) + 1
+    return rows, columns
+
+
+def _sheet_paths(zf: zipfile.ZipFile) -> list[tuple[str, str]]:
+    """(sheet name, zip member) pairs in workbook order"""
+    rels = ET.fromstring(zf.read("xl/_rels/workbook.xml.rels"))
+    targets = {}
+    for rel in rels:
+        target = rel.get("Target", "")
+        if target.startswith("/"):
+            path = target.lstrip("/")
+        else:
+            path = posixpath.normpath(posixpath.join("xl", target))
+        targets[rel.get("Id")] = path
+
+    workbook = ET.fromstring(zf.read("xl/workbook.xml"))
+    sheets = []
+    for element in workbook.iter():
+        if _local(element.tag) == "sheet":
+            rel_id = element.get(f"{{{_REL_NS}}}id")
+            sheets.append((element.get("name"), targets.get(rel_id)))
+    return sheets
+
+
+def _scan_dimension(stream) -> tuple[int, int]:
+    """Rows and columns of a sheet, from its <dimension> or else by streaming its cells"""
+    head = b""
+    while True:
+        chunk = stream.read(_CHUNK_SIZE)
+        head += chunk
+        match = _DIMENSION_RE.search(head)
+        if match:
+            dimension = parse_dimension(match.group(1).decode())
+            if dimension is not None:
+                return dimension
+        if not chunk or b"sheetData" in head:
+            break
+
+    # No usable <dimension>: scan the raw XML for row numbers and cell references
+    max_row = 0
+    max_column = 0
+    buffer = head
+    while True:
+        chunk = stream.read(_CHUNK_SIZE)
+        if chunk:
+            buffer += chunk
+            # Keep the last, possibly incomplete tag for the next round
+            cut = max(buffer.rfind(b"<"), 0)
+            data, buffer = buffer[:cut], buffer[cut:]
+        else:
+            data, buffer = buffer, b""
+        rows = _ROW_RE.findall(data)
+        if rows:
+            max_row = max(max_row, max(map(int, rows)))
+        for letters in set(_CELL_RE.findall(data)):
+            max_column = max(max_column, column_index(letters.decode()))
+        if not chunk:
+            return max_row, max_column
+
+
+def read_sheet_dimensions(path: str) -> list[dict]:
+    """Name, position, row count (header included) and column count of every sheet"""
+    with zipfile.ZipFile(path) as zf:
+        sheets = []
+        for index, (name, member) in enumerate(_sheet_paths(zf)):
+            rows, columns = 0, 0
+            if member is not None and member in zf.namelist():
+                with zf.open(member) as stream:
+                    rows, columns = _scan_dimension(stream)
+            sheets.append({
+                "name": name,
+                "index": index,
+                "rowCount": rows,
+                "columnCount": columns,
+            })
+        return sheets
+
+
+def read_sheet_names(path: str) -> list[str]:
+    with zipfile.ZipFile(path) as zf:
+        return [name for name, _ in _sheet_paths(zf)]